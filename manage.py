@@ -3,11 +3,13 @@
 from flask_migrate import MigrateCommand
 from flask_script import Manager
 
+from opwen_email_client.util.management import BenchmarkSyncCommand
 from opwen_email_client.util.management import DevServerCommand
 from opwen_email_client.webapp import app
 
 manager = Manager(app)
 manager.add_command('db', MigrateCommand)
 manager.add_command('devserver', DevServerCommand)
+manager.add_command('benchmark_sync', BenchmarkSyncCommand)
 
 manager.run()
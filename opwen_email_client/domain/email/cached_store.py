@@ -0,0 +1,185 @@
+from copy import deepcopy
+from threading import Lock
+from typing import Optional
+from typing import Set
+
+from opwen_email_client.domain.email.store import EmailStore
+from opwen_email_client.util.cache import LruCache
+
+_PENDING = ('pending',)
+
+
+class CachedEmailStore(EmailStore):
+    def __init__(self, email_store: EmailStore, cache: LruCache):
+        self._email_store = email_store
+        self._cache = cache
+        self._lock = Lock()
+        self._version = None
+        self._generation = 0
+
+    def _cached(self, key, tags, load):
+        generation = self._check_version()
+
+        value = self._cache.get(key)
+        if value is LruCache.missing:
+            value = load()
+            self._set(key, value, tags, generation)
+
+        return deepcopy(value)
+
+    def _set(self, key, value, tags, generation):
+        with self._lock:
+            if generation == self._generation:
+                self._cache.set(key, value, tags)
+
+    def _check_version(self) -> int:
+        version = self._email_store.version()
+
+        with self._lock:
+            if version != self._version:
+                self._cache.clear()
+                self._version = version
+                self._generation += 1
+            return self._generation
+
+    def _invalidate(self, tags):
+        with self._lock:
+            self._cache.invalidate(tags)
+            self._generation += 1
+
+    def _create(self, emails):
+        self._check_version()
+        emails = list(emails)
+        created = self._email_store.create(emails)
+
+        tags = set(_PENDING)
+        for email in emails:
+            tags.add(email['_uid'])
+            tags.update(_addresses(email))
+        self._invalidate(tags)
+
+        return created
+
+    def _mark_sent(self, uids):
+        self._check_version()
+        uids = list(uids)
+        participants = self._email_store.participants(uids)
+        self._email_store.mark_sent(uids)
+        self._invalidate(participants | set(uids) | set(_PENDING))
+
+    def _mark_read(self, email_address, uids):
+        self._check_version()
+        uids = list(uids)
+        participants = self._email_store.participants(uids)
+        self._email_store.mark_read(email_address, uids)
+        self._invalidate(participants | set(uids))
+
+    def _delete(self, email_address, uids):
+        self._check_version()
+        uids = list(uids)
+        participants = self._email_store.participants(uids)
+        self._email_store.delete(email_address, uids)
+        self._invalidate(participants | set(uids) | set(_PENDING))
+
+    def get(self, uid):
+        generation = self._check_version()
+
+        key = ('get', uid)
+        email = self._cache.get(key)
+        if email is LruCache.missing:
+            email = self._email_store.get(uid)
+            if not _has_attachments(email):
+                self._set(key, email, {uid} | _addresses(email or {}),
+                          generation)
+
+        return deepcopy(email)
+
+    def body(self, email_address, uid):
+        return self._email_store.body(email_address, uid)
+
+    def attachment(self, email_address, uid, attachment_hash):
+        return self._email_store.attachment(email_address, uid,
+                                            attachment_hash)
+
+    def attachment_content(self, attachment_hash, start, stop,
+                           chunk_size=65536):
+        return self._email_store.attachment_content(attachment_hash, start,
+                                                    stop, chunk_size)
+
+    def inbox(self, email_address, page=None, cursor=None):
+        if page is None:
+            return self._email_store.inbox(email_address)
+
+        return self._cached(
+            ('inbox', email_address.lower(), page, cursor),
+            {email_address.lower()},
+            lambda: self._email_store.inbox(email_address, page, cursor))
+
+    def outbox(self, email_address, page=None, cursor=None):
+        if page is None:
+            return self._email_store.outbox(email_address)
+
+        return self._cached(
+            ('outbox', email_address.lower(), page, cursor),
+            {email_address.lower()},
+            lambda: self._email_store.outbox(email_address, page, cursor))
+
+    def sent(self, email_address, page=None, cursor=None):
+        if page is None:
+            return self._email_store.sent(email_address)
+
+        return self._cached(
+            ('sent', email_address.lower(), page, cursor),
+            {email_address.lower()},
+            lambda: self._email_store.sent(email_address, page, cursor))
+
+    def search(self, email_address, query, page=None, cursor=None):
+        return self._email_store.search(email_address, query, page, cursor)
+
+    def pending(self):
+        return self._email_store.pending()
+
+    def count_inbox(self, email_address):
+        return self._cached_count('count_inbox', email_address)
+
+    def count_unread(self, email_address):
+        return self._cached_count('count_unread', email_address)
+
+    def count_outbox(self, email_address):
+        return self._cached_count('count_outbox', email_address)
+
+    def count_sent(self, email_address):
+        return self._cached_count('count_sent', email_address)
+
+    def _cached_count(self, name, email_address):
+        count = getattr(self._email_store, name)
+        return self._cached(
+            (name, email_address.lower()),
+            {email_address.lower()},
+            lambda: count(email_address))
+
+    def count_pending(self):
+        return self._cached(('count_pending',), _PENDING,
+                            self._email_store.count_pending)
+
+    def attachment_bytes(self):
+        return self._email_store.attachment_bytes()
+
+    def participants(self, uids):
+        return self._email_store.participants(uids)
+
+    def version(self):
+        return self._email_store.version()
+
+
+def _has_attachments(email: Optional[dict]) -> bool:
+    return bool(email and email.get('attachments'))
+
+
+def _addresses(email: dict) -> Set[str]:
+    addresses = set()
+    for key in ('to', 'cc', 'bcc'):
+        addresses.update(address.lower() for address in email.get(key) or [])
+    if email.get('from'):
+        addresses.add(email['from'].lower())
+    return addresses
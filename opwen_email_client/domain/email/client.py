@@ -1,10 +1,19 @@
 from abc import ABCMeta
 from abc import abstractmethod
+from collections import defaultdict
+from gzip import compress as gzip_compress
+from json import dumps
+from logging import Logger
+from logging import getLogger
+from threading import Lock
+from time import perf_counter
 from typing import Tuple
 
+from requests import RequestException
 from requests import Response
-from requests import get as http_get
-from requests import post as http_post
+from requests import Session
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 
 
 class EmailServerClient(metaclass=ABCMeta):
@@ -19,11 +28,35 @@ class EmailServerClient(metaclass=ABCMeta):
 
 class HttpEmailServerClient(EmailServerClient):
     _supported_resource_type = 'azure-blob'
+    _retry_statuses = (500, 502, 503, 504)
 
-    def __init__(self, read_api: str, write_api: str, client_id: str):
+    def __init__(self, read_api: str, write_api: str, client_id: str,
+                 session: Session=None, connect_timeout: float=10.0,
+                 read_timeout: float=60.0, retries: int=3,
+                 backoff_factor: float=0.5, compress: bool=False,
+                 log: Logger=None):
         self._read_api = read_api
         self._write_api = write_api
         self._client_id = client_id
+        self._session = session or self._create_session(retries,
+                                                        backoff_factor)
+        self._timeout = (connect_timeout, read_timeout)
+        self._compress = compress
+        self._log = log or getLogger(__name__)
+        self._lock = Lock()
+        self._latencies = defaultdict(_Latency)
+
+    @classmethod
+    def _create_session(cls, retries: int, backoff_factor: float) -> Session:
+        retry = Retry(total=retries, backoff_factor=backoff_factor,
+                      status_forcelist=cls._retry_statuses,
+                      raise_on_status=False)
+        adapter = HTTPAdapter(max_retries=retry)
+
+        session = Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
 
     @property
     def _upload_url(self) -> str:
@@ -44,17 +77,49 @@ class HttpEmailServerClient(EmailServerClient):
             'resource_type': self._supported_resource_type,
         }
 
-        response = http_post(self._upload_url, json=payload)
-        response.raise_for_status()
+        body = dumps(payload).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if self._compress:
+            body = gzip_compress(body)
+            headers['Content-Encoding'] = 'gzip'
+
+        self._request('upload', 'POST', self._upload_url,
+                      data=body, headers=headers)
 
     def download(self):
-        response = http_get(self._download_url)
-        response.raise_for_status()
+        response = self._request('download', 'GET', self._download_url)
 
         resource_id, resource_container = self._validate(response)
 
         return resource_id, resource_container
 
+    def stats(self) -> dict:
+        with self._lock:
+            return {name: latency.as_dict()
+                    for (name, latency) in self._latencies.items()}
+
+    def _request(self, name: str, method: str, url: str,
+                 **kwargs) -> Response:
+
+        start = perf_counter()
+        try:
+            response = self._session.request(method, url,
+                                             timeout=self._timeout, **kwargs)
+            response.raise_for_status()
+        except RequestException:
+            self._record(name, perf_counter() - start, failed=True)
+            raise
+
+        self._record(name, perf_counter() - start)
+        return response
+
+    def _record(self, name: str, elapsed: float, failed: bool=False):
+        with self._lock:
+            self._latencies[name].add(elapsed, failed)
+
+        self._log.info('Email server %s %s in %.0fms', name,
+                       'failed' if failed else 'completed', elapsed * 1000)
+
     def _validate(self, response: Response):
         try:
             payload = response.json()
@@ -70,3 +135,25 @@ class HttpEmailServerClient(EmailServerClient):
                              .format(resource_type))
 
         return resource_id, resource_container
+
+
+class _Latency(object):
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.last_seconds = None
+
+    def add(self, elapsed: float, failed: bool):
+        self.calls += 1
+        self.errors += 1 if failed else 0
+        self.total_seconds += elapsed
+        self.last_seconds = elapsed
+
+    def as_dict(self) -> dict:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'last_seconds': self.last_seconds,
+            'average_seconds': self.total_seconds / self.calls,
+        }
@@ -0,0 +1,144 @@
+from abc import ABCMeta
+from abc import abstractmethod
+from hashlib import sha256
+from io import BytesIO
+from json import dump
+from json import load
+from json import loads
+from logging import Logger
+from logging import getLogger
+from os import makedirs
+from os import rename
+from os.path import isdir
+from os.path import join
+from re import compile as re_compile
+from shutil import rmtree
+from tempfile import mkdtemp
+from typing import Iterable
+from typing import Optional
+from zipfile import ZipFile
+
+
+class LessonStore(metaclass=ABCMeta):
+    extension = '.lesson'
+
+    def extract_all(self, emails: Iterable[dict]) -> Iterable[dict]:
+        for email in emails:
+            for attachment in email.get('attachments') or []:
+                if self.is_lesson(attachment):
+                    self.extract(attachment.get('content'))
+            yield email
+
+    @classmethod
+    def is_lesson(cls, attachment: dict) -> bool:
+        return (attachment.get('filename') or '').endswith(cls.extension)
+
+    @abstractmethod
+    def extract(self, content: bytes) -> Optional[str]:
+        raise NotImplementedError  # pragma: no cover
+
+    @abstractmethod
+    def lookup(self, lesson_id: str) -> Optional[dict]:
+        raise NotImplementedError  # pragma: no cover
+
+    @abstractmethod
+    def slide(self, lesson_id: str, index: int) -> Optional[dict]:
+        raise NotImplementedError  # pragma: no cover
+
+
+class FileSystemLessonStore(LessonStore):
+    _manifest = 'index.json'
+    _lesson_id_re = re_compile(r'^[0-9a-f]{64}$')
+    _mimetypes = (
+        (b'GIF8', 'image/gif'),
+        (b'\x89PNG', 'image/png'),
+        (b'\xff\xd8', 'image/jpeg'),
+    )
+    _default_mimetype = 'image/gif'
+
+    def __init__(self, root: str, log: Logger=None):
+        self._root = root
+        self._log = log or getLogger(__name__)
+
+    def extract(self, content):
+        if not content:
+            return None
+
+        lesson_id = sha256(content).hexdigest()
+        if isdir(self._lesson_path(lesson_id)):
+            return lesson_id
+
+        try:
+            self._unpack(lesson_id, content)
+        except Exception:
+            self._log.exception('Unable to extract lesson %s', lesson_id)
+            return None
+
+        return lesson_id
+
+    def lookup(self, lesson_id):
+        if not self._lesson_id_re.match(lesson_id or ''):
+            return None
+
+        manifest_path = join(self._lesson_path(lesson_id), self._manifest)
+        try:
+            with open(manifest_path) as fobj:
+                return load(fobj)
+        except (OSError, ValueError):
+            return None
+
+    def slide(self, lesson_id, index):
+        lesson = self.lookup(lesson_id)
+        if not lesson:
+            return None
+
+        slides = lesson.get('slides', [])
+        if not 0 <= index < len(slides):
+            return None
+
+        slide = dict(slides[index])
+        slide['path'] = join(self._lesson_path(lesson_id), slide['image'])
+        return slide
+
+    def _lesson_path(self, lesson_id: str) -> str:
+        return join(self._root, lesson_id)
+
+    def _unpack(self, lesson_id: str, content: bytes):
+        makedirs(self._root, exist_ok=True)
+        workspace = mkdtemp(dir=self._root, prefix='.')
+
+        try:
+            with ZipFile(BytesIO(content)) as lesson_zip:
+                manifest = loads(lesson_zip.read(self._manifest)
+                                 .decode('utf-8'))
+
+                slides = []
+                for i, slide in enumerate(manifest['slides']):
+                    image = lesson_zip.read(slide['imageFile'])
+                    image_name = str(i)
+                    with open(join(workspace, image_name), 'wb') as fobj:
+                        fobj.write(image)
+                    slides.append({
+                        'text': slide.get('text', ''),
+                        'image': image_name,
+                        'mimetype': self._mimetype(image),
+                    })
+
+            with open(join(workspace, self._manifest), 'w') as fobj:
+                dump({'id': lesson_id, 'slides': slides}, fobj)
+
+            try:
+                rename(workspace, self._lesson_path(lesson_id))
+            except OSError:
+                if not isdir(self._lesson_path(lesson_id)):
+                    raise
+        finally:
+            if isdir(workspace):
+                rmtree(workspace, ignore_errors=True)
+
+    @classmethod
+    def _mimetype(cls, image: bytes) -> str:
+        for magic, mimetype in cls._mimetypes:
+            if image.startswith(magic):
+                return mimetype
+        return cls._default_mimetype
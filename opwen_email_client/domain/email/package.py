@@ -0,0 +1,189 @@
+from abc import ABCMeta
+from abc import abstractmethod
+from io import BufferedIOBase
+from itertools import islice
+from struct import Struct
+from typing import Iterable
+from typing import TypeVar
+
+from opwen_email_client.domain.email.attachment import AttachmentEncoder
+from opwen_email_client.util.serialization import Serializer
+
+T = TypeVar('T')
+
+
+class PackageFormat(metaclass=ABCMeta):
+    header_size = 0
+    matches_any = False
+
+    @abstractmethod
+    def write(self, stream: BufferedIOBase, item: T):
+        raise NotImplementedError  # pragma: no cover
+
+    @abstractmethod
+    def read(self, stream: BufferedIOBase, offset: int=0) -> Iterable[T]:
+        raise NotImplementedError  # pragma: no cover
+
+    @abstractmethod
+    def matches(self, header: bytes) -> bool:
+        raise NotImplementedError  # pragma: no cover
+
+    def start(self, stream: BufferedIOBase):
+        pass
+
+
+class JsonLinesPackage(PackageFormat):
+    matches_any = True
+
+    def __init__(self, serializer: Serializer,
+                 attachment_encoder: AttachmentEncoder):
+        self._serializer = serializer
+        self._attachment_encoder = attachment_encoder
+
+    def matches(self, header):
+        return True
+
+    def write(self, stream, item):
+        item = _map_attachments(item, self._attachment_encoder.encode)
+        stream.write(self._serializer.serialize(item))
+        stream.write(b'\n')
+
+    def read(self, stream, offset=0):
+        for line in islice(stream, offset, None):
+            item = self._serializer.deserialize(line)
+            yield _map_attachments(item, self._attachment_encoder.decode)
+
+
+class BinaryPackage(PackageFormat):
+    magic = b'OPWN'
+    version = 1
+
+    _header = Struct('>4sB')
+    _record = Struct('>IH')
+    _segment = Struct('>I')
+    header_size = _header.size
+
+    def __init__(self, serializer: Serializer):
+        self._serializer = serializer
+
+    def start(self, stream):
+        stream.write(self._header.pack(self.magic, self.version))
+
+    def matches(self, header):
+        return header[:len(self.magic)] == self.magic
+
+    def write(self, stream, item):
+        segments = []
+        attachments = []
+        for attachment in item.get('attachments') or []:
+            attachment = dict(attachment)
+            content = attachment.pop('content', None)
+            if content is not None:
+                attachment['segment'] = len(segments)
+                segments.append(content)
+            attachments.append(attachment)
+
+        if attachments:
+            item = dict(item, attachments=attachments)
+
+        metadata = self._serializer.serialize(item)
+        stream.write(self._record.pack(len(metadata), len(segments)))
+        stream.write(metadata)
+        for segment in segments:
+            stream.write(self._segment.pack(len(segment)))
+            stream.write(segment)
+
+    def read(self, stream, offset=0):
+        magic, version = self._header.unpack(
+            _read_exactly(stream, self._header.size))
+        if magic != self.magic or version != self.version:
+            raise ValueError('unsupported package version: {}'
+                             .format(version))
+
+        index = 0
+        while True:
+            record = stream.read(self._record.size)
+            if not record:
+                return
+
+            if len(record) < self._record.size:
+                record += _read_exactly(stream,
+                                        self._record.size - len(record))
+            metadata_size, num_segments = self._record.unpack(record)
+
+            if index < offset:
+                _skip(stream, metadata_size)
+                for _ in range(num_segments):
+                    _skip(stream, self._read_segment_size(stream))
+                index += 1
+                continue
+
+            item = self._serializer.deserialize(
+                _read_exactly(stream, metadata_size))
+            segments = [_read_exactly(stream, self._read_segment_size(stream))
+                        for _ in range(num_segments)]
+
+            attachments = item.get('attachments')
+            if attachments:
+                item['attachments'] = [
+                    _attach_segment(attachment, segments)
+                    for attachment in attachments]
+
+            index += 1
+            yield item
+
+    def _read_segment_size(self, stream) -> int:
+        size, = self._segment.unpack(
+            _read_exactly(stream, self._segment.size))
+        return size
+
+
+def read_package(stream: BufferedIOBase, formats: Iterable[PackageFormat],
+                 offset: int=0) -> Iterable[T]:
+    formats = sorted(formats, key=lambda _: _.matches_any)
+    header = stream.read(max(_.header_size for _ in formats))
+    stream.seek(0)
+
+    for package_format in formats:
+        if package_format.matches(header):
+            return package_format.read(stream, offset)
+
+    raise ValueError('unknown package format')
+
+
+def _map_attachments(item: dict, func) -> dict:
+    attachments = item.get('attachments')
+    if not attachments:
+        return item
+
+    item = dict(item)
+    item['attachments'] = [
+        dict(attachment, content=func(attachment['content']))
+        if attachment.get('content') is not None else attachment
+        for attachment in attachments]
+    return item
+
+
+def _attach_segment(attachment: dict, segments: list) -> dict:
+    segment = attachment.pop('segment', None)
+    if segment is not None:
+        attachment['content'] = segments[segment]
+    return attachment
+
+
+def _read_exactly(stream: BufferedIOBase, size: int) -> bytes:
+    data = stream.read(size)
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            raise ValueError('truncated package')
+        data += chunk
+    return data
+
+
+def _skip(stream: BufferedIOBase, size: int):
+    while size > 0:
+        chunk = stream.read(min(size, 65536))
+        if not chunk:
+            raise ValueError('truncated package')
+        size -= len(chunk)
@@ -1,40 +1,70 @@
+from contextlib import contextmanager
 from datetime import datetime
+from hashlib import sha256
+from html import unescape
+from re import UNICODE
+from re import compile as re_compile
+from typing import Optional
+from typing import Set
 
 from sqlalchemy import Boolean
 from sqlalchemy import Column
+from sqlalchemy import Float
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
 from sqlalchemy import Integer
+from sqlalchemy import LargeBinary
 from sqlalchemy import String
 from sqlalchemy import Table
 from sqlalchemy import Text
-from sqlalchemy import exists
+from sqlalchemy import and_
+from sqlalchemy import func
+from sqlalchemy import join
 from sqlalchemy import or_
+from sqlalchemy import select
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import column_property
+from sqlalchemy.orm import deferred
+from sqlalchemy.orm import foreign
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import subqueryload
+from sqlalchemy.orm import undefer
 
+from opwen_email_client.domain.email.attachment import Base64AttachmentEncoder
 from opwen_email_client.domain.email.store import EmailStore
+from opwen_email_client.util.generator import chunks
+from opwen_email_client.util.pagination import Pagination
+from opwen_email_client.util.pagination import decode_cursor
+from opwen_email_client.util.pagination import encode_cursor
+from opwen_email_client.util.sqlalchemy import DataVersion
+from opwen_email_client.util.sqlalchemy import QueryProfiler
+from opwen_email_client.util.sqlalchemy import column_names
 from opwen_email_client.util.sqlalchemy import create_database
-from opwen_email_client.util.sqlalchemy import get_or_create
 from opwen_email_client.util.sqlalchemy import session
+from opwen_email_client.util.sqlalchemy import table_names
 
 _Base = declarative_base()
 
+_AFTER = 'after'
+_BEFORE = 'before'
 
-_EmailTo = Table('emailto',
-                 _Base.metadata,
-                 Column('email_id', Integer, ForeignKey('email.id')),
-                 Column('to_id', Integer, ForeignKey('to.id')))
+_SEARCH_INDEX = 'email_search'
+_SEARCH_INDEX_STATE = 'email_search_state'
+_SEARCH_TOKEN = re_compile(r'\w+', UNICODE)
 
-_EmailCc = Table('emailcc',
-                 _Base.metadata,
-                 Column('email_id', Integer, ForeignKey('email.id')),
-                 Column('cc_id', Integer, ForeignKey('cc.id')))
+_MAX_VARIABLES = 999
 
-_EmailBcc = Table('emailbcc',
-                  _Base.metadata,
-                  Column('email_id', Integer, ForeignKey('email.id')),
-                  Column('bcc_id', Integer, ForeignKey('bcc.id')))
+_SNIPPET_LENGTH = 100
+_SNIPPET_SOURCE_LENGTH = 4 * _SNIPPET_LENGTH
+_HTML_TAG = re_compile(r'<[^>]*>?')
+_WHITESPACE = re_compile(r'\s+', UNICODE)
+
+
+_ROLES = ('to', 'cc', 'bcc')
 
 _EmailAttachment = Table(
     'emailattachment',
@@ -43,25 +73,38 @@ _EmailAttachment = Table(
     Column('attachment_id', Integer, ForeignKey('attachment.id')))
 
 
-class _To(_Base):
-    __tablename__ = 'to'
+class _Address(_Base):
+    __tablename__ = 'address'
     id = Column(Integer, primary_key=True)
 
     address = Column(String(length=128), index=True, unique=True)
 
 
-class _Cc(_Base):
-    __tablename__ = 'cc'
+class _Recipient(_Base):
+    __tablename__ = 'recipient'
+    __table_args__ = (
+        Index('ix_recipient_address_id_email_id', 'address_id', 'email_id'),
+    )
     id = Column(Integer, primary_key=True)
 
-    address = Column(String(length=128), index=True, unique=True)
+    email_id = Column(Integer, ForeignKey('email.id'), index=True,
+                      nullable=False)
+    address_id = Column(Integer, ForeignKey('address.id'), nullable=False)
+    role = Column(String(length=8), nullable=False)
+    address = relationship(_Address, lazy='joined', innerjoin=True)
 
 
-class _Bcc(_Base):
-    __tablename__ = 'bcc'
-    id = Column(Integer, primary_key=True)
+class _AttachmentContent(_Base):
+    __tablename__ = 'attachmentcontent'
 
-    address = Column(String(length=128), index=True, unique=True)
+    hash = Column(String(length=64), primary_key=True)
+    content = Column(LargeBinary)
+
+    @classmethod
+    def to_row(cls, attachment):
+        content = attachment.get('content') or b''
+        return {'hash': sha256(content).hexdigest(),
+                'content': content}
 
 
 class _Attachment(_Base):
@@ -69,24 +112,42 @@ class _Attachment(_Base):
     id = Column(Integer, primary_key=True)
 
     filename = Column(Text)
-    content = Column(Text)
+    hash = Column(String(length=64), index=True)
+    stored = relationship(
+        _AttachmentContent,
+        primaryjoin=foreign(hash) == _AttachmentContent.hash,
+        viewonly=True)
+
+    @property
+    def content(self):
+        return self.stored.content if self.stored else b''
+
+    @classmethod
+    def to_row(cls, attachment, content_row):
+        return {'filename': attachment.get('filename'),
+                'hash': content_row['hash']}
 
 
 class _Email(_Base):
     __tablename__ = 'email'
+    __table_args__ = (Index('ix_email_sent_at_id', 'sent_at', 'id'),)
     id = Column(Integer, primary_key=True)
 
     uid = Column(String(length=64), unique=True, index=True)
     subject = Column(Text)
-    body = Column(Text)
+    body = deferred(Column(Text))
     sent_at = Column(String(length=64))
     read = Column(Boolean, default=False, nullable=False)
     sender = Column(String(length=128), index=True)
     attachments = relationship(_Attachment, secondary=_EmailAttachment,
                                backref='emails')
-    to = relationship(_To, secondary=_EmailTo)
-    cc = relationship(_Cc, secondary=_EmailCc)
-    bcc = relationship(_Bcc, secondary=_EmailBcc)
+    recipients = relationship(_Recipient, order_by=_Recipient.id,
+                              cascade='all, delete-orphan')
+
+    def addresses(self, role=None):
+        return [recipient.address.address
+                for recipient in self.recipients
+                if role is None or recipient.role == role]
 
     def to_dict(self):
         attachments = self.attachments
@@ -97,9 +158,9 @@ class _Email(_Base):
 
         return {k: v for (k, v) in (
             ('from', self.sender),
-            ('to', [_.address for _ in self.to]),
-            ('cc', [_.address for _ in self.cc]),
-            ('bcc', [_.address for _ in self.bcc]),
+            ('to', self.addresses('to')),
+            ('cc', self.addresses('cc')),
+            ('bcc', self.addresses('bcc')),
             ('subject', self.subject),
             ('body', self.body),
             ('_uid', self.uid),
@@ -108,23 +169,33 @@ class _Email(_Base):
             ('attachments', attachments),
         ) if v}
 
+    def to_summary_dict(self):
+        attachments = self.attachments
+        attachments = ([{'filename': attachment.filename,
+                         'hash': attachment.hash}
+                        for attachment in attachments]
+                       if attachments else None)
+
+        return {k: v for (k, v) in (
+            ('from', self.sender),
+            ('to', self.addresses('to')),
+            ('subject', self.subject),
+            ('snippet', _snippet(self.snippet)),
+            ('_uid', self.uid),
+            ('sent_at', self.sent_at),
+            ('read', self.read),
+            ('has_attachments', bool(attachments)),
+            ('attachments', attachments),
+        ) if v}
+
     @classmethod
-    def from_dict(cls, db, email):
-        return _Email(
-            uid=email['_uid'],
-            to=[get_or_create(db, _To, address=_.lower())
-                for _ in email.get('to', [])],
-            cc=[get_or_create(db, _Cc, address=_.lower())
-                for _ in email.get('cc', [])],
-            bcc=[get_or_create(db, _Bcc, address=_.lower())
-                 for _ in email.get('bcc', [])],
-            attachments=[get_or_create(db, _Attachment, **_)
-                         for _ in email.get('attachments', [])],
-            subject=email.get('subject'),
-            body=email.get('body'),
-            sent_at=email.get('sent_at'),
-            read=email.get('read', False),
-            sender=email.get('from', '').lower() or None)
+    def to_row(cls, email):
+        return {'uid': email['_uid'],
+                'subject': email.get('subject'),
+                'body': email.get('body'),
+                'sent_at': email.get('sent_at'),
+                'read': email.get('read', False),
+                'sender': (email.get('from') or '').lower() or None}
 
     @classmethod
     def is_sent_by(cls, email_address):
@@ -134,55 +205,231 @@ class _Email(_Base):
     @classmethod
     def is_received_by(cls, email_address):
         email_address = email_address.lower()
-        return (cls.to.any(_To.address == email_address) |
-                cls.cc.any(_Cc.address == email_address) |
-                cls.bcc.any(_Bcc.address == email_address))
+        return cls.id.in_(_recipient_email_ids(
+            _Address.address == email_address))
+
+    @classmethod
+    def is_older_than(cls, sent_at, id_):
+        if sent_at is None:
+            return cls.sent_at.is_(None) & (cls.id < id_)
+
+        return or_(cls.sent_at < sent_at,
+                   and_(cls.sent_at == sent_at, cls.id < id_),
+                   cls.sent_at.is_(None))
+
+    @classmethod
+    def is_newer_than(cls, sent_at, id_):
+        if sent_at is None:
+            return or_(cls.sent_at.isnot(None),
+                       and_(cls.sent_at.is_(None), cls.id > id_))
+
+        return or_(cls.sent_at > sent_at,
+                   and_(cls.sent_at == sent_at, cls.id > id_))
+
+
+_Email.snippet = column_property(
+    func.substr(_Email.body, 1, _SNIPPET_SOURCE_LENGTH))
+
+
+class _Generation(_Base):
+    __tablename__ = 'generation'
+    id = Column(Integer, primary_key=True)
+
+    value = Column(Integer, nullable=False)
 
 
 class _SqlalchemyEmailStore(EmailStore):
-    def __init__(self, database_uri: str):
+    def __init__(self, database_uri: str, page_size: int=30,
+                 batch_size: int=200, pragmas: Optional[dict]=None,
+                 profiler: Optional[QueryProfiler]=None):
+        self._page_size = page_size
+        self._batch_size = batch_size
         self._base = _Base
-        self._engine = create_database(database_uri, self._base)
+        self._engine = create_database(database_uri, self._base,
+                                       migrations=[_hash_attachments,
+                                                   _unify_recipients,
+                                                   _address_attachments],
+                                       pragmas=pragmas,
+                                       profiler=profiler)
         self._sesion_maker = sessionmaker(autocommit=False, autoflush=False,
                                           bind=self._engine)
+        self._data_version = DataVersion()
+        self._search_index_complete = False
+        self._has_search_index = self._create_search_index()
+
+    def _create_search_index(self) -> bool:
+        create_index = text(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5('
+            'subject, body, sender, recipients, '
+            'tokenize="unicode61", prefix="2 3")'.format(_SEARCH_INDEX))
+
+        with self._engine.connect() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS {} (complete BOOLEAN NOT NULL)'
+                .format(_SEARCH_INDEX_STATE))
+
+            if not _has_table(connection, _SEARCH_INDEX):
+                try:
+                    connection.execute(create_index)
+                    connection.execute(
+                        'DELETE FROM {} WHERE NOT EXISTS '
+                        '(SELECT rowid FROM {} LIMIT 1)'
+                        .format(_SEARCH_INDEX_STATE, _SEARCH_INDEX))
+                except OperationalError:
+                    pass
+
+            if not _has_table(connection, _SEARCH_INDEX):
+                return False
+
+        if not self._is_search_index_complete():
+            try:
+                self._backfill_search_index()
+            except SQLAlchemyError:
+                pass
+
+        return True
+
+    def _use_search_index(self) -> bool:
+        if not self._has_search_index:
+            return False
+
+        if not self._search_index_complete:
+            self._search_index_complete = self._is_search_index_complete()
+
+        return self._search_index_complete
+
+    def _is_search_index_complete(self) -> bool:
+        with self._dbread() as db:
+            complete = db.execute('SELECT complete FROM {} LIMIT 1'
+                                  .format(_SEARCH_INDEX_STATE)).scalar()
+            return bool(complete)
+
+    def _backfill_search_index(self):
+        with self._dbwrite() as db:
+            db.execute('DELETE FROM {}'.format(_SEARCH_INDEX))
+            emails = db.query(_Email).options(undefer(_Email.body))
+            for email in emails.yield_per(500):
+                _index_email(db, email)
+            db.execute('INSERT INTO {} (complete) VALUES (1)'
+                       .format(_SEARCH_INDEX_STATE))
 
     def _dbread(self):
         return session(self._sesion_maker, commit=False)
 
+    @contextmanager
     def _dbwrite(self):
-        return session(self._sesion_maker, commit=True)
+        with session(self._sesion_maker, commit=True) as db:
+            yield db
+            generation = _next_generation(db)
+
+        self._data_version.committed(generation)
 
     def _create(self, emails):
+        created = 0
+
         with self._dbwrite() as db:
-            for email in emails:
-                uid_exists = exists().where(_Email.uid == email['_uid'])
-                if not db.query(uid_exists).scalar():
-                    db.add(_Email.from_dict(db, email))
+            for batch in chunks(emails, self._batch_size):
+                created += self._create_batch(db, batch)
+
+        return created
+
+    def _create_batch(self, db, emails) -> int:
+        uids = {email['_uid'] for email in emails}
+        seen = {uid for uid, in db.query(_Email.uid)
+                .filter(_Email.uid.in_(uids))}
+
+        new_emails = []
+        for email in emails:
+            if email['_uid'] not in seen:
+                seen.add(email['_uid'])
+                new_emails.append(email)
+
+        if not new_emails:
+            return 0
+
+        rows = [_Email.to_row(email) for email in new_emails]
+        db.execute(_Email.__table__.insert(), rows)
+        new_uids = [row['uid'] for row in rows]
+        email_ids = dict(db.query(_Email.uid, _Email.id)
+                         .filter(_Email.uid.in_(new_uids)))
+
+        recipients = [(email_ids[email['_uid']], role, address.lower())
+                      for email in new_emails
+                      for role in _ROLES
+                      for address in email.get(role) or []]
+        address_ids = _insert_addresses(db, {
+            address for (email_id, role, address) in recipients})
+        _insert_recipients(db, [
+            (email_id, role, address_ids[address])
+            for (email_id, role, address) in recipients])
+
+        attachments = []
+        contents = {}
+        for email in new_emails:
+            for attachment in email.get('attachments') or []:
+                content_row = _AttachmentContent.to_row(attachment)
+                contents.setdefault(content_row['hash'], content_row)
+                attachments.append((email_ids[email['_uid']],
+                                    _Attachment.to_row(attachment,
+                                                       content_row)))
+        _insert_attachment_contents(db, list(contents.values()))
+        attachment_ids = _insert_attachments(db, [
+            row for (email_id, row) in attachments])
+        _insert_associations(db, _EmailAttachment, [
+            (email_id, attachment_ids[row['filename'], row['hash']])
+            for (email_id, row) in attachments])
+
+        if self._has_search_index:
+            db.execute(text(
+                'INSERT INTO {} (rowid, subject, body, sender, recipients) '
+                'VALUES (:id, :subject, :body, :sender, :recipients)'
+                .format(_SEARCH_INDEX)), [{
+                    'id': email_ids[row['uid']],
+                    'subject': row['subject'],
+                    'body': row['body'],
+                    'sender': row['sender'],
+                    'recipients': ' '.join(
+                        address.lower()
+                        for role in _ROLES
+                        for address in email.get(role) or [])}
+                    for (email, row) in zip(new_emails, rows)])
+
+        return len(new_emails)
 
     def _mark_sent(self, uids):
         now = datetime.utcnow().strftime('%Y-%m-%d %H:%M')
         set_sent_at = {_Email.sent_at: now}
 
         with self._dbwrite() as db:
-            db.query(_Email)\
-                .filter(_match_email_uid(uids))\
-                .update(set_sent_at)
+            for batch in chunks(uids, self._batch_size):
+                db.query(_Email)\
+                    .filter(_match_email_uid(batch))\
+                    .update(set_sent_at, synchronize_session=False)
 
     def _mark_read(self, email_address, uids):
         set_read = {_Email.read: True}
 
         with self._dbwrite() as db:
-            db.query(_Email)\
-                .filter(_match_email_uid(uids) & _can_access(email_address))\
-                .update(set_read, synchronize_session='fetch')
+            for batch in chunks(uids, self._batch_size):
+                db.query(_Email)\
+                    .filter(_match_email_uid(batch)
+                            & _can_access(email_address))\
+                    .update(set_read, synchronize_session=False)
 
     def _delete(self, email_address, uids):
-        should_delete = _match_email_uid(uids) & _can_access(email_address)
-
         with self._dbwrite() as db:
-            for email in db.query(_Email).filter(should_delete).all():
-                email.attachments = []
-                db.delete(email)
+            for batch in chunks(uids, self._batch_size):
+                should_delete = (_match_email_uid(batch)
+                                 & _can_access(email_address))
+                emails = db.query(_Email)\
+                    .filter(should_delete)\
+                    .options(*_email_headers())
+                for email in emails.all():
+                    if self._has_search_index:
+                        _unindex_email(db, email)
+                    email.attachments = []
+                    db.delete(email)
+                db.flush()
 
         self._delete_orphaned_attachments()
 
@@ -191,50 +438,320 @@ class _SqlalchemyEmailStore(EmailStore):
             db.query(_Attachment)\
                 .filter(~_Attachment.emails.any())\
                 .delete(synchronize_session='fetch')
+            db.query(_AttachmentContent)\
+                .filter(~_AttachmentContent.hash.in_(
+                    select([_Attachment.hash]).distinct()))\
+                .delete(synchronize_session=False)
 
     def _find(self, query):
         with self._dbread() as db:
-            results = db.query(_Email).filter(query)
+            results = db.query(_Email).filter(query).options(*_full_email())
             email = results.first()
             return email.to_dict() if email else None
 
-    def _query(self, query):
+    def _query(self, query, page=None, cursor=None):
+        if page is None:
+            return self._query_all(query)
+
+        return self._query_page(query, page, cursor)
+
+    def _query_all(self, query):
         with self._dbread() as db:
-            results = db.query(_Email).filter(query)
+            results = db.query(_Email).filter(query).options(*_full_email())
+            results = results.order_by(*_newest_first())
             for email in results.all():
                 yield email.to_dict()
 
-    def inbox(self, email_address):
-        return self._query(_Email.is_received_by(email_address))
+    def _query_page(self, query, page, cursor):
+        if page < 1:
+            raise ValueError('page must be greater than or equal to 1')
+
+        direction, position = _parse_cursor(cursor)
 
-    def outbox(self, email_address):
+        with self._dbread() as db:
+            results = db.query(_Email).filter(query)
+            results = results.options(*_email_headers())
+            if direction == _AFTER:
+                results = results.filter(_Email.is_older_than(*position))
+                results = results.order_by(*_newest_first())
+            elif direction == _BEFORE:
+                results = results.filter(_Email.is_newer_than(*position))
+                results = results.order_by(*_oldest_first())
+            else:
+                results = results.order_by(*_newest_first())
+                results = results.offset((page - 1) * self._page_size)
+
+            emails = results.limit(self._page_size).all()
+            if direction == _BEFORE:
+                emails.reverse()
+
+            return Pagination(
+                items=[email.to_summary_dict() for email in emails],
+                page=page,
+                page_size=self._page_size,
+                sliced=True,
+                prev_cursor=_cursor(_BEFORE, emails[0]) if emails else None,
+                next_cursor=_cursor(_AFTER, emails[-1]) if emails else None)
+
+    def inbox(self, email_address, page=None, cursor=None):
+        return self._query(_Email.is_received_by(email_address),
+                           page, cursor)
+
+    def outbox(self, email_address, page=None, cursor=None):
         return self._query(_Email.is_sent_by(email_address)
-                           & _Email.sent_at.is_(None))
+                           & _Email.sent_at.is_(None), page, cursor)
+
+    def _query_ranked(self, query, match, page=None):
+        ranked = text(
+            'SELECT rowid AS id, bm25({0}, 4.0, 1.0, 2.0, 2.0) AS rank '
+            'FROM {0} WHERE {0} MATCH :match'.format(_SEARCH_INDEX))
+        ranked = ranked.bindparams(match=match)
+        ranked = ranked.columns(id=Integer, rank=Float).alias('ranked')
+
+        with self._dbread() as db:
+            results = db.query(_Email)\
+                .join(ranked, ranked.c.id == _Email.id)\
+                .filter(query)\
+                .order_by(ranked.c.rank, *_newest_first())
+
+            if page is None:
+                results = results.options(*_full_email())
+                return [email.to_dict() for email in results.all()]
+
+            if page < 1:
+                raise ValueError('page must be greater than or equal to 1')
+
+            results = results.options(*_email_headers())
+            results = results.offset((page - 1) * self._page_size)
+            results = results.limit(self._page_size)
+            emails = [email.to_summary_dict() for email in results.all()]
+
+        return Pagination(emails, page, self._page_size, sliced=True)
+
+    def search(self, email_address, query, page=None, cursor=None):
+        if self._use_search_index():
+            match = _search_match(query)
+            if not match and page is None:
+                return []
+            if not match:
+                return Pagination([], page, self._page_size, sliced=True)
+            return self._query_ranked(_can_access(email_address), match, page)
 
-    def search(self, email_address, query):
         textquery = '%{}%'.format(query)
         contains_query = or_(*(_Email.subject.ilike(textquery),
                                _Email.body.ilike(textquery),
                                _Email.sender.ilike(textquery),
-                               _Email.to.any(_To.address.ilike(textquery)),
-                               _Email.cc.any(_Cc.address.ilike(textquery)),
-                               _Email.bcc.any(_Bcc.address.ilike(textquery))))
-        return self._query(_can_access(email_address) & contains_query)
+                               _Email.id.in_(_recipient_email_ids(
+                                   _Address.address.ilike(textquery)))))
+        return self._query(_can_access(email_address) & contains_query,
+                           page, cursor)
 
     def pending(self):
         return self._query(_Email.sent_at.is_(None))
 
+    def _count(self, query):
+        with self._dbread() as db:
+            return db.query(func.count(_Email.id)).filter(query).scalar()
+
+    def count_inbox(self, email_address):
+        return self._count(_Email.is_received_by(email_address))
+
+    def count_unread(self, email_address):
+        return self._count(_Email.is_received_by(email_address)
+                           & _Email.read.is_(False))
+
+    def count_outbox(self, email_address):
+        return self._count(_Email.is_sent_by(email_address)
+                           & _Email.sent_at.is_(None))
+
+    def count_sent(self, email_address):
+        return self._count(_Email.is_sent_by(email_address)
+                           & _Email.sent_at.isnot(None))
+
+    def count_pending(self):
+        return self._count(_Email.sent_at.is_(None))
+
+    def attachment_bytes(self):
+        with self._dbread() as db:
+            total = db.query(func.sum(func.length(
+                _AttachmentContent.content)))
+            return total.scalar() or 0
+
+    def participants(self, uids) -> Set[str]:
+        participants = set()
+
+        with self._dbread() as db:
+            for batch in chunks(uids, self._batch_size):
+                senders = db.query(_Email.sender)\
+                    .filter(_match_email_uid(batch))\
+                    .filter(_Email.sender.isnot(None))
+                recipients = db.query(_Address.address)\
+                    .join(_Recipient, _Recipient.address_id == _Address.id)\
+                    .join(_Email, _Email.id == _Recipient.email_id)\
+                    .filter(_match_email_uid(batch))
+                participants.update(address for address, in senders)
+                participants.update(address for address, in recipients)
+
+        return participants
+
+    def version(self):
+        generation = None
+
+        with self._dbread() as db:
+            generation = db.query(_Generation.value)\
+                .filter(_Generation.id == 1)\
+                .scalar() or 0
+
+        return self._data_version(generation)
+
     def get(self, uid):
         return self._find(_Email.uid == uid)
 
-    def sent(self, email_address):
+    def attachment(self, email_address, uid, attachment_hash):
+        with self._dbread() as db:
+            attachment = db.query(_Attachment.filename,
+                                  _Attachment.hash,
+                                  func.length(_AttachmentContent.content),
+                                  _Email.sent_at)\
+                .select_from(_Email)\
+                .join(_Email.attachments)\
+                .outerjoin(_AttachmentContent,
+                           _AttachmentContent.hash == _Attachment.hash)\
+                .filter((_Email.uid == uid)
+                        & (_Attachment.hash == attachment_hash)
+                        & _can_access(email_address))\
+                .first()
+
+            if not attachment:
+                return None
+
+            filename, hash_, size, sent_at = attachment
+            return {'filename': filename, 'hash': hash_,
+                    'size': size or 0, 'sent_at': sent_at}
+
+    def attachment_content(self, attachment_hash, start, stop,
+                           chunk_size=65536):
+        if stop <= start:
+            return
+
+        with self._dbread() as db:
+            content = db.query(func.substr(_AttachmentContent.content,
+                                           start + 1, stop - start))\
+                .filter(_AttachmentContent.hash == attachment_hash)\
+                .scalar()
+
+        if not content:
+            return
+
+        content = memoryview(content)
+        for offset in range(0, len(content), chunk_size):
+            yield bytes(content[offset:offset + chunk_size])
+
+    def body(self, email_address, uid):
+        with self._dbread() as db:
+            body = db.query(_Email.body)\
+                .filter((_Email.uid == uid) & _can_access(email_address))\
+                .first()
+            return (body[0] or '') if body else None
+
+    def sent(self, email_address, page=None, cursor=None):
         return self._query(_Email.is_sent_by(email_address)
-                           & _Email.sent_at.isnot(None))
+                           & _Email.sent_at.isnot(None), page, cursor)
 
 
 class SqliteEmailStore(_SqlalchemyEmailStore):
-    def __init__(self, database_path: str):
-        super().__init__('sqlite:///{}'.format(database_path))
+    def __init__(self, database_path: str, page_size: int=30,
+                 batch_size: int=200, pragmas: Optional[dict]=None,
+                 profiler: Optional[QueryProfiler]=None):
+        super().__init__('sqlite:///{}'.format(database_path), page_size,
+                         batch_size, pragmas, profiler)
+
+
+def _recipient_email_ids(address_filter):
+    return select([_Recipient.email_id])\
+        .select_from(join(_Recipient, _Address,
+                          _Recipient.address_id == _Address.id))\
+        .where(address_filter)
+
+
+def _insert_addresses(db, addresses):
+    if not addresses:
+        return {}
+
+    db.execute(_Address.__table__.insert().prefix_with('OR IGNORE'),
+               [{'address': address} for address in addresses])
+
+    return {address: id_
+            for batch in chunks(addresses, _MAX_VARIABLES)
+            for (address, id_) in db.query(_Address.address, _Address.id)
+            .filter(_Address.address.in_(batch))}
+
+
+def _insert_recipients(db, recipients):
+    seen = set()
+    rows = []
+    for recipient in recipients:
+        if recipient not in seen:
+            seen.add(recipient)
+            email_id, role, address_id = recipient
+            rows.append({'email_id': email_id, 'role': role,
+                         'address_id': address_id})
+
+    if rows:
+        db.execute(_Recipient.__table__.insert(), rows)
+
+
+def _insert_attachments(db, rows):
+    if not rows:
+        return {}
+
+    hashes = {row['hash'] for row in rows}
+    attachment_ids = _attachment_ids(db, hashes)
+
+    missing = {}
+    for row in rows:
+        key = row['filename'], row['hash']
+        if key not in attachment_ids:
+            missing.setdefault(key, row)
+
+    if missing:
+        db.execute(_Attachment.__table__.insert(), list(missing.values()))
+        attachment_ids = _attachment_ids(db, hashes)
+
+    return attachment_ids
+
+
+def _insert_attachment_contents(db, rows):
+    if not rows:
+        return
+
+    db.execute(_AttachmentContent.__table__.insert().prefix_with('OR IGNORE'),
+               rows)
+
+
+def _attachment_ids(db, hashes):
+    attachment_ids = {}
+    for batch in chunks(hashes, _MAX_VARIABLES):
+        attachments = db.query(_Attachment.filename,
+                               _Attachment.hash,
+                               _Attachment.id)\
+            .filter(_Attachment.hash.in_(batch))
+
+        attachment_ids.update(
+            ((filename, hash_), id_)
+            for (filename, hash_, id_) in attachments)
+
+    return attachment_ids
+
+
+def _insert_associations(db, association, pairs):
+    if not pairs:
+        return
+
+    email_column, other_column = association.columns.keys()
+    db.execute(association.insert(), [
+        {email_column: email_id, other_column: other_id}
+        for (email_id, other_id) in pairs])
 
 
 def _can_access(email_address):
@@ -242,5 +759,179 @@ def _can_access(email_address):
             | _Email.is_received_by(email_address))
 
 
+def _hash_attachments(engine):
+    if 'hash' in column_names(engine, _Attachment.__tablename__):
+        return
+
+    legacy_encoder = Base64AttachmentEncoder()
+
+    with engine.begin() as connection:
+        connection.execute(text(
+            'ALTER TABLE attachment ADD COLUMN hash VARCHAR(64)'))
+
+        ids = connection.execute(text('SELECT id FROM attachment'))
+        for attachment_id in [row[0] for row in ids]:
+            content = connection.execute(
+                text('SELECT content FROM attachment WHERE id = :id'),
+                id=attachment_id).scalar()
+
+            if isinstance(content, str):
+                try:
+                    content = legacy_encoder.decode(content)
+                except ValueError:
+                    content = content.encode('utf-8')
+
+            content = content or b''
+            connection.execute(
+                text('UPDATE attachment SET content = :content, hash = :hash '
+                     'WHERE id = :id'),
+                content=content,
+                hash=sha256(content).hexdigest(),
+                id=attachment_id)
+
+
+def _address_attachments(engine):
+    if 'content' not in column_names(engine, _Attachment.__tablename__):
+        return
+
+    with engine.begin() as connection:
+        pending = connection.execute(text(
+            'SELECT id FROM attachment WHERE content IS NOT NULL LIMIT 1'))
+        if pending.first() is None:
+            return
+
+        connection.execute(text(
+            'INSERT OR IGNORE INTO attachmentcontent (hash, content) '
+            'SELECT hash, content FROM attachment '
+            'WHERE content IS NOT NULL'))
+        connection.execute(text(
+            'UPDATE attachment SET content = NULL '
+            'WHERE content IS NOT NULL'))
+
+
+def _unify_recipients(engine):
+    existing = table_names(engine)
+    legacy = [(role, 'email{}'.format(role)) for role in _ROLES
+              if role in existing and 'email{}'.format(role) in existing]
+    if not legacy:
+        return
+
+    with engine.begin() as connection:
+        for role, association in legacy:
+            connection.execute(text(
+                'INSERT OR IGNORE INTO address (address) '
+                'SELECT address FROM "{role}" WHERE address IS NOT NULL'
+                .format(role=role)))
+            connection.execute(text(
+                'INSERT INTO recipient (email_id, address_id, role) '
+                'SELECT link.email_id, address.id, :role '
+                'FROM {association} AS link '
+                'JOIN "{role}" AS legacy ON legacy.id = link.{role}_id '
+                'JOIN address ON address.address = legacy.address '
+                'WHERE link.email_id IS NOT NULL '
+                'ORDER BY link.rowid'
+                .format(association=association, role=role)),
+                role=role)
+
+        for role, association in legacy:
+            connection.execute(text('DROP TABLE {}'.format(association)))
+            connection.execute(text('DROP TABLE "{}"'.format(role)))
+
+
+def _next_generation(db):
+    updated = db.query(_Generation)\
+        .filter(_Generation.id == 1)\
+        .update({_Generation.value: _Generation.value + 1},
+                synchronize_session=False)
+    if not updated:
+        db.execute(_Generation.__table__.insert(), {'id': 1, 'value': 1})
+
+    return db.query(_Generation.value).filter(_Generation.id == 1).scalar()
+
+
+def _has_table(connection, name):
+    tables = connection.execute(
+        text("SELECT name FROM sqlite_master WHERE name = :name"),
+        name=name)
+    return tables.first() is not None
+
+
+def _index_email(db, email):
+    recipients = email.addresses()
+    db.execute(
+        text('INSERT INTO {} (rowid, subject, body, sender, recipients) '
+             'VALUES (:id, :subject, :body, :sender, :recipients)'
+             .format(_SEARCH_INDEX)),
+        {'id': email.id,
+         'subject': email.subject,
+         'body': email.body,
+         'sender': email.sender,
+         'recipients': ' '.join(recipients)})
+
+
+def _unindex_email(db, email):
+    db.execute(
+        text('DELETE FROM {} WHERE rowid = :id'.format(_SEARCH_INDEX)),
+        {'id': email.id})
+
+
+def _search_match(query):
+    tokens = _SEARCH_TOKEN.findall(query or '')
+    return ' '.join('"{}"*'.format(token) for token in tokens)
+
+
+def _email_headers():
+    return (subqueryload(_Email.recipients),
+            subqueryload(_Email.attachments))
+
+
+def _full_email():
+    return (undefer(_Email.body),
+            subqueryload(_Email.recipients),
+            subqueryload(_Email.attachments).joinedload(_Attachment.stored))
+
+
+def _snippet(body):
+    if not body:
+        return None
+
+    text = unescape(_HTML_TAG.sub(' ', body))
+    text = _WHITESPACE.sub(' ', text).strip()
+    if len(text) > _SNIPPET_LENGTH:
+        text = text[:_SNIPPET_LENGTH].rstrip() + '...'
+    return text
+
+
+def _newest_first():
+    return _Email.sent_at.desc(), _Email.id.desc()
+
+
+def _oldest_first():
+    return _Email.sent_at.asc(), _Email.id.asc()
+
+
+def _cursor(direction, email):
+    return encode_cursor(direction, email.sent_at, email.id)
+
+
+def _parse_cursor(cursor):
+    values = decode_cursor(cursor)
+    try:
+        direction, sent_at, id_ = values
+    except (TypeError, ValueError):
+        return None, None
+
+    if direction not in (_AFTER, _BEFORE):
+        return None, None
+
+    if not isinstance(id_, int) or isinstance(id_, bool):
+        return None, None
+
+    if sent_at is not None and not isinstance(sent_at, str):
+        return None, None
+
+    return direction, (sent_at, id_)
+
+
 def _match_email_uid(uids):
-    return or_(*(_Email.uid == uid for uid in uids))
+    return _Email.uid.in_(uids)
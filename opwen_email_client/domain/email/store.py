@@ -2,16 +2,17 @@ from abc import ABCMeta
 from abc import abstractmethod
 from typing import Iterable
 from typing import Optional
+from typing import Set
 from typing import Union
 from uuid import uuid4
 
 
 class EmailStore(metaclass=ABCMeta):
-    def create(self, emails: Iterable[dict]):
-        self._create(map(_add_uid, emails))
+    def create(self, emails: Iterable[dict]) -> int:
+        return self._create(map(_add_uid, emails))
 
     @abstractmethod
-    def _create(self, emails: Iterable[dict]):
+    def _create(self, emails: Iterable[dict]) -> int:
         raise NotImplementedError  # pragma: no cover
 
     @abstractmethod
@@ -19,26 +20,78 @@ class EmailStore(metaclass=ABCMeta):
         raise NotImplementedError  # pragma: no cover
 
     @abstractmethod
-    def inbox(self, email_address: str) -> Iterable[dict]:
+    def body(self, email_address: str, uid: str) -> Optional[str]:
         raise NotImplementedError  # pragma: no cover
 
     @abstractmethod
-    def outbox(self, email_address: str) -> Iterable[dict]:
+    def attachment(self, email_address: str, uid: str,
+                   attachment_hash: str) -> Optional[dict]:
         raise NotImplementedError  # pragma: no cover
 
     @abstractmethod
-    def sent(self, email_address: str) -> Iterable[dict]:
+    def attachment_content(self, attachment_hash: str, start: int, stop: int,
+                           chunk_size: int=65536) -> Iterable[bytes]:
         raise NotImplementedError  # pragma: no cover
 
     @abstractmethod
-    def search(self, email_address: str,
-               query: Optional[str]) -> Iterable[dict]:
+    def inbox(self, email_address: str,
+              page: Optional[int]=None,
+              cursor: Optional[str]=None) -> Iterable[dict]:
+        raise NotImplementedError  # pragma: no cover
+
+    @abstractmethod
+    def outbox(self, email_address: str,
+               page: Optional[int]=None,
+               cursor: Optional[str]=None) -> Iterable[dict]:
+        raise NotImplementedError  # pragma: no cover
+
+    @abstractmethod
+    def sent(self, email_address: str,
+             page: Optional[int]=None,
+             cursor: Optional[str]=None) -> Iterable[dict]:
+        raise NotImplementedError  # pragma: no cover
+
+    @abstractmethod
+    def search(self, email_address: str, query: Optional[str],
+               page: Optional[int]=None,
+               cursor: Optional[str]=None) -> Iterable[dict]:
         raise NotImplementedError  # pragma: no cover
 
     @abstractmethod
     def pending(self) -> Iterable[dict]:
         raise NotImplementedError  # pragma: no cover
 
+    @abstractmethod
+    def count_inbox(self, email_address: str) -> int:
+        raise NotImplementedError  # pragma: no cover
+
+    @abstractmethod
+    def count_unread(self, email_address: str) -> int:
+        raise NotImplementedError  # pragma: no cover
+
+    @abstractmethod
+    def count_outbox(self, email_address: str) -> int:
+        raise NotImplementedError  # pragma: no cover
+
+    @abstractmethod
+    def count_sent(self, email_address: str) -> int:
+        raise NotImplementedError  # pragma: no cover
+
+    @abstractmethod
+    def count_pending(self) -> int:
+        raise NotImplementedError  # pragma: no cover
+
+    @abstractmethod
+    def attachment_bytes(self) -> int:
+        raise NotImplementedError  # pragma: no cover
+
+    @abstractmethod
+    def participants(self, uids: Iterable[str]) -> Set[str]:
+        raise NotImplementedError  # pragma: no cover
+
+    def version(self) -> Optional[int]:
+        return None
+
     def mark_sent(self, emails_or_uids: Iterable[Union[dict, str]]):
         uids = map(_get_uid, emails_or_uids)
         return self._mark_sent(uids)
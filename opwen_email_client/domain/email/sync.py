@@ -1,17 +1,43 @@
 from abc import ABCMeta
 from abc import abstractmethod
-from gzip import GzipFile
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from io import TextIOBase
+from json import dump
+from json import load
+from os import makedirs
+from os import remove
+from os import replace
+from os.path import dirname
+from os.path import exists
+from os.path import join
 from tempfile import NamedTemporaryFile
+from tempfile import TemporaryDirectory
+from threading import Event
+from threading import RLock
+from typing import Callable
 from typing import Iterable
+from typing import List
+from typing import Optional
 from typing import TypeVar
 from uuid import uuid4
 
 from azure.common import AzureMissingResourceHttpError
 from azure.storage.blob import BlockBlobService
 
+from opwen_email_client.domain.email.attachment import AttachmentEncoder
 from opwen_email_client.domain.email.client import EmailServerClient
+from opwen_email_client.domain.email.package import BinaryPackage
+from opwen_email_client.domain.email.package import JsonLinesPackage
+from opwen_email_client.domain.email.package import PackageFormat
+from opwen_email_client.domain.email.package import read_package
+from opwen_email_client.util.azure import Blocks
+from opwen_email_client.util.azure import BlockTransfer
+from opwen_email_client.util.compression import Bz2Codec
+from opwen_email_client.util.compression import Codec
+from opwen_email_client.util.compression import GzipCodec
+from opwen_email_client.util.compression import LzmaCodec
+from opwen_email_client.util.compression import detect_codec
 from opwen_email_client.util.serialization import Serializer
 
 T = TypeVar('T')
@@ -19,22 +45,53 @@ T = TypeVar('T')
 
 class Sync(metaclass=ABCMeta):
     @abstractmethod
-    def upload(self, items: Iterable[T]) -> Iterable[str]:
+    def upload(self, items: Iterable[T],
+               on_uploaded: Callable[[List[str]], None]=None) -> Iterable[str]:
         raise NotImplementedError  # pragma: no cover
 
     @abstractmethod
     def download(self) -> Iterable[T]:
         raise NotImplementedError  # pragma: no cover
 
+    @abstractmethod
+    def checkpoint(self, processed: int):
+        raise NotImplementedError  # pragma: no cover
+
 
 class AzureSync(Sync):
     def __init__(self, container: str, serializer: Serializer,
                  account_name: str, account_key: str,
                  email_server_client: EmailServerClient,
-                 azure_client: BlockBlobService=None):
+                 attachment_encoder: AttachmentEncoder,
+                 azure_client: BlockBlobService=None,
+                 checkpoint_directory: str=None,
+                 on_transfer: Callable[[int], None]=None,
+                 package_format: PackageFormat=None,
+                 codec: Codec=None,
+                 max_package_bytes: int=None,
+                 block_size: int=4 * 1024 * 1024,
+                 retries: int=5,
+                 max_packages: int=None,
+                 prefetch: bool=True):
 
         self._container = container
-        self._serializer = serializer
+        self._on_transfer = on_transfer or (lambda transferred: None)
+        self._checkpoint_directory = checkpoint_directory
+        self._scratch_directory = None
+        self._checkpoint = []
+        self._checkpoint_lock = RLock()
+        self._package_formats = [
+            BinaryPackage(serializer),
+            JsonLinesPackage(serializer, attachment_encoder),
+        ]
+        self._package_format = package_format or self._package_formats[-1]
+        self._codec = codec or GzipCodec()
+        self._codecs = [GzipCodec(), Bz2Codec(), LzmaCodec()]
+        self._max_package_bytes = max_package_bytes
+        self._block_size = block_size
+        self._retries = retries
+        self._max_packages = max_packages
+        self._prefetch = prefetch
         self._account_name = account_name
         self._account_key = account_key
         self._email_server_client = email_server_client
@@ -51,54 +108,312 @@ class AzureSync(Sync):
     def _workspace(cls) -> TextIOBase:
         return NamedTemporaryFile()
 
-    @classmethod
-    def _open(cls, fileobj: BytesIO, mode: str='rb') -> TextIOBase:
-        return GzipFile(fileobj=fileobj, mode=mode)
+    def _open(self, fileobj: BytesIO, mode: str='rb') -> TextIOBase:
+        if 'r' in mode:
+            return detect_codec(fileobj, self._codecs).open(fileobj, mode)
+        return self._codec.open(fileobj, mode)
+
+    @property
+    def _transfer(self) -> BlockTransfer:
+        return BlockTransfer(self._azure_client,
+                             block_size=self._block_size,
+                             retries=self._retries,
+                             on_transfer=self._on_transfer)
 
     def _download_to_stream(self, blobname: str, container: str,
-                            stream: TextIOBase) -> bool:
+                            stream: TextIOBase, blocks: Blocks=None,
+                            on_block: Callable[[Blocks], None]=None,
+                            stopped: Callable[[], bool]=None) -> bool:
 
         try:
-            self._azure_client.get_blob_to_stream(container, blobname, stream)
+            self._transfer.download(container, blobname, stream,
+                                    blocks, on_block, stopped)
         except AzureMissingResourceHttpError:
             return False
         else:
             return True
 
-    def _upload_from_stream(self, blobname: str, stream: TextIOBase):
-        self._azure_client.create_blob_from_stream(self._container,
-                                                   blobname, stream)
+    def _upload_from_stream(self, blobname: str, stream: TextIOBase,
+                            blocks: Blocks=None,
+                            on_block: Callable[[Blocks], None]=None):
 
-    def download(self):
-        resource_id, container = self._email_server_client.download()
-        if not resource_id or not container:
+        self._transfer.upload(self._container, blobname, stream,
+                              blocks, on_block)
+
+    @property
+    def _upload_package_path(self) -> str:
+        return join(self._checkpoint_directory, 'upload.gz')
+
+    def _path(self, filename: str) -> str:
+        directory = self._checkpoint_directory or self._scratch_directory
+        return join(directory, filename)
+
+    def _load_json(self, filename: str) -> Optional[dict]:
+        if not self._checkpoint_directory:
+            return None
+
+        try:
+            with open(join(self._checkpoint_directory, filename)) as fobj:
+                return load(fobj)
+        except (OSError, ValueError):
+            return None
+
+    def _save_json(self, filename: str, content: dict):
+        if not self._checkpoint_directory:
             return
 
-        with self._workspace() as workspace:
-            if self._download_to_stream(resource_id, container, workspace):
+        path = join(self._checkpoint_directory, filename)
+        makedirs(self._checkpoint_directory, exist_ok=True)
+        with open(path + '.tmp', 'w') as fobj:
+            dump(content, fobj)
+        replace(path + '.tmp', path)
+
+    def _remove(self, *filenames: str):
+        for filename in filenames:
+            path = self._path(filename)
+            if exists(path):
+                remove(path)
+
+    def _load_checkpoint(self) -> List[dict]:
+        checkpoint = self._load_json('checkpoint.json') or {}
+        packages = checkpoint.get('packages', [checkpoint])
+
+        packages = [package for package in packages
+                    if package.get('resource_id')
+                    and package.get('container')]
+
+        for package in packages:
+            package.setdefault('offset', 0)
+            package.setdefault('filename', 'package.gz')
+            package.pop('total', None)
+
+        return packages
+
+    def _save_checkpoint(self):
+        if self._checkpoint:
+            self._save_json('checkpoint.json', {'packages': self._checkpoint})
+        elif self._checkpoint_directory:
+            self._remove('checkpoint.json')
+
+    def _next_package(self, previous: Optional[dict], seen: set,
+                      stopped: Callable[[], bool]=None) -> Optional[dict]:
+
+        while True:
+            with self._checkpoint_lock:
+                index = 0
+                for i, package in enumerate(self._checkpoint):
+                    if package is previous:
+                        index = i + 1
+                package = (self._checkpoint[index]
+                           if index < len(self._checkpoint) else None)
+
+            if package is None:
+                package = self._request_package(seen)
+                if package is None:
+                    return None
+
+            seen.add(package['resource_id'])
+            if self._fetch_package(package, stopped):
+                return package
+
+            with self._checkpoint_lock:
+                self._checkpoint.remove(package)
+                self._save_checkpoint()
+            self._remove(package['filename'] + '.tmp')
+
+    def _request_package(self, seen: set) -> Optional[dict]:
+        if self._max_packages and len(seen) >= self._max_packages:
+            return None
+
+        resource_id, container = self._email_server_client.download()
+        if not resource_id or not container or resource_id in seen:
+            return None
+
+        package = {'resource_id': resource_id,
+                   'container': container,
+                   'offset': 0,
+                   'filename': 'package-{}.gz'.format(uuid4())}
+
+        with self._checkpoint_lock:
+            self._checkpoint.append(package)
+            self._save_checkpoint()
+
+        return package
+
+    def _fetch_package(self, package: dict,
+                       stopped: Callable[[], bool]=None) -> bool:
+        path = self._path(package['filename'])
+        if exists(path):
+            return True
+
+        def on_block(blocks):
+            with self._checkpoint_lock:
+                package['blocks'] = list(blocks)
+                self._save_checkpoint()
+
+        makedirs(dirname(path), exist_ok=True)
+        partial = path + '.tmp'
+        with open(partial, 'r+b' if exists(partial) else 'w+b') as fobj:
+            downloaded = self._download_to_stream(
+                package['resource_id'], package['container'], fobj,
+                package.get('blocks'), on_block, stopped)
+        if not downloaded:
+            return False
+
+        replace(partial, path)
+        return True
+
+    def _read_package(self, package: dict) -> Iterable[T]:
+        total = package['offset']
+        with open(self._path(package['filename']), 'rb') as fobj:
+            with self._open(fobj) as downloaded:
+                for item in read_package(downloaded, self._package_formats,
+                                         package['offset']):
+                    total += 1
+                    yield item
+
+        with self._checkpoint_lock:
+            package['total'] = total
+            self.checkpoint(0)
+
+    def download(self):
+        scratch = None
+        if not self._checkpoint_directory:
+            scratch = TemporaryDirectory()
+            self._scratch_directory = scratch.name
+
+        with self._checkpoint_lock:
+            self._checkpoint = self._load_checkpoint()
+
+        seen = set()
+        stop = Event()
+        executor = ThreadPoolExecutor(max_workers=1)
+        upcoming = None
+        try:
+            package = self._next_package(None, seen, stop.is_set)
+            while package is not None:
+                upcoming = (executor.submit(self._next_package,
+                                            package, seen, stop.is_set)
+                            if self._prefetch else None)
+
+                yield from self._read_package(package)
+
+                package = (upcoming.result() if upcoming
+                           else self._next_package(package, seen, stop.is_set))
+        finally:
+            # don't wait for the prefetch when the download is closed early:
+            # it stops at its next block and resumes from the checkpoint
+            stop.set()
+            executor.shutdown(wait=False)
+            if upcoming is not None:
+                upcoming.cancel()
+            if scratch is not None:
+                if upcoming is not None:
+                    upcoming.add_done_callback(lambda _: scratch.cleanup())
+                else:
+                    scratch.cleanup()
+
+    def checkpoint(self, processed):
+        with self._checkpoint_lock:
+            while self._checkpoint:
+                package = self._checkpoint[0]
+                package['offset'] += processed
+
+                total = package.get('total')
+                if total is None or package['offset'] < total:
+                    break
+
+                processed = package['offset'] - total
+                self._checkpoint.pop(0)
+                self._remove(package['filename'], package['filename'] + '.tmp')
+
+            self._save_checkpoint()
+
+    def _packages(self, items: Iterable[dict]) -> Iterable[List[tuple]]:
+        package = []
+        package_bytes = 0
+
+        for item in items:
+            item = {key: value for (key, value) in item.items()
+                    if value is not None}
+            encoded = BytesIO()
+            self._package_format.write(encoded, item)
+            encoded = encoded.getvalue()
+
+            if (package and self._max_package_bytes and
+                    package_bytes + len(encoded) > self._max_package_bytes):
+                yield package
+                package = []
+                package_bytes = 0
+
+            package.append((item.get('_uid'), encoded))
+            package_bytes += len(encoded)
+
+        if package:
+            yield package
+
+    def _write_package(self, workspace: TextIOBase, package: List[tuple]):
+        with self._open(workspace, 'wb') as uploaded:
+            self._package_format.start(uploaded)
+            for uid, encoded in package:
+                uploaded.write(encoded)
+
+    def _upload_package(self, package: List[tuple]):
+        upload = {'blobname': str(uuid4()),
+                  'uids': [uid for uid, encoded in package],
+                  'blocks': []}
+
+        if not self._checkpoint_directory:
+            with self._workspace() as workspace:
+                self._write_package(workspace, package)
                 workspace.seek(0)
-                with self._open(workspace) as downloaded:
-                    for line in downloaded:
-                        yield self._serializer.deserialize(line)
+                self._upload_from_stream(upload['blobname'], workspace)
+            self._email_server_client.upload(upload['blobname'],
+                                             self._container)
+            return
+
+        makedirs(self._checkpoint_directory, exist_ok=True)
+        with open(self._upload_package_path, 'wb') as workspace:
+            self._write_package(workspace, package)
+        self._save_json('upload.json', upload)
+        self._resume_upload(upload)
+
+    def _resume_upload(self, upload: dict):
+        def on_block(blocks):
+            upload['blocks'] = blocks
+            self._save_json('upload.json', upload)
+
+        with open(self._upload_package_path, 'rb') as workspace:
+            self._upload_from_stream(upload['blobname'], workspace,
+                                     upload['blocks'], on_block)
+        self._email_server_client.upload(upload['blobname'],
+                                         self._container)
+        self._remove('upload.json', 'upload.gz')
 
-    def upload(self, items):
+    def _pending_upload(self) -> Optional[dict]:
+        upload = self._load_json('upload.json')
+        if not upload or not exists(self._upload_package_path):
+            return None
+        return upload
+
+    def upload(self, items, on_uploaded=None):
         uploaded_ids = []
-        upload_location = str(uuid4())
-
-        with self._workspace() as workspace:
-            with self._open(workspace, 'wb') as uploaded:
-                for item in items:
-                    item = {key: value for (key, value) in item.items()
-                            if value is not None}
-                    serialized = self._serializer.serialize(item)
-                    uploaded.write(serialized)
-                    uploaded.write(b'\n')
-                    uploaded_ids.append(item.get('_uid'))
-
-            if uploaded_ids:
-                workspace.seek(0)
-                self._upload_from_stream(upload_location, workspace)
-                self._email_server_client.upload(upload_location,
-                                                 self._container)
+
+        pending = self._pending_upload()
+        if pending is not None:
+            self._resume_upload(pending)
+            if on_uploaded is not None:
+                on_uploaded(pending['uids'])
+            uploaded_ids.extend(pending['uids'])
+            resumed_ids = set(pending['uids'])
+            items = (item for item in items
+                     if item.get('_uid') not in resumed_ids)
+
+        for package in self._packages(items):
+            self._upload_package(package)
+            package_ids = [uid for uid, encoded in package]
+            if on_uploaded is not None:
+                on_uploaded(package_ids)
+            uploaded_ids.extend(package_ids)
 
         return uploaded_ids
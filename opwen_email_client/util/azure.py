@@ -0,0 +1,143 @@
+from base64 import b64encode
+from hashlib import md5
+from io import BufferedIOBase
+from time import sleep
+from typing import Callable
+from typing import List
+
+from azure.common import AzureException
+from azure.common import AzureHttpError
+from azure.storage.blob import BlobBlock
+from azure.storage.blob import BlockBlobService
+
+Blocks = List[str]
+
+
+class TransferStopped(Exception):
+    pass
+
+
+class BlockTransfer(object):
+    def __init__(self, client: BlockBlobService,
+                 block_size: int=4 * 1024 * 1024,
+                 retries: int=5, retry_wait: float=1.0,
+                 on_transfer: Callable[[int], None]=None,
+                 wait: Callable[[float], None]=sleep):
+
+        self._client = client
+        self._block_size = block_size
+        self._retries = retries
+        self._retry_wait = retry_wait
+        self._on_transfer = on_transfer or (lambda transferred: None)
+        self._wait = wait
+
+    def upload(self, container: str, blobname: str, stream: BufferedIOBase,
+               blocks: Blocks=None,
+               on_block: Callable[[Blocks], None]=None):
+
+        on_block = on_block or (lambda uploaded: None)
+        resumed = list(blocks or [])
+        reused = False
+        blocks = []
+        block_list = []
+
+        while True:
+            data = stream.read(self._block_size)
+            if not data:
+                break
+
+            digest = md5(data).hexdigest()
+            block_id = _block_id(len(blocks))
+            block_list.append(BlobBlock(id=block_id))
+
+            if len(blocks) < len(resumed) and resumed[len(blocks)] == digest:
+                blocks.append(digest)
+                reused = True
+                continue
+
+            resumed = []
+            self._retry(self._client.put_block, container, blobname, data,
+                        block_id, validate_content=True)
+            blocks.append(digest)
+            self._on_transfer(len(data))
+            on_block(blocks)
+
+        try:
+            self._retry(self._client.put_block_list, container, blobname,
+                        block_list)
+        except AzureHttpError:
+            if not reused:
+                raise
+
+            stream.seek(0)
+            self.upload(container, blobname, stream, on_block=on_block)
+
+    def download(self, container: str, blobname: str, stream: BufferedIOBase,
+                 blocks: Blocks=None,
+                 on_block: Callable[[Blocks], None]=None,
+                 stopped: Callable[[], bool]=None):
+
+        on_block = on_block or (lambda downloaded: None)
+        stopped = stopped or (lambda: False)
+        blob = self._retry(self._client.get_blob_properties,
+                           container, blobname)
+        size = blob.properties.content_length
+
+        blocks = self._verify(stream, blocks or [])
+        offset = stream.tell()
+
+        while offset < size:
+            if stopped():
+                raise TransferStopped('stopped download of {}'
+                                      .format(blobname))
+
+            end_range = min(offset + self._block_size, size) - 1
+            blob = self._retry(self._client.get_blob_to_bytes,
+                               container, blobname,
+                               start_range=offset, end_range=end_range,
+                               validate_content=True, max_connections=1)
+
+            data = blob.content
+            if len(data) != end_range - offset + 1:
+                raise AzureException('short read for {}'.format(blobname))
+
+            stream.write(data)
+            blocks.append(md5(data).hexdigest())
+            offset += len(data)
+            self._on_transfer(len(data))
+            on_block(blocks)
+
+    def _verify(self, stream: BufferedIOBase, blocks: Blocks) -> Blocks:
+        stream.seek(0)
+        verified = []
+        position = 0
+
+        for digest in blocks:
+            data = stream.read(self._block_size)
+            if not data or md5(data).hexdigest() != digest:
+                break
+            verified.append(digest)
+            position += len(data)
+
+        stream.seek(position)
+        stream.truncate()
+        return verified
+
+    def _retry(self, func, *args, **kwargs):
+        for attempt in range(self._retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except (AzureException, OSError) as ex:
+                if attempt == self._retries or not _is_transient(ex):
+                    raise
+            self._wait(self._retry_wait * 2 ** attempt)
+
+
+def _is_transient(ex: Exception) -> bool:
+    if isinstance(ex, AzureHttpError):
+        return ex.status_code >= 500
+    return True
+
+
+def _block_id(index: int) -> str:
+    return b64encode('{:08d}'.format(index).encode('ascii')).decode('ascii')
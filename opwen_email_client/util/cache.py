@@ -0,0 +1,83 @@
+from collections import OrderedDict
+from collections import defaultdict
+from threading import Lock
+from time import monotonic
+from typing import Callable
+from typing import Hashable
+from typing import Iterable
+
+
+class LruCache(object):
+    missing = object()
+
+    def __init__(self, maxsize: int=512, ttl: float=60,
+                 clock: Callable[[], float]=monotonic):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._clock = clock
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        self._tagged = defaultdict(set)
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return self.missing
+
+            expires_at, tags, value = entry
+            if expires_at <= self._clock():
+                self._remove(key)
+                self._misses += 1
+                return self.missing
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def set(self, key: Hashable, value, tags: Iterable[Hashable]=()):
+        if self._maxsize <= 0:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            tags = frozenset(tags)
+            self._entries[key] = (self._clock() + self._ttl, tags, value)
+            for tag in tags:
+                self._tagged[tag].add(key)
+
+            while len(self._entries) > self._maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, tags: Iterable[Hashable]):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tagged.get(tag, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tagged.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'size': len(self._entries),
+                'maxsize': self._maxsize,
+            }
+
+    def _remove(self, key: Hashable):
+        expires_at, tags, value = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tagged[tag]
+            keys.discard(key)
+            if not keys:
+                del self._tagged[tag]
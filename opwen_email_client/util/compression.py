@@ -0,0 +1,92 @@
+from abc import ABCMeta
+from abc import abstractmethod
+from bz2 import BZ2File
+from gzip import GzipFile
+from io import BufferedIOBase
+from io import BytesIO
+from lzma import LZMAFile
+from time import perf_counter
+from typing import Iterable
+from typing import Optional
+
+
+class Codec(metaclass=ABCMeta):
+    name = None
+    magic = None
+    default_level = None
+
+    def __init__(self, level: Optional[int]=None):
+        self.level = self.default_level if level is None else level
+
+    @abstractmethod
+    def open(self, fileobj: BufferedIOBase, mode: str='rb') -> BufferedIOBase:
+        raise NotImplementedError  # pragma: no cover
+
+    def matches(self, header: bytes) -> bool:
+        return header.startswith(self.magic)
+
+
+class GzipCodec(Codec):
+    name = 'gzip'
+    magic = b'\x1f\x8b'
+    default_level = 9
+
+    def open(self, fileobj, mode='rb'):
+        return GzipFile(fileobj=fileobj, mode=mode, compresslevel=self.level)
+
+
+class Bz2Codec(Codec):
+    name = 'bz2'
+    magic = b'BZh'
+    default_level = 9
+
+    def open(self, fileobj, mode='rb'):
+        if 'r' in mode:
+            return BZ2File(fileobj, mode=mode)
+        return BZ2File(fileobj, mode=mode, compresslevel=self.level)
+
+
+class LzmaCodec(Codec):
+    name = 'lzma'
+    magic = b'\xfd7zXZ\x00'
+    default_level = 6
+
+    def open(self, fileobj, mode='rb'):
+        if 'r' in mode:
+            return LZMAFile(fileobj, mode=mode)
+        return LZMAFile(fileobj, mode=mode, preset=self.level)
+
+
+def detect_codec(fileobj: BufferedIOBase, codecs: Iterable[Codec]) -> Codec:
+    codecs = list(codecs)
+    position = fileobj.tell()
+    header = fileobj.read(max(len(codec.magic) for codec in codecs))
+    fileobj.seek(position)
+
+    for codec in codecs:
+        if codec.matches(header):
+            return codec
+
+    raise ValueError('unknown compression codec')
+
+
+def measure(codec: Codec, data: bytes) -> dict:
+    compressed = BytesIO()
+    start = perf_counter()
+    with codec.open(compressed, 'wb') as fobj:
+        fobj.write(data)
+    compress_seconds = perf_counter() - start
+
+    compressed.seek(0)
+    start = perf_counter()
+    with codec.open(compressed, 'rb') as fobj:
+        fobj.read()
+    decompress_seconds = perf_counter() - start
+
+    size = len(compressed.getvalue())
+    return {
+        'size': size,
+        'ratio': len(data) / size if size else 0,
+        'compress_seconds': compress_seconds,
+        'decompress_seconds': decompress_seconds,
+    }
@@ -1,5 +1,71 @@
+from itertools import islice
+from queue import Full
+from queue import Queue
+from threading import Event
+from threading import Thread
 from typing import Iterable
+from typing import List
+from typing import TypeVar
+
+T = TypeVar('T')
+
+_done = object()
 
 
 def length(sequence: Iterable) -> int:
     return sum(1 for _ in sequence)
+
+
+def chunks(iterable: Iterable, size: int) -> Iterable[List]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def prefetch(iterable: Iterable[T], maxsize: int) -> Iterable[T]:
+    queue = Queue(maxsize=maxsize)
+    stopped = Event()
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not _put(queue, (item, None), stopped):
+                    return
+        except Exception as ex:
+            _put(queue, (_done, ex), stopped)
+        else:
+            _put(queue, (_done, None), stopped)
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+
+    thread = Thread(target=produce, name='prefetch')
+    thread.daemon = True
+    thread.start()
+
+    try:
+        while True:
+            item, error = queue.get()
+            if error is not None:
+                raise error
+            if item is _done:
+                return
+            yield item
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def _put(queue: Queue, item, stopped: Event) -> bool:
+    while not stopped.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+        except Full:
+            continue
+        else:
+            return True
+    return False
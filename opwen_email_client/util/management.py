@@ -1,10 +1,18 @@
 from glob import glob
+from io import BytesIO
 from os.path import join
+from typing import Iterable
 from typing import List
 
 from dotenv import load_dotenv
 from flask import Flask
 from flask_script import Command
+from flask_script import Option
+
+from opwen_email_client.domain.email.package import PackageFormat
+from opwen_email_client.domain.email.package import read_package
+from opwen_email_client.util.compression import detect_codec
+from opwen_email_client.util.compression import measure
 
 
 # noinspection PyAbstractClass,PyMethodOverriding
@@ -18,6 +26,62 @@ class DevServerCommand(Command):
         app.run(debug=True, extra_files=reload_server_if_changed)
 
 
+# noinspection PyAbstractClass,PyMethodOverriding
+class BenchmarkSyncCommand(Command):
+    option_list = (
+        Option('--package', '-p', dest='package', default=None,
+               help='sync package to use as the email corpus'),
+        Option('--levels', '-l', dest='levels', default='',
+               help='comma-separated compression levels to compare'),
+    )
+
+    def __call__(self, app: Flask, package: str=None, levels: str=''):
+        package_formats = app.ioc.package_formats
+        codecs = app.ioc.compression_codecs.values()
+
+        if package:
+            with open(package, 'rb') as fobj:
+                codec = detect_codec(fobj, [_() for _ in codecs])
+                with codec.open(fobj) as package_fobj:
+                    items = list(read_package(package_fobj,
+                                              package_formats.values()))
+        else:
+            items = list(app.ioc.email_store.pending())
+
+        levels = [int(level) for level in levels.split(',') if level]
+        codecs = [codec(level)
+                  for codec in codecs
+                  for level in (levels or [None])]
+
+        print('{} emails'.format(len(items)))
+        print('{:<8} {:<6} {:>12} {:>12} {:>7} {:>10} {:>10}'.format(
+            'format', 'codec', 'raw', 'on wire', 'ratio', 'comp MB/s',
+            'decomp MB/s'))
+
+        for name, package_format in sorted(package_formats.items()):
+            raw = _package_bytes(package_format, items)
+            for codec in codecs:
+                result = measure(codec, raw)
+                print('{:<8} {:<6} {:>12} {:>12} {:>7.2f} {:>10.2f} {:>10.2f}'
+                      .format(name, '{}-{}'.format(codec.name, codec.level),
+                              len(raw), result['size'], result['ratio'],
+                              _throughput(raw, result['compress_seconds']),
+                              _throughput(raw, result['decompress_seconds'])))
+
+
+def _package_bytes(package_format: PackageFormat,
+                   items: Iterable[dict]) -> bytes:
+    raw = BytesIO()
+    package_format.start(raw)
+    for item in items:
+        package_format.write(raw, item)
+    return raw.getvalue()
+
+
+def _throughput(data: bytes, seconds: float) -> float:
+    return len(data) / seconds / 1024 / 1024 if seconds else 0
+
+
 def _load_environment(app: Flask) -> None:
     dotenv_path = join(app.root_path, '..', '..', '.env')
     load_dotenv(dotenv_path)
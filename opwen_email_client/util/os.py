@@ -1,9 +1,19 @@
 from ast import literal_eval
+from contextlib import contextmanager
+from fcntl import LOCK_EX
+from fcntl import LOCK_NB
+from fcntl import LOCK_UN
+from fcntl import flock
 from os import getenv as _getenv
+from os import getpid
 from os import listdir
+from os import makedirs
+from os import replace
+from os.path import dirname
 from os.path import isdir
 from os.path import join
 from typing import Iterable
+from typing import Iterator
 from typing import TypeVar
 
 T = TypeVar('T')
@@ -22,3 +32,35 @@ def subdirectories(root: str) -> Iterable[str]:
         return (sub for sub in listdir(root) if isdir(join(root, sub)))
     except OSError:
         return []
+
+
+@contextmanager
+def file_lock(path: str, blocking: bool=False) -> Iterator[bool]:
+    _makedirs_for(path)
+
+    with open(path, 'a') as fobj:
+        try:
+            flock(fobj, LOCK_EX if blocking else LOCK_EX | LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+
+        try:
+            yield True
+        finally:
+            flock(fobj, LOCK_UN)
+
+
+def replace_file(path: str, content: bytes):
+    _makedirs_for(path)
+
+    temporary_path = '{}.{}.tmp'.format(path, getpid())
+    with open(temporary_path, 'wb') as fobj:
+        fobj.write(content)
+    replace(temporary_path, path)
+
+
+def _makedirs_for(path: str):
+    directory = dirname(path)
+    if directory:
+        makedirs(directory, exist_ok=True)
@@ -1,20 +1,34 @@
+from base64 import urlsafe_b64decode
+from base64 import urlsafe_b64encode
+from binascii import Error as BinasciiError
 from itertools import islice
+from json import dumps
+from json import loads
 from typing import Iterable
+from typing import List
+from typing import Optional
 from typing import TypeVar
 
 T = TypeVar('T')
 
 
 class Pagination(object):
-    def __init__(self, items: Iterable[T], page: int, page_size: int):
+    def __init__(self, items: Iterable[T], page: int, page_size: int,
+                 sliced: bool=False, prev_cursor: Optional[str]=None,
+                 next_cursor: Optional[str]=None):
         if page < 1:
             raise ValueError('page must be greater than or equal to 1')
 
-        start = (page - 1) * page_size
-        stop = page * page_size
-        self._items = list(islice(items, start, stop))
+        if not sliced:
+            start = (page - 1) * page_size
+            stop = page * page_size
+            items = islice(items, start, stop)
+
+        self._items = list(items)
         self.page = page
         self.page_size = page_size
+        self.prev_cursor = prev_cursor if self.has_prevpage else None
+        self.next_cursor = next_cursor if self.has_nextpage else None
 
     def __iter__(self):
         return iter(self._items)
@@ -26,3 +40,22 @@ class Pagination(object):
     @property
     def has_nextpage(self) -> bool:
         return len(self._items) == self.page_size
+
+
+def encode_cursor(*values) -> str:
+    serialized = dumps(values, separators=(',', ':')).encode('utf-8')
+    return urlsafe_b64encode(serialized).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[List]:
+    if not cursor:
+        return None
+
+    padding = '=' * (-len(cursor) % 4)
+    try:
+        serialized = urlsafe_b64decode((cursor + padding).encode('ascii'))
+        values = loads(serialized.decode('utf-8'))
+    except (BinasciiError, UnicodeError, ValueError):
+        return None
+
+    return values if isinstance(values, list) else None
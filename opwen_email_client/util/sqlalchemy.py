@@ -1,23 +1,166 @@
 from contextlib import contextmanager
+from heapq import heappush
+from heapq import heappushpop
+from threading import Lock
+from threading import local
+from time import perf_counter
+from typing import Callable
+from typing import Iterable
+from typing import Optional
 
 from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy import inspect
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm.exc import NoResultFound
 
 
-def create_database(uri: str, base):
+def create_database(uri: str, base,
+                    migrations: Iterable[Callable]=(),
+                    pragmas: Optional[dict]=None,
+                    profiler: Optional['QueryProfiler']=None):
     engine = create_engine(uri)
+    sqlite_pragmas(engine, pragmas)
+
+    if profiler is not None:
+        profiler.attach(engine)
 
     try:
         base.metadata.create_all(bind=engine)
     except SQLAlchemyError:
         pass
 
+    for migrate in migrations:
+        migrate(engine)
+
+    _create_indexes(engine, base)
+
     return engine
 
 
+def sqlite_pragmas(engine, pragmas: Optional[dict]=None):
+    if not pragmas or engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA {}={}'.format(name, value))
+        cursor.close()
+
+
+class DataVersion(object):
+    def __init__(self):
+        self._lock = Lock()
+        self._known = None
+        self._version = 0
+
+    def committed(self, generation: int):
+        with self._lock:
+            if self._known == generation - 1:
+                self._known = generation
+
+    def __call__(self, generation: Optional[int]) -> Optional[int]:
+        if generation is None:
+            return None
+
+        with self._lock:
+            if generation != self._known:
+                self._known = generation
+                self._version += 1
+            return self._version
+
+
+class QueryProfiler(object):
+    def __init__(self, enabled: bool=False, slowest: int=5):
+        self.enabled = enabled
+        self._slowest = slowest
+        self._local = local()
+
+    def attach(self, engine):
+        if not self.enabled:
+            return
+
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+        event.listen(engine, 'handle_error', self._on_error)
+
+    def start(self):
+        self._local.profile = {'count': 0, 'seconds': 0.0, 'slowest': []}
+
+    def stop(self) -> Optional[dict]:
+        profile = getattr(self._local, 'profile', None)
+        self._local.profile = None
+        if profile is None:
+            return None
+
+        profile['slowest'] = [
+            {'seconds': seconds, 'statement': statement}
+            for (seconds, statement) in sorted(profile['slowest'],
+                                               reverse=True)]
+        return profile
+
+    # noinspection PyUnusedLocal
+    def _before_execute(self, connection, cursor, statement, parameters,
+                        context, executemany):
+        self._started(connection)[context] = perf_counter()
+
+    def _on_error(self, exception_context):
+        connection = exception_context.connection
+        if connection is None:
+            return
+
+        self._started(connection).pop(exception_context.execution_context,
+                                      None)
+
+    def _started(self, connection) -> dict:
+        return connection.info.setdefault((self, 'query_started'), {})
+
+    # noinspection PyUnusedLocal
+    def _after_execute(self, connection, cursor, statement, parameters,
+                       context, executemany):
+        started = self._started(connection).pop(context)
+        profile = getattr(self._local, 'profile', None)
+        if profile is None:
+            return
+
+        seconds = perf_counter() - started
+        profile['count'] += 1
+        profile['seconds'] += seconds
+
+        slowest = profile['slowest']
+        if len(slowest) < self._slowest:
+            heappush(slowest, (seconds, statement))
+        elif self._slowest:
+            heappushpop(slowest, (seconds, statement))
+
+
+def _create_indexes(engine, base):
+    inspector = inspect(engine)
+
+    for table in base.metadata.sorted_tables:
+        existing = inspector.get_indexes(table.name)
+        existing = {index['name'] for index in existing}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            try:
+                index.create(bind=engine)
+            except SQLAlchemyError:
+                pass
+
+
+def column_names(engine, table: str) -> Iterable[str]:
+    return {column['name'] for column in inspect(engine).get_columns(table)}
+
+
+def table_names(engine) -> Iterable[str]:
+    return set(inspect(engine).get_table_names())
+
+
 def get_or_create(db, model, create_method: str='',
                   create_method_kwargs=None, **kwargs):
     try:
@@ -49,5 +192,7 @@ def session(session_maker, commit: bool=False):
             db.commit()
     except SQLAlchemyError:
         db.rollback()
+        if commit:
+            raise
     finally:
         db.close()
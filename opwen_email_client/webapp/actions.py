@@ -1,27 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+from logging import Logger
+from logging import getLogger
+from time import perf_counter
+
 from flask import render_template
 
+from opwen_email_client.domain.email.lesson import LessonStore
 from opwen_email_client.domain.email.store import EmailStore
 from opwen_email_client.domain.email.sync import Sync
+from opwen_email_client.util.generator import chunks
+from opwen_email_client.util.generator import prefetch
 from opwen_email_client.webapp.config import i8n
+from opwen_email_client.webapp.worker import SyncStatus
 
 
 class SyncEmails(object):
-    def __init__(self, email_store: EmailStore, email_sync: Sync):
+    def __init__(self, email_store: EmailStore, email_sync: Sync,
+                 lesson_store: LessonStore, batch_size: int=500,
+                 status: SyncStatus=None, log: Logger=None,
+                 pipeline_depth: int=0):
         self._email_store = email_store
         self._email_sync = email_sync
+        self._lesson_store = lesson_store
+        self._batch_size = batch_size
+        self._pipeline_depth = pipeline_depth
+        self._status = status or SyncStatus()
+        self._log = log or getLogger(__name__)
 
     def _upload(self):
         pending = self._email_store.pending()
-        uploaded = self._email_sync.upload(pending)
+        self._email_sync.upload(pending, on_uploaded=self._mark_sent)
+
+    def _mark_sent(self, uploaded):
         self._email_store.mark_sent(uploaded)
+        self._status.increment('emails_uploaded', len(uploaded))
 
     def _download(self):
         downloaded = self._email_sync.download()
-        self._email_store.create(downloaded)
+        downloaded = self._lesson_store.extract_all(downloaded)
+        batches = chunks(downloaded, self._batch_size)
+        if self._pipeline_depth:
+            batches = prefetch(batches, self._pipeline_depth)
+
+        start = perf_counter()
+        created = 0
+        for batch in batches:
+            created += self._email_store.create(batch)
+            self._email_sync.checkpoint(len(batch))
+            self._status.increment('emails_downloaded', len(batch))
+        elapsed = perf_counter() - start
+        rate = created / elapsed if elapsed else 0
+
+        self._status.update(emails_per_second=rate)
+        self._log.info('Downloaded %d emails in %.2fs (%.1f emails/sec)',
+                       created, elapsed, rate)
 
     def _sync(self):
-        self._upload()
-        self._download()
+        if not self._pipeline_depth:
+            self._status.update(phase=SyncStatus.uploading)
+            self._upload()
+            self._status.update(phase=SyncStatus.downloading)
+            self._download()
+            return
+
+        self._status.update(phase=SyncStatus.syncing)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            upload = executor.submit(self._upload)
+            try:
+                self._download()
+            except Exception as download_error:
+                try:
+                    upload.result()
+                except Exception as upload_error:
+                    raise download_error from upload_error
+                raise
+            upload.result()
 
     def __call__(self):
         self._sync()
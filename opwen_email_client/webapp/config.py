@@ -30,6 +30,7 @@ class i8n(object):
     ACCOUNT_SUSPENDED = _('Your account has been suspended. '
                           'Please contact your administrator.')
     SYNC_COMPLETE = _('Email synchronization completed.')
+    SYNC_QUEUED = _('Email synchronization has been scheduled.')
     UNEXPECTED_ERROR = _('Unexpected error. Please contact your admin.')
     PAGE_DOES_NOT_EXIST = _('This page does not exist.')
     USER_DOES_NOT_EXIST = _('This user does not exist.')
@@ -42,6 +43,14 @@ class AppConfig(object):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + SQLITE_PATH
     SQLALCHEMY_MIGRATE_REPO = path.join(state_basedir, 'app.migrate')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLITE_PRAGMAS = {
+        'journal_mode': getenv('OPWEN_SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': getenv('OPWEN_SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'mmap_size': getenv('OPWEN_SQLITE_MMAP_SIZE', 64 * 1024 * 1024),
+        'cache_size': getenv('OPWEN_SQLITE_CACHE_SIZE', -8000),
+        'temp_store': getenv('OPWEN_SQLITE_TEMP_STORE', 'MEMORY'),
+        'busy_timeout': getenv('OPWEN_SQLITE_BUSY_TIMEOUT', 5000),
+    }
 
     ADMIN_SECRET = getenv('OPWEN_ADMIN_SECRET')
     SECRET_KEY = getenv('OPWEN_SESSION_KEY')
@@ -64,13 +73,38 @@ class AppConfig(object):
     TESTING = getenv('OPWEN_ENABLE_DEBUG', False)
 
     LOCAL_EMAIL_STORE = path.join(state_basedir, 'email.store')
+    LESSONS_DIRECTORY = path.join(state_basedir, 'lessons')
+    LESSON_SLIDE_CACHE_SECONDS = 365 * 24 * 60 * 60
+
+    SYNC_DIRECTORY = path.join(state_basedir, 'sync')
+    SYNC_LOCK_FILE = path.join(SYNC_DIRECTORY, 'sync.lock')
+    SYNC_STATUS_FILE = path.join(SYNC_DIRECTORY, 'sync.status.json')
+    SYNC_BATCH_SIZE = 500
+    SYNC_INTERVAL_SECONDS = int(getenv('OPWEN_SYNC_INTERVAL_SECONDS', 0))
+    SYNC_PACKAGE_FORMAT = getenv('OPWEN_SYNC_PACKAGE_FORMAT', 'jsonl')
+    SYNC_COMPRESSION = getenv('OPWEN_SYNC_COMPRESSION', 'gzip')
+    SYNC_COMPRESSION_LEVEL = getenv('OPWEN_SYNC_COMPRESSION_LEVEL', None)
+    SYNC_MAX_PACKAGE_BYTES = getenv('OPWEN_SYNC_MAX_PACKAGE_BYTES',
+                                    5 * 1024 * 1024)
+    SYNC_BLOCK_BYTES = getenv('OPWEN_SYNC_BLOCK_BYTES', 4 * 1024 * 1024)
+    SYNC_RETRIES = getenv('OPWEN_SYNC_RETRIES', 5)
+    SYNC_PIPELINE_DEPTH = getenv('OPWEN_SYNC_PIPELINE_DEPTH', 4)
+    SYNC_MAX_PACKAGES = getenv('OPWEN_SYNC_MAX_PACKAGES', 0)
+    SYNC_PREFETCH_PACKAGES = getenv('OPWEN_SYNC_PREFETCH_PACKAGES', True)
 
     EMAIL_ADDRESS_DELIMITER = ','
     EMAILS_PER_PAGE = 30
 
+    EMAIL_CACHE_ENABLED = getenv('OPWEN_EMAIL_CACHE', False)
+    EMAIL_CACHE_SIZE = getenv('OPWEN_EMAIL_CACHE_SIZE', 512)
+    EMAIL_CACHE_TTL_SECONDS = getenv('OPWEN_EMAIL_CACHE_TTL_SECONDS', 60)
+
     LOG_FORMAT = '%(asctime)s\t%(levelname)s\t%(message)s'
     LOG_LEVEL = ERROR
 
+    SQL_PROFILE_ENABLED = getenv('OPWEN_SQL_PROFILE', False)
+    SQL_PROFILE_SLOWEST = 5
+
     LOCALES_DIRECTORY = path.join(app_basedir, 'translations')
     DEFAULT_LOCALE = Locale.parse('en_ca')
     LOCALES = (
@@ -79,6 +113,11 @@ class AppConfig(object):
 
     EMAIL_SERVER_READ_API_HOSTNAME = getenv('OPWEN_EMAIL_SERVER_READ_API')
     EMAIL_SERVER_WRITE_API_HOSTNAME = getenv('OPWEN_EMAIL_SERVER_WRITE_API')
+    EMAIL_SERVER_CONNECT_TIMEOUT = getenv(
+        'OPWEN_EMAIL_SERVER_CONNECT_TIMEOUT', 10.0)
+    EMAIL_SERVER_READ_TIMEOUT = getenv('OPWEN_EMAIL_SERVER_READ_TIMEOUT', 60.0)
+    EMAIL_SERVER_RETRIES = getenv('OPWEN_EMAIL_SERVER_RETRIES', 3)
+    EMAIL_SERVER_COMPRESSION = getenv('OPWEN_EMAIL_SERVER_COMPRESSION', False)
     EMAIL_HOST_FORMAT = '{}.lokole.ca'
     STORAGE_CONTAINER = 'compressedpackages'
     STORAGE_ACCOUNT_NAME = getenv('OPWEN_REMOTE_ACCOUNT_NAME')
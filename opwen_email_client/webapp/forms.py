@@ -13,7 +13,6 @@ from wtforms import SubmitField
 from wtforms.validators import DataRequired
 from wtforms.validators import Optional as DataOptional
 
-from opwen_email_client.domain.email.attachment import AttachmentEncoder
 from opwen_email_client.domain.email.store import EmailStore
 from opwen_email_client.util.wtforms import Emails
 from opwen_email_client.util.wtforms import HtmlTextAreaField
@@ -49,7 +48,7 @@ class NewEmailForm(Form):
 
     submit = SubmitField()
 
-    def as_dict(self, attachment_encoder: AttachmentEncoder) -> dict:
+    def as_dict(self) -> dict:
         attachments = request.files.getlist(self.attachments.name)
         form = {key: value for (key, value) in self.data.items() if value}
         form.pop('submit', None)
@@ -60,8 +59,7 @@ class NewEmailForm(Form):
         form['cc'] = _split_emails(form.get('cc'))
         form['bcc'] = _split_emails(form.get('bcc'))
         form['body'] = form.get('body')
-        form['attachments'] = list(_attachments_as_dict(attachments,
-                                                        attachment_encoder))
+        form['attachments'] = list(_attachments_as_dict(attachments))
         return form
 
     def _populate(self, email: dict):
@@ -122,12 +120,11 @@ class ForwardEmailForm(NewEmailForm):
 
 
 def _attachments_as_dict(
-        filestorages: Iterable[FileStorage],
-        attachment_encoder: AttachmentEncoder) -> Iterable[dict]:
+        filestorages: Iterable[FileStorage]) -> Iterable[dict]:
 
     for filestorage in filestorages:
         filename = filestorage.filename
-        content = attachment_encoder.encode(filestorage.stream.read())
+        content = filestorage.stream.read()
         if filename and content:
             yield {'filename': filename, 'content': content}
 
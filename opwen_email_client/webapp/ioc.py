@@ -5,37 +5,108 @@ from flask import Flask
 from flask_babel import Babel
 
 from opwen_email_client.domain.email.attachment import Base64AttachmentEncoder
+from opwen_email_client.domain.email.cached_store import CachedEmailStore
 from opwen_email_client.domain.email.client import HttpEmailServerClient
+from opwen_email_client.domain.email.lesson import FileSystemLessonStore
+from opwen_email_client.domain.email.package import BinaryPackage
+from opwen_email_client.domain.email.package import JsonLinesPackage
 from opwen_email_client.domain.email.sql_store import SqliteEmailStore
 from opwen_email_client.domain.email.sync import AzureSync
+from opwen_email_client.util.cache import LruCache
+from opwen_email_client.util.compression import Bz2Codec
+from opwen_email_client.util.compression import GzipCodec
+from opwen_email_client.util.compression import LzmaCodec
 from opwen_email_client.util.serialization import JsonSerializer
+from opwen_email_client.util.sqlalchemy import QueryProfiler
+from opwen_email_client.webapp.actions import SyncEmails
 from opwen_email_client.webapp.config import AppConfig
 from opwen_email_client.webapp.session import AttachmentsStore
+from opwen_email_client.webapp.worker import SyncStatus
+from opwen_email_client.webapp.worker import SyncWorker
 
 
 class Ioc(object):
     serializer = JsonSerializer()
 
+    attachment_encoder = Base64AttachmentEncoder()
+
+    package_formats = {
+        'jsonl': JsonLinesPackage(serializer, attachment_encoder),
+        'binary': BinaryPackage(serializer),
+    }
+
+    compression_codecs = {
+        'gzip': GzipCodec,
+        'bz2': Bz2Codec,
+        'lzma': LzmaCodec,
+    }
+
     email_server_client = HttpEmailServerClient(
         read_api=AppConfig.EMAIL_SERVER_READ_API_HOSTNAME,
         write_api=AppConfig.EMAIL_SERVER_WRITE_API_HOSTNAME,
-        client_id=AppConfig.CLIENT_ID)
+        client_id=AppConfig.CLIENT_ID,
+        connect_timeout=AppConfig.EMAIL_SERVER_CONNECT_TIMEOUT,
+        read_timeout=AppConfig.EMAIL_SERVER_READ_TIMEOUT,
+        retries=AppConfig.EMAIL_SERVER_RETRIES,
+        compress=AppConfig.EMAIL_SERVER_COMPRESSION)
+
+    query_profiler = QueryProfiler(
+        enabled=AppConfig.SQL_PROFILE_ENABLED,
+        slowest=AppConfig.SQL_PROFILE_SLOWEST)
 
     email_store = SqliteEmailStore(
-        database_path=AppConfig.LOCAL_EMAIL_STORE)
+        page_size=AppConfig.EMAILS_PER_PAGE,
+        database_path=AppConfig.LOCAL_EMAIL_STORE,
+        pragmas=AppConfig.SQLITE_PRAGMAS,
+        profiler=query_profiler)
+
+    email_cache = LruCache(
+        maxsize=AppConfig.EMAIL_CACHE_SIZE,
+        ttl=AppConfig.EMAIL_CACHE_TTL_SECONDS)
+
+    if AppConfig.EMAIL_CACHE_ENABLED:
+        email_store = CachedEmailStore(
+            email_store=email_store,
+            cache=email_cache)
+
+    sync_status = SyncStatus(
+        path=AppConfig.SYNC_STATUS_FILE)
 
     email_sync = AzureSync(
         account_name=AppConfig.STORAGE_ACCOUNT_NAME,
         account_key=AppConfig.STORAGE_ACCOUNT_KEY,
         email_server_client=email_server_client,
         container=AppConfig.STORAGE_CONTAINER,
-        serializer=serializer)
+        attachment_encoder=attachment_encoder,
+        serializer=serializer,
+        checkpoint_directory=AppConfig.SYNC_DIRECTORY,
+        on_transfer=sync_status.add_bytes,
+        package_format=package_formats[AppConfig.SYNC_PACKAGE_FORMAT],
+        codec=compression_codecs[AppConfig.SYNC_COMPRESSION](
+            AppConfig.SYNC_COMPRESSION_LEVEL),
+        max_package_bytes=AppConfig.SYNC_MAX_PACKAGE_BYTES,
+        block_size=AppConfig.SYNC_BLOCK_BYTES,
+        retries=AppConfig.SYNC_RETRIES,
+        max_packages=AppConfig.SYNC_MAX_PACKAGES,
+        prefetch=AppConfig.SYNC_PREFETCH_PACKAGES)
 
-    attachment_encoder = Base64AttachmentEncoder()
+    lesson_store = FileSystemLessonStore(
+        root=AppConfig.LESSONS_DIRECTORY)
+
+    sync_worker = SyncWorker(
+        sync=SyncEmails(
+            email_store=email_store,
+            email_sync=email_sync,
+            lesson_store=lesson_store,
+            batch_size=AppConfig.SYNC_BATCH_SIZE,
+            status=sync_status,
+            pipeline_depth=AppConfig.SYNC_PIPELINE_DEPTH),
+        status=sync_status,
+        interval=AppConfig.SYNC_INTERVAL_SECONDS,
+        lock_path=AppConfig.SYNC_LOCK_FILE)
 
     attachments_session = AttachmentsStore(
-        email_store=email_store,
-        attachment_encoder=attachment_encoder)
+        email_store=email_store)
 
 
 def create_app() -> Flask:
@@ -50,4 +121,7 @@ def create_app() -> Flask:
 
     app.babel = Babel(app)
 
+    if AppConfig.SYNC_INTERVAL_SECONDS:
+        app.ioc.sync_worker.start()
+
     return app
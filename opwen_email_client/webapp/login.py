@@ -19,6 +19,7 @@ from sqlalchemy.exc import OperationalError
 from wtforms import IntegerField
 from wtforms.validators import Regexp
 
+from opwen_email_client.util.sqlalchemy import sqlite_pragmas
 from opwen_email_client.util.wtforms import SuffixedStringField
 from opwen_email_client.webapp import app
 from opwen_email_client.webapp.config import AppConfig
@@ -26,6 +27,8 @@ from opwen_email_client.webapp.config import i8n
 
 
 _db = SQLAlchemy(app)
+sqlite_pragmas(_db.get_engine(app), AppConfig.SQLITE_PRAGMAS)
+app.ioc.query_profiler.attach(_db.get_engine(app))
 
 # noinspection PyUnresolvedReferences
 _roles_users = _db.Table(
@@ -1,65 +1,72 @@
 from collections import namedtuple
+from datetime import datetime
 from typing import Dict
 from typing import Iterable
 from typing import Optional
 
+from flask import current_app
 from flask import request
 from flask import session
+from itsdangerous import BadSignature
+from itsdangerous import URLSafeSerializer
 
-from opwen_email_client.domain.email.attachment import AttachmentEncoder
 from opwen_email_client.domain.email.store import EmailStore
 
 
 # noinspection PyClassHasNoInit
-class FileInfo(namedtuple('FileInfo', 'name content')):
+class FileInfo(namedtuple('FileInfo', 'name hash size sent_at')):
     pass
 
 
 class AttachmentsStore(object):
-    def __init__(self, attachment_encoder: AttachmentEncoder,
-                 email_store: EmailStore):
-        self._attachment_encoder = attachment_encoder
+    _salt = 'attachments'
+    _legacy_session_key = 'attachments'
+
+    def __init__(self, email_store: EmailStore):
         self._email_store = email_store
 
     @property
-    def _session_store(self) -> dict:
-        session_attachments = session.get('attachments')
-        if not session_attachments:
-            session_attachments = session['attachments'] = {}
-
-        return session_attachments
+    def _serializer(self) -> URLSafeSerializer:
+        return URLSafeSerializer(current_app.secret_key, salt=self._salt)
 
     def store(self, emails: Iterable[dict]):
-        for i, email in enumerate(emails):
+        if self._legacy_session_key in session:
+            del session[self._legacy_session_key]
+
+        serializer = self._serializer
+        for email in emails:
             email_id = email['_uid']
             attachments = email.get('attachments', [])
-            for j, attachment in enumerate(attachments):
-                attachment_filename = attachment.get('filename', '')
-                attachment_id = '{}-{}'.format(i + 1, attachment_filename)
-                attachment['id'] = attachment_id
-                self._session_store[attachment_id] = (email_id, j)
+            for attachment in attachments:
+                attachment['id'] = serializer.dumps(
+                    [email_id, attachment.get('hash')])
 
-    def lookup(self, attachment_id: str) -> Optional[FileInfo]:
+    def lookup(self, email_address: str,
+               attachment_id: str) -> Optional[FileInfo]:
         try:
-            email_id, attachment_idx = self._session_store[attachment_id]
-        except KeyError:
+            email_id, attachment_hash = self._serializer.loads(attachment_id)
+        except (BadSignature, TypeError, ValueError):
             return None
 
-        email = self._email_store.get(email_id)
-        if email is None:
+        attachment = self._email_store.attachment(email_address, email_id,
+                                                  attachment_hash)
+        if attachment is None or not attachment.get('filename'):
             return None
 
-        attachments = email.get('attachments', [])
-        if attachment_idx >= len(attachments):
-            return None
+        return FileInfo(attachment['filename'], attachment['hash'],
+                        attachment['size'], _parse_date(attachment['sent_at']))
+
+    def stream(self, attachment: FileInfo, start: int,
+               stop: int) -> Iterable[bytes]:
+        return self._email_store.attachment_content(attachment.hash,
+                                                    start, stop)
 
-        attachment = attachments[attachment_idx]  # type: Dict
-        filename = attachment.get('filename')
-        content = attachment.get('content')
-        if not filename or not content:
-            return None
 
-        return FileInfo(filename, self._attachment_encoder.decode(content))
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M')
+    except (TypeError, ValueError):
+        return None
 
 
 class Session(object):
@@ -18,6 +18,21 @@ $(document).ready(function() {
   });
 }());
 
+(function loadEmailBodyOnOpen() {
+  $(".panel-collapse").on("show.bs.collapse", function() {
+    var $body = $(this).find(".email-body");
+    var body_url = $body.data("body_url");
+    if (body_url && !$body.data("loaded")) {
+      $body.data("loaded", true);
+      $.getJSON(body_url, function(email) {
+        $body.html(email.body.replace(/\n/g, "<br>"));
+      }).fail(function() {
+        $body.data("loaded", false);
+      });
+    }
+  });
+}());
+
 (function printEmailOnPrintButtonClick() {
   $(".print-trigger").click(function() {
     var $printRoot = $(this).closest(".print-root");
@@ -1,16 +1,14 @@
 from datetime import datetime
 from datetime import timedelta
-from io import BytesIO
+from mimetypes import guess_type
 from os import path
-from typing import Iterable
-import base64
-from zipfile import ZipFile
-import json
+from typing import Optional
 
 from babel import Locale
 from flask import Response
 from flask import abort
 from flask import flash
+from flask import jsonify
 from flask import redirect
 from flask import render_template
 from flask import request
@@ -18,18 +16,20 @@ from flask import send_file
 from flask import send_from_directory
 from flask import url_for
 from flask_login import current_user
+from werkzeug.datastructures import ContentRange
+from werkzeug.datastructures import Range
+from werkzeug.http import is_resource_modified
 
-from opwen_email_client.util.generator import length
 from opwen_email_client.util.pagination import Pagination
 from opwen_email_client.webapp import app
 from opwen_email_client.webapp.actions import SendWelcomeEmail
-from opwen_email_client.webapp.actions import SyncEmails
 from opwen_email_client.webapp.config import AppConfig
 from opwen_email_client.webapp.config import i8n
 from opwen_email_client.webapp.forms import NewEmailForm
 from opwen_email_client.webapp.login import User
 from opwen_email_client.webapp.login import admin_required
 from opwen_email_client.webapp.login import login_required
+from opwen_email_client.webapp.session import FileInfo
 from opwen_email_client.webapp.session import Session
 
 
@@ -54,45 +54,49 @@ def about() -> Response:
 
 @app.route('/email')
 @app.route('/email/inbox', defaults={'page': 1})
-@app.route('/email/inbox/<int:page>')
+@app.route('/email/inbox/<int(min=1):page>')
 @login_required
 def email_inbox(page: int) -> Response:
     email_store = app.ioc.email_store
     user = current_user
+    cursor = request.args.get('cursor')
 
-    return _emails_view(email_store.inbox(user.email), page)
+    return _emails_view(email_store.inbox(user.email, page, cursor), page)
 
 
 @app.route('/email/outbox', defaults={'page': 1})
-@app.route('/email/outbox/<int:page>')
+@app.route('/email/outbox/<int(min=1):page>')
 @login_required
 def email_outbox(page: int) -> Response:
     email_store = app.ioc.email_store
     user = current_user
+    cursor = request.args.get('cursor')
 
-    return _emails_view(email_store.outbox(user.email), page)
+    return _emails_view(email_store.outbox(user.email, page, cursor), page)
 
 
 @app.route('/email/sent', defaults={'page': 1})
-@app.route('/email/sent/<int:page>')
+@app.route('/email/sent/<int(min=1):page>')
 @login_required
 def email_sent(page: int) -> Response:
     email_store = app.ioc.email_store
     user = current_user
+    cursor = request.args.get('cursor')
 
-    return _emails_view(email_store.sent(user.email), page)
+    return _emails_view(email_store.sent(user.email, page, cursor), page)
 
 
 @app.route('/email/search', defaults={'page': 1})
-@app.route('/email/search/<int:page>')
+@app.route('/email/search/<int(min=1):page>')
 @login_required
 def email_search(page: int) -> Response:
     email_store = app.ioc.email_store
     user = current_user
     query = request.args.get('query')
+    cursor = request.args.get('cursor')
 
-    return _emails_view(email_store.search(user.email, query), page,
-                        'email_search.html')
+    return _emails_view(email_store.search(user.email, query, page, cursor),
+                        page, 'email_search.html')
 
 
 @app.route('/email/read/<email_uid>')
@@ -106,6 +110,19 @@ def email_read(email_uid: str) -> Response:
     return Response('OK', status=200, mimetype='text/plain')
 
 
+@app.route('/email/body/<email_uid>')
+@login_required
+def email_body(email_uid: str) -> Response:
+    email_store = app.ioc.email_store
+    user = current_user
+
+    body = email_store.body(user.email, email_uid)
+    if body is None:
+        return abort(404)
+
+    return jsonify(body=body)
+
+
 @app.route('/email/delete/<email_uid>')
 @login_required
 def email_delete(email_uid: str) -> Response:
@@ -121,14 +138,15 @@ def email_delete(email_uid: str) -> Response:
 @login_required
 def email_new() -> Response:
     email_store = app.ioc.email_store
-    attachment_encoder = app.ioc.attachment_encoder
+    lesson_store = app.ioc.lesson_store
 
     form = NewEmailForm.from_request(email_store)
     if form is None:
         return abort(404)
 
     if form.validate_on_submit():
-        email_store.create([form.as_dict(attachment_encoder)])
+        email = form.as_dict()
+        email_store.create(lesson_store.extract_all([email]))
         flash(i8n.EMAIL_SENT, category='success')
         return redirect(url_for('email_inbox'))
 
@@ -139,14 +157,57 @@ def email_new() -> Response:
 @login_required
 def download_attachment(attachment_id: str) -> Response:
     attachments_session = app.ioc.attachments_session
+    user = current_user
 
-    attachment = attachments_session.lookup(attachment_id)
+    attachment = attachments_session.lookup(user.email, attachment_id)
     if attachment is None:
         return abort(404)
 
-    return send_file(BytesIO(attachment.content),
-                     attachment_filename=attachment.name,
-                     as_attachment=True)
+    if not is_resource_modified(request.environ,
+                                etag=attachment.hash,
+                                last_modified=attachment.sent_at):
+        response = Response(status=304)
+        _set_attachment_headers(response, attachment)
+        return response
+
+    start, stop, status = 0, attachment.size, 200
+    byte_range = _requested_range(attachment)
+    if byte_range is not None:
+        byte_range = byte_range.range_for_length(attachment.size)
+        if byte_range is None:
+            response = Response(status=416)
+            response.headers['Content-Range'] = 'bytes */{}'.format(
+                attachment.size)
+            return response
+        start, stop = byte_range
+        status = 206
+
+    mimetype = guess_type(attachment.name)[0] or 'application/octet-stream'
+    response = Response(attachments_session.stream(attachment, start, stop),
+                        status=status,
+                        mimetype=mimetype,
+                        direct_passthrough=True)
+    response.content_length = stop - start
+    if status == 206:
+        response.content_range = ContentRange('bytes', start, stop,
+                                              attachment.size)
+    _set_attachment_headers(response, attachment)
+    return response
+
+
+@app.route('/lesson/<lesson_id>/<int:slide>')
+@login_required
+def lesson_slide(lesson_id: str, slide: int) -> Response:
+    lesson_store = app.ioc.lesson_store
+
+    slide = lesson_store.slide(lesson_id, slide)
+    if slide is None:
+        return abort(404)
+
+    return send_file(slide['path'],
+                     mimetype=slide['mimetype'],
+                     conditional=True,
+                     cache_timeout=AppConfig.LESSON_SLIDE_CACHE_SECONDS)
 
 
 @app.route('/register_complete')
@@ -190,14 +251,20 @@ def logout_complete() -> Response:
 @app.route('/sync')
 @admin_required
 def sync() -> Response:
-    sync_emails = SyncEmails(
-        email_sync=app.ioc.email_sync,
-        email_store=app.ioc.email_store)
+    sync_worker = app.ioc.sync_worker
 
-    sync_emails()
+    sync_worker.enqueue()
 
-    flash(i8n.SYNC_COMPLETE, category='success')
-    return redirect(url_for('home'))
+    flash(i8n.SYNC_QUEUED, category='success')
+    return redirect(url_for('admin'))
+
+
+@app.route('/sync/status')
+@admin_required
+def sync_status() -> Response:
+    sync_status = app.ioc.sync_status
+
+    return jsonify(sync_status.as_dict())
 
 
 @app.route('/user/language/<locale>')
@@ -216,7 +283,12 @@ def admin() -> Response:
 
     return _view('admin.html',
                  users=User.query.all(),
-                 pending_emails=length(email_store.pending()))
+                 pending_emails=email_store.count_pending(),
+                 attachment_bytes=email_store.attachment_bytes(),
+                 email_cache=(app.ioc.email_cache.stats()
+                              if AppConfig.EMAIL_CACHE_ENABLED else None),
+                 email_server=app.ioc.email_server_client.stats(),
+                 sync_status=app.ioc.sync_status.as_dict())
 
 
 @app.route('/admin/suspend/<userid>')
@@ -281,12 +353,55 @@ def _inject_locales() -> dict:
     }
 
 
+@app.context_processor
+def _inject_unread_emails() -> dict:
+    return {
+        'unread_emails': _unread_emails,
+    }
+
+
+def _unread_emails() -> int:
+    if not current_user.is_authenticated:
+        return 0
+
+    email_store = app.ioc.email_store
+    return email_store.count_unread(current_user.email)
+
+
 @app.after_request
 def _store_last_visited_url(response: Response) -> Response:
     Session.store_last_visited_url()
     return response
 
 
+@app.before_request
+def _start_query_profile():
+    query_profiler = app.ioc.query_profiler
+    if query_profiler.enabled:
+        query_profiler.start()
+
+
+@app.after_request
+def _report_query_profile(response: Response) -> Response:
+    query_profiler = app.ioc.query_profiler
+    if not query_profiler.enabled:
+        return response
+
+    profile = query_profiler.stop()
+    if profile is None:
+        return response
+
+    response.headers['X-SQL-Query-Count'] = str(profile['count'])
+    response.headers['X-SQL-Query-Time'] = '{:.3f}'.format(profile['seconds'])
+
+    app.logger.info('%s: %d queries in %.3fs', request.path,
+                    profile['count'], profile['seconds'])
+    for query in profile['slowest']:
+        app.logger.debug('%.3fs: %s', query['seconds'], query['statement'])
+
+    return response
+
+
 @app.babel.localeselector
 def _localeselector() -> str:
     current_language = Session.get_current_language()
@@ -297,39 +412,67 @@ def _localeselector() -> str:
     return current_language
 
 
-def _emails_view(emails: Iterable[dict], page: int,
+def _requested_range(attachment: FileInfo) -> Optional[Range]:
+    byte_range = request.range
+    if byte_range is None or len(byte_range.ranges) != 1:
+        return None
+
+    if_range = request.if_range
+    if if_range.etag is not None and if_range.etag != attachment.hash:
+        return None
+    if if_range.date is not None and (
+            attachment.sent_at is None
+            or attachment.sent_at.replace(microsecond=0) > if_range.date):
+        return None
+
+    return byte_range
+
+
+def _set_attachment_headers(response: Response, attachment: FileInfo):
+    response.set_etag(attachment.hash)
+    if attachment.sent_at is not None:
+        response.last_modified = attachment.sent_at
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers.set('Content-Disposition', 'attachment',
+                         filename=attachment.name)
+
+
+def _emails_view(emails: Pagination, page: int,
                  template: str='email.html') -> Response:
+    lesson_store = app.ioc.lesson_store
     attachments_session = app.ioc.attachments_session
     timezone_offset = timedelta(minutes=current_user.timezone_offset_minutes)
 
-    if page < 1:
-        return abort(404)
-
-    emails = Pagination(emails, page, AppConfig.EMAILS_PER_PAGE)
-
     for email in emails:
         sent_at = email.get('sent_at')
         if sent_at:
             sent_at_utc = datetime.strptime(sent_at, '%Y-%m-%d %H:%M')
             sent_at_local = sent_at_utc - timezone_offset
             email['sent_at'] = sent_at_local.strftime('%Y-%m-%d %H:%M')
-        if email.get('attachments'):
-            for attachment in email.get('attachments'):
-                if attachment.get('filename').endswith('.lesson'):
-                    b64_encoded_zip = attachment.get('content')
-                    zip_content = BytesIO(base64.b64decode(b64_encoded_zip))
-                    with ZipFile(zip_content) as zip_file:
-                        with zip_file.open('index.json') as lesson_json:
-                            lesson_manifest = json.loads(lesson_json.read().decode("utf-8"))
-                            # Loop over the slides and read the content of the image files
-                            for slide in lesson_manifest['slides']:
-                                with zip_file.open(slide['imageFile']) as image_file:
-                                    slide['image'] = 'data:image/gif;base64,' + base64.b64encode(image_file.read()).decode()
-                            attachment['lesson'] = lesson_manifest
+        for attachment in email.get('attachments', []):
+            if lesson_store.is_lesson(attachment):
+                attachment['lesson'] = _lookup_lesson(email, attachment)
 
     attachments_session.store(emails)
     return _view(template, emails=emails, page=page)
 
 
+def _lookup_lesson(email: dict, attachment: dict) -> Optional[dict]:
+    email_store = app.ioc.email_store
+    lesson_store = app.ioc.lesson_store
+
+    lesson = lesson_store.lookup(attachment.get('hash'))
+    if lesson is not None:
+        return lesson
+
+    stored_email = email_store.get(email['_uid']) or {}
+    for stored_attachment in stored_email.get('attachments', []):
+        if stored_attachment['filename'] == attachment['filename']:
+            lesson_id = lesson_store.extract(stored_attachment['content'])
+            return lesson_store.lookup(lesson_id)
+
+    return None
+
+
 def _view(template: str, **kwargs) -> Response:
     return render_template(template, **kwargs)
@@ -0,0 +1,169 @@
+from contextlib import contextmanager
+from datetime import datetime
+from logging import Logger
+from logging import getLogger
+from queue import Empty
+from queue import Full
+from queue import Queue
+from threading import Lock
+from threading import Thread
+from time import sleep
+from typing import Callable
+from typing import Iterator
+from typing import Optional
+
+from opwen_email_client.util.os import file_lock
+from opwen_email_client.util.os import replace_file
+from opwen_email_client.util.serialization import JsonSerializer
+
+
+class SyncStatus(object):
+    idle = 'idle'
+    starting = 'starting'
+    uploading = 'uploading'
+    downloading = 'downloading'
+    syncing = 'syncing'
+
+    _serializer = JsonSerializer()
+
+    def __init__(self, path: Optional[str]=None):
+        self._lock = Lock()
+        self._path = path
+        self._status = {
+            'phase': self.idle,
+            'queued': False,
+            'emails_uploaded': 0,
+            'emails_downloaded': 0,
+            'emails_per_second': None,
+            'bytes_transferred': 0,
+            'started_at': None,
+            'finished_at': None,
+            'last_error': None,
+        }
+
+    def update(self, **status):
+        with self._changing() as current:
+            current.update(status)
+
+    def increment(self, key: str, amount: int):
+        with self._changing() as current:
+            current[key] += amount
+
+    def add_bytes(self, amount: int):
+        self.increment('bytes_transferred', amount)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return self._load()
+
+    @contextmanager
+    def _changing(self) -> Iterator[dict]:
+        with self._lock:
+            if self._path is None:
+                yield self._status
+                return
+
+            with file_lock('{}.lock'.format(self._path), blocking=True):
+                status = self._load()
+                yield status
+                replace_file(self._path, self._serializer.serialize(status))
+
+    def _load(self) -> dict:
+        status = dict(self._status)
+        if self._path is None:
+            return status
+
+        try:
+            with open(self._path, 'rb') as fobj:
+                status.update(self._serializer.deserialize(fobj.read()))
+        except (OSError, ValueError):
+            pass
+
+        return status
+
+
+class SyncWorker(object):
+    def __init__(self, sync: Callable[[], None], status: SyncStatus,
+                 interval: int=0, lock_path: Optional[str]=None,
+                 poll_seconds: float=5, log: Logger=None):
+        self._sync = sync
+        self._status = status
+        self._interval = interval
+        self._lock_path = lock_path
+        self._poll_seconds = poll_seconds
+        self._log = log or getLogger(__name__)
+        self._queue = Queue(maxsize=1)
+        self._lock = Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+
+            self._thread = Thread(target=self._run, name='sync-worker')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def enqueue(self) -> bool:
+        self.start()
+        self._status.update(queued=True)
+
+        try:
+            self._queue.put_nowait(True)
+        except Full:
+            return False
+
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                self._queue.get(timeout=self._interval or None)
+            except Empty:
+                pass
+
+            self.run_once()
+
+    def run_once(self):
+        if not self._lock_path:
+            self._run_once()
+            return
+
+        while True:
+            with file_lock(self._lock_path) as locked:
+                if locked:
+                    self._run_once()
+                    return
+
+            if not self._status.as_dict()['queued']:
+                self._log.info('Sync already running in another process')
+                return
+
+            sleep(self._poll_seconds)
+
+    def _run_once(self):
+        self._status.update(
+            phase=SyncStatus.starting,
+            queued=False,
+            emails_uploaded=0,
+            emails_downloaded=0,
+            emails_per_second=None,
+            bytes_transferred=0,
+            started_at=_now(),
+            finished_at=None)
+
+        try:
+            self._sync()
+        except Exception as ex:
+            self._log.exception('Sync failed')
+            self._status.update(last_error='{}: {}'.format(
+                ex.__class__.__name__, ex))
+        else:
+            self._status.update(last_error=None)
+        finally:
+            self._status.update(phase=SyncStatus.idle, finished_at=_now())
+
+
+def _now() -> str:
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
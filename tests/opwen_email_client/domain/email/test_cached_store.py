@@ -0,0 +1,141 @@
+from os import remove
+from tempfile import NamedTemporaryFile
+
+from opwen_email_client.domain.email.cached_store import CachedEmailStore
+from opwen_email_client.domain.email.sql_store import SqliteEmailStore
+from opwen_email_client.util.cache import LruCache
+from tests.opwen_email_client.domain.email.test_store import Base
+
+
+class CachedEmailStoreTests(Base.EmailStoreTests):
+    store_location = None
+
+    def create_email_store(self):
+        self.sql_store = SqliteEmailStore(self.store_location, self.page_size)
+        self.cache = LruCache()
+        return CachedEmailStore(self.sql_store, self.cache)
+
+    @classmethod
+    def setUpClass(cls):
+        with NamedTemporaryFile(delete=False) as fobj:
+            cls.store_location = fobj.name
+
+    @classmethod
+    def tearDownClass(cls):
+        remove(cls.store_location)
+
+    def tearDown(self):
+        with self.sql_store._dbwrite() as db:
+            for table in reversed(self.sql_store._base.metadata.sorted_tables):
+                db.execute(table.delete())
+            if self.sql_store._has_search_index:
+                db.execute('DELETE FROM email_search')
+
+    def test_repeated_reads_are_served_from_cache(self):
+        self.given_emails({'to': ['foo@bar.com'], 'subject': 'foo'})
+
+        self.email_store.inbox('foo@bar.com', page=1)
+        self.email_store.inbox('foo@bar.com', page=1)
+
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_cached_results_are_copies(self):
+        self.given_emails({'to': ['foo@bar.com'], 'subject': 'foo'})
+
+        for email in self.email_store.inbox('foo@bar.com', page=1):
+            email['subject'] = 'changed'
+        emails = list(self.email_store.inbox('foo@bar.com', page=1))
+
+        self.assertEqual(emails[0]['subject'], 'foo')
+
+    def test_writes_only_invalidate_affected_addresses(self):
+        self.given_emails({'to': ['foo@bar.com'], 'subject': 'foo'})
+        self.email_store.count_inbox('foo@bar.com')
+        self.email_store.count_inbox('baz@bar.com')
+
+        self.given_emails({'to': ['foo@bar.com'], 'subject': 'bar'})
+
+        self.assertEqual(self.email_store.count_inbox('foo@bar.com'), 2)
+        self.assertEqual(self.email_store.count_inbox('baz@bar.com'), 0)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_mark_read_invalidates_all_participants(self):
+        emails = self.given_emails(
+            {'to': ['foo@bar.com'], 'cc': ['baz@bar.com'], 'subject': 'foo'})
+        self.email_store.count_unread('baz@bar.com')
+
+        self.email_store.mark_read('foo@bar.com', emails)
+
+        self.assertEqual(self.email_store.count_unread('baz@bar.com'), 0)
+
+    def test_external_writes_clear_the_cache(self):
+        self.given_emails({'to': ['foo@bar.com'], 'subject': 'foo'})
+        self.email_store.count_inbox('foo@bar.com')
+
+        other_store = SqliteEmailStore(self.store_location)
+        other_store.create([{'to': ['foo@bar.com'], 'subject': 'bar'}])
+
+        self.assertEqual(self.email_store.count_inbox('foo@bar.com'), 2)
+
+    def test_external_writes_are_not_hidden_by_local_writes(self):
+        self.given_emails({'to': ['foo@bar.com'], 'subject': 'foo'})
+        self.email_store.count_inbox('foo@bar.com')
+
+        other_store = SqliteEmailStore(self.store_location)
+        other_store.create([{'to': ['foo@bar.com'], 'subject': 'bar'}])
+        self.given_emails({'to': ['baz@bar.com'], 'subject': 'baz'})
+
+        self.assertEqual(self.email_store.count_inbox('foo@bar.com'), 2)
+
+    def test_external_writes_during_local_writes_clear_the_cache(self):
+        self.given_emails({'to': ['foo@bar.com'], 'subject': 'foo'})
+        self.email_store.count_inbox('foo@bar.com')
+
+        other_store = SqliteEmailStore(self.store_location)
+        create = self.sql_store.create
+
+        def create_with_external_write(emails):
+            created = create(emails)
+            other_store.create([{'to': ['foo@bar.com'], 'subject': 'bar'}])
+            return created
+
+        self.sql_store.create = create_with_external_write
+        self.given_emails({'to': ['baz@bar.com'], 'subject': 'baz'})
+
+        self.assertEqual(self.email_store.count_inbox('foo@bar.com'), 2)
+
+    def test_loads_interleaved_with_writes_are_not_cached(self):
+        self.given_emails({'to': ['foo@bar.com'], 'subject': 'foo'})
+
+        inbox = self.sql_store.inbox
+
+        def inbox_with_concurrent_write(*args):
+            emails = inbox(*args)
+            self.sql_store.inbox = inbox
+            self.given_emails({'to': ['foo@bar.com'], 'subject': 'bar'})
+            return emails
+
+        self.sql_store.inbox = inbox_with_concurrent_write
+        stale = list(self.email_store.inbox('foo@bar.com', page=1))
+        fresh = list(self.email_store.inbox('foo@bar.com', page=1))
+
+        self.assertEqual([_['subject'] for _ in stale], ['foo'])
+        self.assertEqual(len(fresh), 2)
+
+    def test_create_invalidates_unknown_uids(self):
+        self.assertIsNone(self.email_store.get('uid-1'))
+
+        self.email_store.create([{'_uid': 'uid-1', 'subject': 'foo'}])
+
+        self.assertEqual(self.email_store.get('uid-1')['subject'], 'foo')
+
+    def test_attachment_content_is_not_cached(self):
+        emails = self.given_emails(
+            {'to': ['foo@bar.com'],
+             'attachments': [{'filename': 'foo.txt', 'content': b'foo'}]})
+
+        self.email_store.get(emails[0]['_uid'])
+        email = self.email_store.get(emails[0]['_uid'])
+
+        self.assertEqual(email['attachments'][0]['content'], b'foo')
+        self.assertEqual(self.cache.stats()['size'], 0)
@@ -0,0 +1,107 @@
+from gzip import decompress as gzip_decompress
+from json import loads
+from unittest import TestCase
+from unittest.mock import Mock
+
+from requests import ConnectionError
+from requests import HTTPError
+
+from opwen_email_client.domain.email.client import HttpEmailServerClient
+
+
+class HttpEmailServerClientTests(TestCase):
+    def setUp(self):
+        self.session_mock = Mock()
+        self.client = self.create_client()
+
+    def create_client(self, **kwargs) -> HttpEmailServerClient:
+        return HttpEmailServerClient(
+            read_api='read', write_api='write', client_id='client',
+            session=self.session_mock, connect_timeout=1, read_timeout=2,
+            **kwargs)
+
+    def given_response(self, payload: dict=None):
+        response = Mock()
+        response.json.return_value = payload or {}
+        self.session_mock.request.return_value = response
+        return response
+
+    def test_upload(self):
+        self.given_response()
+
+        self.client.upload('resource', 'container')
+
+        (method, url), kwargs = self.session_mock.request.call_args
+        self.assertEqual(method, 'POST')
+        self.assertEqual(url, 'http://write/api/email/lokole/client')
+        self.assertEqual(kwargs['timeout'], (1, 2))
+        self.assertEqual(loads(kwargs['data'].decode('utf-8')), {
+            'resource_id': 'resource',
+            'container_name': 'container',
+            'resource_type': 'azure-blob',
+        })
+
+    def test_upload_compresses_body(self):
+        self.given_response()
+
+        self.create_client(compress=True).upload('resource', 'container')
+
+        kwargs = self.session_mock.request.call_args[1]
+        self.assertEqual(kwargs['headers']['Content-Encoding'], 'gzip')
+        self.assertEqual(loads(gzip_decompress(kwargs['data']).decode(
+            'utf-8'))['resource_id'], 'resource')
+
+    def test_download(self):
+        self.given_response({'resource_id': 'resource',
+                             'resource_container': 'container',
+                             'resource_type': 'azure-blob'})
+
+        downloaded = self.client.download()
+
+        (method, url), kwargs = self.session_mock.request.call_args
+        self.assertEqual(method, 'GET')
+        self.assertEqual(url, 'http://read/api/email/lokole/client')
+        self.assertEqual(downloaded, ('resource', 'container'))
+
+    def test_download_rejects_unsupported_resource_type(self):
+        self.given_response({'resource_type': 'ftp'})
+
+        with self.assertRaises(ValueError):
+            self.client.download()
+
+    def test_stats_record_latency_per_call(self):
+        self.given_response()
+        self.client.download()
+        self.client.download()
+        self.session_mock.request.side_effect = ConnectionError()
+        with self.assertRaises(ConnectionError):
+            self.client.upload('resource', 'container')
+
+        stats = self.client.stats()
+
+        self.assertEqual(stats['download']['calls'], 2)
+        self.assertEqual(stats['download']['errors'], 0)
+        self.assertEqual(stats['upload']['calls'], 1)
+        self.assertEqual(stats['upload']['errors'], 1)
+        self.assertIsNotNone(stats['upload']['average_seconds'])
+
+    def test_http_errors_are_raised(self):
+        response = self.given_response()
+        response.raise_for_status.side_effect = HTTPError()
+
+        with self.assertRaises(HTTPError):
+            self.client.download()
+
+        self.assertEqual(self.client.stats()['download']['errors'], 1)
+
+    def test_default_session_retries_with_backoff(self):
+        client = HttpEmailServerClient('read', 'write', 'client', retries=4,
+                                       backoff_factor=0.1)
+
+        retry = client._session.get_adapter('http://read').max_retries
+
+        self.assertEqual(retry.total, 4)
+        self.assertEqual(retry.backoff_factor, 0.1)
+        self.assertIn(503, retry.status_forcelist)
+        self.assertTrue(retry.is_retry('GET', 503))
+        self.assertFalse(retry.is_retry('POST', 503))
@@ -0,0 +1,97 @@
+from io import BytesIO
+from json import dumps
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+from zipfile import ZipFile
+
+from opwen_email_client.domain.email.lesson import FileSystemLessonStore
+
+
+class FileSystemLessonStoreTests(TestCase):
+    def setUp(self):
+        self.root = mkdtemp()
+        self.lesson_store = FileSystemLessonStore(self.root)
+
+    def tearDown(self):
+        rmtree(self.root)
+
+    def given_lesson(self, *slides) -> bytes:
+        buffer = BytesIO()
+        with ZipFile(buffer, 'w') as lesson_zip:
+            manifest = {'slides': []}
+            for i, (text, image) in enumerate(slides):
+                image_file = 'slide{}.tmp'.format(i)
+                lesson_zip.writestr(image_file, image)
+                manifest['slides'].append({'text': text,
+                                           'imageFile': image_file})
+            lesson_zip.writestr('index.json', dumps(manifest))
+        return buffer.getvalue()
+
+    def test_extract(self):
+        content = self.given_lesson(('first', b'GIF89a'), ('second', b'\x89PNG'))
+
+        lesson_id = self.lesson_store.extract(content)
+        lesson = self.lesson_store.lookup(lesson_id)
+
+        self.assertEqual(lesson['id'], lesson_id)
+        self.assertEqual([_['text'] for _ in lesson['slides']], ['first', 'second'])
+        self.assertEqual([_['mimetype'] for _ in lesson['slides']], ['image/gif', 'image/png'])
+
+    def test_extract_is_content_addressed(self):
+        content = self.given_lesson(('first', b'GIF89a'))
+
+        lesson_id1 = self.lesson_store.extract(content)
+        lesson_id2 = self.lesson_store.extract(content)
+
+        self.assertEqual(lesson_id1, lesson_id2)
+
+    def test_extract_invalid_lesson(self):
+        self.assertIsNone(self.lesson_store.extract(b'not a zip file'))
+
+    def test_extract_encrypted_lesson(self):
+        content = given_encrypted_lesson()
+
+        with self.assertLogs('opwen_email_client.domain.email.lesson'):
+            self.assertIsNone(self.lesson_store.extract(content))
+
+    def test_is_lesson_without_filename(self):
+        self.assertFalse(self.lesson_store.is_lesson({'filename': None}))
+        self.assertFalse(self.lesson_store.is_lesson({}))
+
+    def test_extract_all(self):
+        content = self.given_lesson(('first', b'GIF89a'))
+        emails = [{'attachments': [{'filename': 'foo.lesson', 'content': content}]},
+                  {'subject': 'no attachments'}]
+
+        extracted = list(self.lesson_store.extract_all(emails))
+
+        self.assertEqual(extracted, emails)
+        lesson_id = self.lesson_store.extract(content)
+        self.assertIsNotNone(self.lesson_store.lookup(lesson_id))
+
+    def test_slide(self):
+        content = self.given_lesson(('first', b'GIF89a'))
+        lesson_id = self.lesson_store.extract(content)
+
+        slide = self.lesson_store.slide(lesson_id, 0)
+
+        with open(slide['path'], 'rb') as fobj:
+            self.assertEqual(fobj.read(), b'GIF89a')
+        self.assertIsNone(self.lesson_store.slide(lesson_id, 1))
+
+    def test_lookup_rejects_invalid_ids(self):
+        self.assertIsNone(self.lesson_store.lookup('../etc'))
+        self.assertIsNone(self.lesson_store.lookup(None))
+        self.assertIsNone(self.lesson_store.lookup('0' * 64))
+
+
+def given_encrypted_lesson() -> bytes:
+    buffer = BytesIO()
+    with ZipFile(buffer, 'w') as lesson_zip:
+        lesson_zip.writestr('index.json', dumps({'slides': []}))
+
+    content = bytearray(buffer.getvalue())
+    for signature, offset in ((b'PK\x03\x04', 6), (b'PK\x01\x02', 8)):
+        content[content.index(signature) + offset] |= 0x1
+    return bytes(content)
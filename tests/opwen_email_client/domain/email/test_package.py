@@ -0,0 +1,95 @@
+from abc import ABCMeta
+from abc import abstractmethod
+from io import BytesIO
+from unittest import TestCase
+
+from opwen_email_client.domain.email.attachment import Base64AttachmentEncoder
+from opwen_email_client.domain.email.package import BinaryPackage
+from opwen_email_client.domain.email.package import JsonLinesPackage
+from opwen_email_client.domain.email.package import PackageFormat
+from opwen_email_client.domain.email.package import read_package
+from opwen_email_client.util.serialization import JsonSerializer
+
+
+class Base(object):
+    class PackageFormatTests(TestCase, metaclass=ABCMeta):
+        items = [
+            {'_uid': '1', 'subject': 'foo'},
+            {'_uid': '2', 'attachments': [
+                {'filename': 'foo.txt', 'content': b'\x00foo\n'},
+                {'filename': 'empty.txt', 'content': b''}]},
+            {'_uid': '3', 'subject': 'bar'},
+        ]
+
+        @abstractmethod
+        def create_package_format(self) -> PackageFormat:
+            raise NotImplementedError
+
+        def setUp(self):
+            self.package_format = self.create_package_format()
+
+        def given_package(self) -> BytesIO:
+            package = BytesIO()
+            self.package_format.start(package)
+            for item in self.items:
+                self.package_format.write(package, item)
+            package.seek(0)
+            return package
+
+        def test_roundtrip(self):
+            package = self.given_package()
+
+            items = list(self.package_format.read(package))
+
+            self.assertEqual(items, self.items)
+
+        def test_read_from_offset(self):
+            package = self.given_package()
+
+            items = list(self.package_format.read(package, offset=2))
+
+            self.assertEqual(items, self.items[2:])
+
+        def test_read_package_detects_format(self):
+            package = self.given_package()
+
+            items = list(read_package(package, package_formats()))
+            package.seek(0)
+            reversed_items = list(read_package(
+                package, reversed(package_formats())))
+
+            self.assertEqual(items, self.items)
+            self.assertEqual(reversed_items, self.items)
+
+
+class JsonLinesPackageTests(Base.PackageFormatTests):
+    def create_package_format(self):
+        return JsonLinesPackage(JsonSerializer(), Base64AttachmentEncoder())
+
+
+class BinaryPackageTests(Base.PackageFormatTests):
+    def create_package_format(self):
+        return BinaryPackage(JsonSerializer())
+
+    def test_attachments_are_not_base64_encoded(self):
+        package = BinaryPackage(JsonSerializer())
+        content = bytes(range(256)) * 4
+        buffer = BytesIO()
+
+        package.start(buffer)
+        package.write(buffer, {'attachments': [{'content': content}]})
+
+        self.assertIn(content, buffer.getvalue())
+        self.assertLess(len(buffer.getvalue()), len(content) + 64)
+
+    def test_rejects_truncated_package(self):
+        package = self.given_package()
+        truncated = BytesIO(package.getvalue()[:-3])
+
+        with self.assertRaises(ValueError):
+            list(self.package_format.read(truncated))
+
+
+def package_formats():
+    return [BinaryPackage(JsonSerializer()),
+            JsonLinesPackage(JsonSerializer(), Base64AttachmentEncoder())]
@@ -1,15 +1,23 @@
+from hashlib import sha256
 from os import remove
+from sqlite3 import connect
 from tempfile import NamedTemporaryFile
 
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
 from opwen_email_client.domain.email.sql_store import SqliteEmailStore
+from opwen_email_client.util.sqlalchemy import QueryProfiler
 from tests.opwen_email_client.domain.email.test_store import Base
 
 
 class SqliteEmailStoreTests(Base.EmailStoreTests):
     store_location = None
+    batch_size = 2
 
     def create_email_store(self):
-        return SqliteEmailStore(self.store_location)
+        return SqliteEmailStore(self.store_location, self.page_size,
+                                self.batch_size)
 
     @classmethod
     def setUpClass(cls):
@@ -27,3 +35,326 @@ class SqliteEmailStoreTests(Base.EmailStoreTests):
         with dbwrite() as db:
             for table in reversed(base.metadata.sorted_tables):
                 db.execute(table.delete())
+            if self.email_store._has_search_index:
+                db.execute('DELETE FROM email_search')
+
+    def test_search_ranks_subject_matches_first(self):
+        if not self.email_store._has_search_index:
+            self.skipTest('search index is disabled')
+
+        emails = self.given_emails(
+            {'to': ['foo@bar.com'], 'subject': 'hello', 'body': 'koala'},
+            {'to': ['foo@bar.com'], 'subject': 'koala', 'body': 'hello'})
+
+        results = list(self.email_store.search('foo@bar.com', 'koala'))
+
+        self.assertEqual([_['_uid'] for _ in results],
+                         [emails[1]['_uid'], emails[0]['_uid']])
+
+    def test_search_index_is_removed_on_delete(self):
+        emails = self.given_emails(
+            {'to': ['foo@bar.com'], 'subject': 'koala'})
+
+        self.email_store.delete('foo@bar.com', emails)
+        results = list(self.email_store.search('foo@bar.com', 'koala'))
+
+        self.assertEqual(results, [])
+
+    def test_create_shares_addresses_and_attachments(self):
+        attachment = {'filename': 'foo.txt', 'content': b'foo.txt'}
+        self.given_emails(*[
+            {'to': ['foo@bar.com', 'Baz@bar.com'], 'cc': ['foo@bar.com'],
+             'subject': 'koala {}'.format(i), 'attachments': [attachment]}
+            for i in range(5)])
+
+        with self.email_store._dbread() as db:
+            addresses = db.execute('SELECT address FROM address').fetchall()
+            recipients = db.execute('SELECT * FROM recipient').fetchall()
+            attachments = db.execute('SELECT id FROM attachment').fetchall()
+            links = db.execute('SELECT * FROM emailattachment').fetchall()
+
+        self.assertEqual(sorted(_[0] for _ in addresses),
+                         ['baz@bar.com', 'foo@bar.com'])
+        self.assertEqual(len(recipients), 15)
+        self.assertEqual(len(attachments), 1)
+        self.assertEqual(len(links), 5)
+        self.assertEqual(
+            len(list(self.email_store.search('baz@bar.com', 'koala'))), 5)
+
+    def test_attachment_content_is_stored_once_per_hash(self):
+        content = b'x' * 1000
+        emails = self.given_emails(
+            {'to': ['foo@bar.com'],
+             'attachments': [{'filename': 'a.pdf', 'content': content}]},
+            {'to': ['foo@bar.com'],
+             'attachments': [{'filename': 'b.pdf', 'content': content}]})
+
+        with self.email_store._dbread() as db:
+            contents = db.execute('SELECT hash FROM attachmentcontent')
+            contents = contents.fetchall()
+
+        self.assertEqual(len(contents), 1)
+        self.assertEqual(self.email_store.attachment_bytes(), len(content))
+        self.assertEqual(
+            [self.email_store.get(email['_uid'])['attachments']
+             for email in emails],
+            [[{'filename': 'a.pdf', 'content': content}],
+             [{'filename': 'b.pdf', 'content': content}]])
+
+        self.email_store.delete('foo@bar.com', emails[:1])
+        self.assertEqual(self.email_store.attachment_bytes(), len(content))
+
+        self.email_store.delete('foo@bar.com', emails[1:])
+        self.assertEqual(self.email_store.attachment_bytes(), 0)
+
+    def test_uid_operations_scale_to_large_uid_sets(self):
+        self.email_store._batch_size = 500
+        emails = self.given_emails(
+            {'from': 'foo@bar.com', 'to': ['baz@bar.com'], 'subject': 'a'},
+            {'from': 'foo@bar.com', 'to': ['baz@bar.com'], 'subject': 'b'})
+        uids = ['unknown-{}'.format(i) for i in range(10000)]
+        uids.extend(email['_uid'] for email in emails)
+
+        self.email_store.mark_sent(uids)
+        self.email_store.mark_read('baz@bar.com', uids)
+        pending = list(self.email_store.pending())
+        inbox = list(self.email_store.inbox('baz@bar.com'))
+        self.email_store.delete('baz@bar.com', uids)
+
+        self.assertEqual(pending, [])
+        self.assertTrue(all(email.get('read') for email in inbox))
+        self.assertEqual(self.email_store.count_inbox('baz@bar.com'), 0)
+
+    def test_lookups_stay_within_sqlite_variable_limit(self):
+        variables = []
+
+        # noinspection PyUnusedLocal
+        def record(conn, cursor, statement, parameters, context, many):
+            variables.append(len(parameters[0] if many else parameters))
+
+        event.listen(self.email_store._engine, 'before_cursor_execute',
+                     record)
+        try:
+            self.given_emails({
+                'to': ['foo{}@bar.com'.format(i) for i in range(1500)],
+                'attachments': [{'filename': '{}.txt'.format(i),
+                                 'content': str(i).encode('ascii')}
+                                for i in range(1200)]})
+        finally:
+            event.remove(self.email_store._engine, 'before_cursor_execute',
+                         record)
+
+        email = list(self.email_store.inbox('foo1499@bar.com'))[0]
+
+        self.assertLessEqual(max(variables), 999)
+        self.assertEqual(len(email['to']), 1500)
+        self.assertEqual(len(email['attachments']), 1200)
+
+    def test_create_raises_when_batch_is_not_committed(self):
+        self.email_store = SqliteEmailStore(
+            self.store_location, self.page_size, self.batch_size,
+            pragmas={'busy_timeout': 0})
+
+        lock = connect(self.store_location)
+        try:
+            lock.execute('BEGIN EXCLUSIVE')
+            with self.assertRaises(OperationalError):
+                self.email_store.create([{'to': ['foo@bar.com']}])
+        finally:
+            lock.rollback()
+            lock.close()
+
+        self.assertEqual(self.email_store.count_inbox('foo@bar.com'), 0)
+
+    def test_pragmas_are_applied_on_connect(self):
+        self.email_store = SqliteEmailStore(
+            self.store_location, self.page_size, self.batch_size,
+            pragmas={'journal_mode': 'WAL', 'busy_timeout': 1234})
+
+        with self.email_store._dbread() as db:
+            journal_mode = db.execute('PRAGMA journal_mode').scalar()
+            busy_timeout = db.execute('PRAGMA busy_timeout').scalar()
+
+        self.assertEqual(journal_mode.lower(), 'wal')
+        self.assertEqual(busy_timeout, 1234)
+
+    def count_queries(self, func):
+        profiler = QueryProfiler(enabled=True)
+        profiler.attach(self.email_store._engine)
+        profiler.start()
+        func()
+        return profiler.stop()['count']
+
+    def given_full_emails(self, count):
+        return self.given_emails(*[
+            {'to': ['foo@bar.com'], 'cc': ['cc@bar.com'],
+             'bcc': ['bcc@bar.com'], 'subject': 'koala {}'.format(i),
+             'attachments': [{'filename': '{}.txt'.format(i),
+                              'content': b'koala'}]}
+            for i in range(count)])
+
+    def test_listing_issues_constant_number_of_queries(self):
+        self.given_full_emails(1)
+        one_email = self.count_queries(
+            lambda: self.email_store.inbox('foo@bar.com', page=1))
+
+        self.given_full_emails(self.page_size)
+        full_page = self.count_queries(
+            lambda: self.email_store.inbox('foo@bar.com', page=1))
+
+        self.assertEqual(one_email, full_page)
+
+    def test_get_issues_constant_number_of_queries(self):
+        emails = self.given_full_emails(2)
+
+        queries = self.count_queries(
+            lambda: self.email_store.get(emails[0]['_uid']))
+
+        self.assertLessEqual(queries, 3)
+
+    def test_attachment_download_reads_content_once(self):
+        content = bytes(range(256)) * 4
+        self.given_emails(
+            {'to': ['foo@bar.com'],
+             'attachments': [{'filename': 'foo.bin', 'content': content}]})
+        content_hash = sha256(content).hexdigest()
+        chunks = []
+
+        queries = self.count_queries(lambda: chunks.extend(
+            self.email_store.attachment_content(content_hash, 0,
+                                                len(content), chunk_size=100)))
+
+        self.assertEqual(queries, 1)
+        self.assertEqual(len(chunks), 11)
+        self.assertEqual(b''.join(chunks), content)
+
+    def test_legacy_attachments_are_migrated(self):
+        emails = self.given_emails(
+            {'to': ['foo@bar.com'],
+             'attachments': [{'filename': 'foo.txt', 'content': b'foo.txt'}]})
+        with self.email_store._dbwrite() as db:
+            db.execute('DROP INDEX ix_attachment_hash')
+            db.execute('CREATE TABLE attachment_legacy ('
+                       'id INTEGER PRIMARY KEY, filename TEXT, content TEXT)')
+            db.execute("INSERT INTO attachment_legacy "
+                       "SELECT id, filename, 'Zm9vLnR4dA==' FROM attachment")
+            db.execute('DROP TABLE attachment')
+            db.execute('DROP TABLE attachmentcontent')
+            db.execute('ALTER TABLE attachment_legacy RENAME TO attachment')
+
+        self.email_store = SqliteEmailStore(self.store_location)
+        email = self.email_store.get(emails[0]['_uid'])
+
+        self.assertEqual(email['attachments'], [{'filename': 'foo.txt', 'content': b'foo.txt'}])
+        self.assertEqual(self.email_store.attachment_bytes(), len(b'foo.txt'))
+
+    def test_legacy_recipients_are_migrated(self):
+        emails = self.given_emails(
+            {'to': ['foo@bar.com', 'baz@bar.com'], 'cc': ['foo@bar.com'],
+             'bcc': ['bcc@bar.com'], 'subject': 'koala'})
+        with self.email_store._dbwrite() as db:
+            for role in ('to', 'cc', 'bcc'):
+                db.execute('CREATE TABLE "{0}" (id INTEGER PRIMARY KEY, '
+                           'address VARCHAR(128) UNIQUE)'.format(role))
+                db.execute('CREATE TABLE email{0} (email_id INTEGER, '
+                           '{0}_id INTEGER)'.format(role))
+                db.execute('INSERT INTO "{0}" (id, address) '
+                           'SELECT address.id, address.address FROM address '
+                           'JOIN recipient '
+                           'ON recipient.address_id = address.id '
+                           "WHERE recipient.role = '{0}'".format(role))
+                db.execute('INSERT INTO email{0} (email_id, {0}_id) '
+                           'SELECT email_id, address_id FROM recipient '
+                           "WHERE role = '{0}' ORDER BY id".format(role))
+            db.execute('DELETE FROM recipient')
+            db.execute('DELETE FROM address')
+
+        self.email_store = SqliteEmailStore(self.store_location)
+        email = self.email_store.get(emails[0]['_uid'])
+        inbox = list(self.email_store.inbox('bcc@bar.com'))
+
+        self.assertEqual(email['to'], ['foo@bar.com', 'baz@bar.com'])
+        self.assertEqual(email['cc'], ['foo@bar.com'])
+        self.assertEqual(email['bcc'], ['bcc@bar.com'])
+        self.assertEqual([_['_uid'] for _ in inbox], [emails[0]['_uid']])
+        with self.email_store._dbread() as db:
+            tables = db.execute("SELECT name FROM sqlite_master "
+                                "WHERE type = 'table'").fetchall()
+        self.assertFalse({'to', 'cc', 'bcc', 'emailto'} &
+                         {_[0] for _ in tables})
+
+    def test_search_index_is_backfilled(self):
+        self.email_store._has_search_index = False
+        emails = self.given_emails(
+            {'to': ['foo@bar.com'], 'subject': 'koala'})
+        with self.email_store._dbwrite() as db:
+            db.execute('DROP TABLE IF EXISTS email_search')
+
+        self.email_store = SqliteEmailStore(self.store_location)
+        results = list(self.email_store.search('foo@bar.com', 'koala'))
+
+        self.assertEqual([_['_uid'] for _ in results], [emails[0]['_uid']])
+
+    def test_interrupted_search_index_backfill_is_resumed(self):
+        self.email_store._has_search_index = False
+        emails = self.given_emails(
+            {'to': ['foo@bar.com'], 'subject': 'koala'},
+            {'to': ['foo@bar.com'], 'subject': 'koala bear'})
+        with self.email_store._dbwrite() as db:
+            db.execute('DROP TABLE IF EXISTS email_search')
+        self.email_store = SqliteEmailStore(self.store_location)
+        with self.email_store._dbwrite() as db:
+            db.execute('DELETE FROM email_search WHERE rowid IN '
+                       '(SELECT MAX(rowid) FROM email_search)')
+            db.execute('DELETE FROM email_search_state')
+
+        self.email_store = SqliteEmailStore(self.store_location)
+        results = list(self.email_store.search('foo@bar.com', 'koala'))
+
+        self.assertEqual({_['_uid'] for _ in results},
+                         {_['_uid'] for _ in emails})
+
+    def test_search_index_is_maintained_by_store_that_could_not_backfill(self):
+        if not self.email_store._has_search_index:
+            self.skipTest('search index is disabled')
+
+        with self.email_store._dbwrite() as db:
+            db.execute('DELETE FROM email_search_state')
+
+        lock = connect(self.store_location)
+        try:
+            lock.execute('BEGIN IMMEDIATE')
+            other_store = SqliteEmailStore(
+                self.store_location, self.page_size, self.batch_size,
+                pragmas={'busy_timeout': 0})
+        finally:
+            lock.rollback()
+            lock.close()
+        self.email_store._backfill_search_index()
+
+        emails = [{'to': ['foo@bar.com'], 'subject': 'zebra'}]
+        other_store.create(emails)
+        found = list(self.email_store.search('foo@bar.com', 'zebra'))
+        other_store.delete('foo@bar.com', emails)
+        deleted = list(self.email_store.search('foo@bar.com', 'zebra'))
+
+        self.assertTrue(other_store._use_search_index())
+        self.assertEqual([_['subject'] for _ in found], ['zebra'])
+        self.assertEqual(deleted, [])
+
+    def test_search_without_terms_returns_same_type_as_matches(self):
+        if not self.email_store._has_search_index:
+            self.skipTest('search index is disabled')
+
+        self.given_emails({'to': ['foo@bar.com'], 'subject': 'koala'})
+
+        self.assertEqual(self.email_store.search('foo@bar.com', '!!'), [])
+        self.assertIsInstance(
+            self.email_store.search('foo@bar.com', 'koala'), list)
+
+
+class SqliteEmailStoreWithoutSearchIndexTests(SqliteEmailStoreTests):
+    def create_email_store(self):
+        email_store = super().create_email_store()
+        email_store._has_search_index = False
+        return email_store
@@ -5,10 +5,13 @@ from typing import Iterable
 from typing import List
 
 from opwen_email_client.domain.email.store import EmailStore
+from opwen_email_client.util.pagination import encode_cursor
 
 
 class Base(object):
     class EmailStoreTests(TestCase, metaclass=ABCMeta):
+        page_size = 2
+
         @abstractmethod
         def create_email_store(self) -> EmailStore:
             raise NotImplementedError
@@ -52,6 +55,20 @@ class Base(object):
             ids2 = [_['_uid'] for _ in emails2[1:]]
             self.assertEqual(ids1, ids2)
 
+        def test_create_skips_existing_uids(self):
+            existing = self.given_emails({'to': ['foo@bar.com'], 'subject': 'existing'})
+
+            created = self.email_store.create([
+                {'to': ['foo@bar.com'], 'subject': 'duplicate', '_uid': existing[0]['_uid']},
+                {'to': ['foo@bar.com'], 'subject': 'new', '_uid': 'new-uid'},
+                {'to': ['foo@bar.com'], 'subject': 'repeated', '_uid': 'new-uid'},
+                {'to': ['foo@bar.com'], 'subject': 'other'}])
+
+            self.assertEqual(created, 2)
+            self.assertEqual(self.email_store.get(existing[0]['_uid'])['subject'], 'existing')
+            self.assertEqual(self.email_store.get('new-uid')['subject'], 'new')
+            self.assertEqual(len(list(self.email_store.inbox('foo@bar.com'))), 3)
+
         def test_inbox(self):
             emails = self.given_emails(
                 {'to': ['Foo@bar.com'], 'sent_at': 'YYYY'},
@@ -69,6 +86,156 @@ class Base(object):
             self.assertContainsEmail(emails[2], results)
             self.assertContainsEmail(emails[3], results)
 
+        def test_inbox_paginated(self):
+            emails = self.given_emails(
+                {'to': ['foo@bar.com'], 'sent_at': '2017-01-03 10:00'},
+                {'to': ['foo@bar.com'], 'sent_at': '2017-01-01 10:00'},
+                {'to': ['baz@bar.com'], 'sent_at': '2017-01-02 10:00'},
+                {'to': ['foo@bar.com'], 'sent_at': '2017-01-02 10:00'})
+
+            page1 = self.email_store.inbox('foo@bar.com', page=1)
+            page2 = self.email_store.inbox('foo@bar.com', page=2)
+
+            self.assertEqual([_['_uid'] for _ in page1],
+                             [emails[0]['_uid'], emails[3]['_uid']])
+            self.assertEqual([_['_uid'] for _ in page2],
+                             [emails[1]['_uid']])
+            self.assertTrue(page1.has_nextpage)
+            self.assertFalse(page2.has_nextpage)
+
+        def test_inbox_cursor_pagination(self):
+            emails = self.given_emails(
+                {'to': ['foo@bar.com'], 'sent_at': '2017-01-01 10:00'},
+                {'to': ['foo@bar.com'], 'sent_at': '2017-01-02 10:00'},
+                {'to': ['foo@bar.com'], 'sent_at': '2017-01-02 10:00'},
+                {'to': ['foo@bar.com'], 'sent_at': '2017-01-03 10:00'},
+                {'to': ['baz@bar.com'], 'sent_at': '2017-01-02 10:00'})
+
+            page1 = self.email_store.inbox('foo@bar.com', page=1)
+            page2 = self.email_store.inbox('foo@bar.com', page=2,
+                                           cursor=page1.next_cursor)
+            back1 = self.email_store.inbox('foo@bar.com', page=1,
+                                           cursor=page2.prev_cursor)
+
+            self.assertEqual([_['_uid'] for _ in page1],
+                             [emails[3]['_uid'], emails[2]['_uid']])
+            self.assertEqual([_['_uid'] for _ in page2],
+                             [emails[1]['_uid'], emails[0]['_uid']])
+            self.assertEqual([_['_uid'] for _ in back1],
+                             [_['_uid'] for _ in page1])
+            self.assertIsNone(page1.prev_cursor)
+            self.assertIsNone(back1.prev_cursor)
+
+        def test_outbox_cursor_pagination_without_sent_at(self):
+            emails = self.given_emails(
+                {'from': 'foo@bar.com'},
+                {'from': 'foo@bar.com'},
+                {'from': 'foo@bar.com'})
+
+            page1 = self.email_store.outbox('foo@bar.com', page=1)
+            page2 = self.email_store.outbox('foo@bar.com', page=2,
+                                            cursor=page1.next_cursor)
+
+            self.assertEqual([_['_uid'] for _ in page1],
+                             [emails[2]['_uid'], emails[1]['_uid']])
+            self.assertEqual([_['_uid'] for _ in page2],
+                             [emails[0]['_uid']])
+
+        def test_invalid_cursor_falls_back_to_page(self):
+            emails = self.given_emails(
+                {'to': ['foo@bar.com'], 'sent_at': '2017-01-01 10:00'},
+                {'to': ['foo@bar.com'], 'sent_at': '2017-01-02 10:00'},
+                {'to': ['foo@bar.com'], 'sent_at': '2017-01-03 10:00'})
+
+            results = self.email_store.inbox('foo@bar.com', page=2,
+                                             cursor='invalid')
+
+            self.assertEqual([_['_uid'] for _ in results],
+                             [emails[0]['_uid']])
+
+        def test_tampered_cursor_falls_back_to_page(self):
+            emails = self.given_emails(
+                {'to': ['foo@bar.com'], 'sent_at': '2017-01-01 10:00'},
+                {'to': ['foo@bar.com'], 'sent_at': '2017-01-02 10:00'},
+                {'to': ['foo@bar.com'], 'sent_at': '2017-01-03 10:00'})
+
+            for position in ({'x': 1}, 3), ('2017-01-02 10:00', True):
+                cursor = encode_cursor('after', *position)
+                results = self.email_store.inbox('foo@bar.com', page=2,
+                                                 cursor=cursor)
+
+                self.assertEqual([_['_uid'] for _ in results],
+                                 [emails[0]['_uid']])
+
+        def test_inbox_paginated_past_last_page(self):
+            self.given_emails(
+                {'to': ['foo@bar.com'], 'sent_at': 'YYYY'})
+
+            results = self.email_store.inbox('foo@bar.com', page=3)
+
+            self.assertEqual(list(results), [])
+            self.assertFalse(results.has_nextpage)
+
+        def test_paginated_results_are_summaries(self):
+            self.given_emails(
+                {'to': ['foo@bar.com'], 'subject': 'foo',
+                 'body': '<p>hello &amp; <b>welcome</b></p>',
+                 'attachments': [{'filename': 'foo.txt', 'content': b'foo.txt'}]})
+
+            summary = list(self.email_store.inbox('foo@bar.com', page=1))[0]
+
+            self.assertNotIn('body', summary)
+            self.assertEqual(summary['snippet'], 'hello & welcome')
+            self.assertTrue(summary['has_attachments'])
+            self.assertEqual(summary['attachments'], [{
+                'filename': 'foo.txt',
+                'hash': 'ddab29ff2c393ee52855d21a240eb05f775df88e3ce347df759f0c4b80356c35',
+            }])
+
+        def test_body(self):
+            emails = self.given_emails(
+                {'to': ['foo@bar.com'], 'body': 'koala'},
+                {'to': ['foo@bar.com']})
+
+            self.assertEqual(self.email_store.body('foo@bar.com', emails[0]['_uid']), 'koala')
+            self.assertEqual(self.email_store.body('foo@bar.com', emails[1]['_uid']), '')
+            self.assertIsNone(self.email_store.body('baz@bar.com', emails[0]['_uid']))
+            self.assertIsNone(self.email_store.body('foo@bar.com', 'uid-does-not-exist'))
+
+        def test_attachment(self):
+            content_hash = 'ddab29ff2c393ee52855d21a240eb05f775df88e3ce347df759f0c4b80356c35'
+            emails = self.given_emails(
+                {'to': ['foo@bar.com'], 'sent_at': '2017-09-10 11:11',
+                 'attachments': [{'filename': 'foo.txt', 'content': b'foo.txt'}]})
+
+            attachment = self.email_store.attachment('foo@bar.com', emails[0]['_uid'], content_hash)
+
+            self.assertEqual(attachment['filename'], 'foo.txt')
+            self.assertEqual(attachment['hash'], content_hash)
+            self.assertEqual(attachment['size'], len(b'foo.txt'))
+            self.assertIsNotNone(attachment['sent_at'])
+            self.assertIsNone(self.email_store.attachment('foo@bar.com', emails[0]['_uid'], 'unknown'))
+            self.assertIsNone(self.email_store.attachment('foo@bar.com', 'uid-does-not-exist', content_hash))
+            self.assertIsNone(self.email_store.attachment('baz@bar.com', emails[0]['_uid'], content_hash))
+
+        def test_attachment_content(self):
+            content = bytes(range(256)) * 4
+            self.given_emails(
+                {'to': ['foo@bar.com'],
+                 'attachments': [{'filename': 'foo.bin', 'content': content}]})
+            content_hash = list(self.email_store.inbox('foo@bar.com', page=1))[0]['attachments'][0]['hash']
+
+            full = list(self.email_store.attachment_content(content_hash, 0, len(content), chunk_size=100))
+            partial = b''.join(self.email_store.attachment_content(content_hash, 10, 20))
+            empty = list(self.email_store.attachment_content(content_hash, 5, 5))
+            tail = list(self.email_store.attachment_content(content_hash, 950, 2000, chunk_size=50))
+
+            self.assertEqual(b''.join(full), content)
+            self.assertEqual(len(full), 11)
+            self.assertEqual(partial, content[10:20])
+            self.assertEqual(empty, [])
+            self.assertEqual(tail, [content[950:1000], content[1000:]])
+
         def test_outbox(self):
             emails = self.given_emails(
                 {'from': 'foo@bar.com'},
@@ -117,6 +284,27 @@ class Base(object):
             self.assertEqual(len(results), 1)
             self.assertContainsEmail(emails[1], results)
 
+        def test_sent_paginated(self):
+            self.given_emails(
+                {'from': 'foo@bar.com', 'sent_at': 'YYYY'},
+                {'from': 'foo@bar.com', 'sent_at': 'YYYY'},
+                {'from': 'foo@bar.com', 'sent_at': 'YYYY'})
+
+            results = self.email_store.sent('foo@bar.com', page=2)
+
+            self.assertEqual(len(list(results)), 1)
+            self.assertTrue(results.has_prevpage)
+
+        def test_search_paginated(self):
+            self.given_emails(
+                {'to': ['foo@bar.com'], 'subject': 'koala 1'},
+                {'to': ['foo@bar.com'], 'subject': 'koala 2'},
+                {'to': ['foo@bar.com'], 'subject': 'koala 3'})
+
+            results = self.email_store.search('foo@bar.com', 'koala', page=1)
+
+            self.assertEqual(len(list(results)), self.page_size)
+
         def test_search_for_sender(self):
             emails = self.given_emails(
                 {'to': ['foo@bar.com'], 'from': 'baz@bar.com'},
@@ -171,6 +359,35 @@ class Base(object):
 
             self.assertEqual(results, [])
 
+        def test_counts(self):
+            emails = self.given_emails(
+                {'to': ['foo@bar.com'], 'sent_at': '2017-09-10 11:11'},
+                {'to': ['foo@bar.com'], 'cc': ['baz@bar.com'], 'read': True},
+                {'from': 'foo@bar.com', 'to': ['baz@bar.com'], 'sent_at': '2017-09-10 11:11'},
+                {'from': 'foo@bar.com', 'to': ['baz@bar.com']},
+                {'from': 'baz@bar.com', 'to': ['qux@bar.com']})
+
+            self.assertEqual(self.email_store.count_inbox('foo@bar.com'), 2)
+            self.assertEqual(self.email_store.count_unread('foo@bar.com'), 1)
+            self.assertEqual(self.email_store.count_sent('foo@bar.com'), 1)
+            self.assertEqual(self.email_store.count_outbox('foo@bar.com'), 1)
+            self.assertEqual(self.email_store.count_pending(), 3)
+            self.assertEqual(self.email_store.count_inbox('baz@bar.com'), 3)
+
+            self.email_store.mark_read('foo@bar.com', emails[:1])
+
+            self.assertEqual(self.email_store.count_unread('foo@bar.com'), 0)
+
+        def test_attachment_bytes(self):
+            self.assertEqual(self.email_store.attachment_bytes(), 0)
+
+            self.given_emails(
+                {'to': ['foo@bar.com'],
+                 'attachments': [{'filename': 'foo.txt', 'content': b'foo.txt'},
+                                 {'filename': 'bar.txt', 'content': b'bar'}]})
+
+            self.assertEqual(self.email_store.attachment_bytes(), len(b'foo.txt') + len(b'bar'))
+
         def test_mark_sent(self):
             emails = self.given_emails(
                 {'to': ['foo@bar.com'], 'subject': 'foo'},
@@ -206,15 +423,15 @@ class Base(object):
             unchanged_emails = list(self.email_store.inbox('baz@bar.com'))
 
             self.assertEqual(len(deleted_emails), 2)
-            self.assertEqual(deleted_emails[0]['_uid'], emails[2]['_uid'])
-            self.assertEqual(deleted_emails[1]['_uid'], emails[3]['_uid'])
+            self.assertEqual(deleted_emails[0]['_uid'], emails[3]['_uid'])
+            self.assertEqual(deleted_emails[1]['_uid'], emails[2]['_uid'])
             self.assertEqual(len(unchanged_emails), 1)
             self.assertEqual(unchanged_emails[0]['_uid'], emails[4]['_uid'])
 
         def test_get(self):
             given = self.given_emails(
                 {'to': ['foo@bar.com'], 'subject': 'foo',
-                 'attachments': [{'filename': 'foo.txt', 'content': 'Zm9vLnR4dA=='}]},
+                 'attachments': [{'filename': 'foo.txt', 'content': b'foo.txt'}]},
                 {'to': ['baz@bar.com'], 'subject': 'bar'})
 
             actual = self.email_store.get(given[0]['_uid'])
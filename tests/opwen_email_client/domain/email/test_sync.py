@@ -1,81 +1,149 @@
 from io import BytesIO
-from shutil import copyfileobj
+from json import dump
+from os import listdir
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Event
+from time import monotonic
 from unittest import TestCase
 from unittest.mock import Mock
 
-from azure.common import AzureMissingResourceHttpError
-
+from opwen_email_client.domain.email.attachment import Base64AttachmentEncoder
+from opwen_email_client.domain.email.package import BinaryPackage
 from opwen_email_client.domain.email.sync import AzureSync
+from opwen_email_client.util.compression import LzmaCodec
 from opwen_email_client.util.serialization import JsonSerializer
+from tests.opwen_email_client.util.fake_blob import FakeBlobService
 
 
 class AzureSyncTests(TestCase):
     # noinspection PyTypeChecker
     def setUp(self):
-        self.azure_client_mock = Mock()
+        self.azure_client = FakeBlobService()
         self.email_server_client_mock = Mock()
-        self.sync = AzureSync(
+        self.email_server_client_mock.download.side_effect = self.next_package
+        self.server_packages = []
+        self.sync = self.create_sync()
+
+    def create_sync(self, checkpoint_directory: str=None,
+                    package_format=None, codec=None,
+                    max_package_bytes=None, block_size=1024,
+                    max_packages=None) -> AzureSync:
+        return AzureSync(
             container='container',
             email_server_client=self.email_server_client_mock,
             account_key='mock',
             account_name='mock',
-            azure_client=self.azure_client_mock,
-            serializer=JsonSerializer())
+            azure_client=self.azure_client,
+            attachment_encoder=Base64AttachmentEncoder(),
+            serializer=JsonSerializer(),
+            checkpoint_directory=checkpoint_directory,
+            package_format=package_format,
+            codec=codec,
+            max_package_bytes=max_package_bytes,
+            block_size=block_size,
+            retries=0,
+            max_packages=max_packages)
+
+    def given_checkpoint_directory(self) -> str:
+        checkpoint_directory = mkdtemp()
+        self.addCleanup(rmtree, checkpoint_directory)
+        return checkpoint_directory
+
+    def uploaded(self) -> BytesIO:
+        return BytesIO(list(self.azure_client.blobs.values())[-1])
 
     def assertUploadIs(self, actual: BytesIO, expected: bytes):
         with self.sync._open(actual) as uploaded:
             self.assertEqual(expected, uploaded.read())
 
-    def given_upload(self) -> BytesIO:
-        buffer = BytesIO()
-
-        # noinspection PyUnusedLocal
-        def side_effect(container, blobname, stream):
-            copyfileobj(stream, buffer)
-            buffer.seek(0)
+    def next_package(self):
+        if not self.server_packages:
+            return '', ''
+        return self.server_packages.pop(0)
 
-        self.azure_client_mock.create_blob_from_stream.side_effect = side_effect
-        return buffer
-
-    def given_download(self, payload: bytes):
+    def given_download(self, payload: bytes, resource_id: str='id'):
         buffer = BytesIO()
         with self.sync._open(buffer, 'wb') as fobj:
             fobj.write(payload)
-        buffer.seek(0)
 
-        # noinspection PyUnusedLocal
-        def side_effect(container, blobname, stream):
-            copyfileobj(buffer, stream)
+        self.given_download_blob(buffer.getvalue(), resource_id)
 
-        self.email_server_client_mock.download.return_value = ('id', 'folder')
-        self.azure_client_mock.get_blob_to_stream.side_effect = side_effect
+    def given_download_blob(self, blob: bytes, resource_id: str='id'):
+        self.server_packages.append((resource_id, 'folder'))
+        self.azure_client.blobs[('folder', resource_id)] = blob
 
     def given_download_exception(self):
-        error = AzureMissingResourceHttpError('injected error', 404)
-        self.email_server_client_mock.download.return_value = ('id', 'folder')
-        self.azure_client_mock.get_blob_to_stream.side_effect = error
+        self.server_packages.append(('id', 'folder'))
 
     def test_upload(self):
-        uploaded = self.given_upload()
-
         self.sync.upload(items=[{'foo': 'bar'}])
 
-        self.assertUploadIs(uploaded, b'{"foo":"bar"}\n')
+        self.assertUploadIs(self.uploaded(), b'{"foo":"bar"}\n')
         self.assertTrue(self.email_server_client_mock.upload.called)
 
     def test_upload_excludes_null_values(self):
-        uploaded = self.given_upload()
-
         self.sync.upload(items=[{'foo': 0, 'bar': None}])
 
-        self.assertUploadIs(uploaded, b'{"foo":0}\n')
+        self.assertUploadIs(self.uploaded(), b'{"foo":0}\n')
+
+    def test_upload_encodes_attachments(self):
+        self.sync.upload(items=[{'attachments': [{'filename': 'foo.txt', 'content': b'foo.txt'}]}])
+
+        self.assertUploadIs(self.uploaded(), b'{"attachments":[{"filename":"foo.txt","content":"Zm9vLnR4dA=="}]}\n')
+
+    def test_upload_splits_packages_by_size(self):
+        items = [{'_uid': str(i), 'subject': 'x' * 20} for i in range(5)]
+        acknowledged = []
+
+        sync = self.create_sync(max_package_bytes=100)
+        uploaded = sync.upload(items, on_uploaded=acknowledged.append)
+
+        self.assertEqual(uploaded, ['0', '1', '2', '3', '4'])
+        self.assertEqual(acknowledged, [['0', '1'], ['2', '3'], ['4']])
+        self.assertEqual(len(self.azure_client.blobs), 3)
+        self.assertEqual(self.email_server_client_mock.upload.call_count, 3)
+
+    def test_upload_failure_keeps_earlier_packages_acknowledged(self):
+        items = [{'_uid': str(i), 'subject': 'x' * 20} for i in range(3)]
+        acknowledged = []
+        self.email_server_client_mock.upload.side_effect = [None, IOError()]
+
+        sync = self.create_sync(max_package_bytes=40)
+        with self.assertRaises(IOError):
+            sync.upload(items, on_uploaded=acknowledged.append)
+
+        self.assertEqual(acknowledged, [['0']])
 
     def test_upload_with_no_content_does_not_hit_network(self):
         self.sync.upload(items=[])
 
-        self.assertFalse(self.azure_client_mock.create_blob_from_stream.called)
+        self.assertEqual(self.azure_client.calls['put_block'], 0)
         self.assertFalse(self.email_server_client_mock.upload.called)
 
+    def test_upload_binary_package_roundtrip(self):
+        item = {'_uid': '1', 'attachments': [{'filename': 'foo.txt', 'content': b'foo.txt'}]}
+
+        sync = self.create_sync(package_format=BinaryPackage(JsonSerializer()))
+        sync.upload(items=[item])
+        with sync._open(self.uploaded()) as fobj:
+            self.given_download(fobj.read())
+        downloaded = list(self.sync.download())
+
+        self.assertEqual(downloaded, [item])
+
+    def test_download_detects_codec(self):
+        sync = self.create_sync(codec=LzmaCodec())
+        sync.upload(items=[{'foo': 'bar'}])
+
+        uploaded = self.uploaded().getvalue()
+        self.given_download_blob(uploaded)
+        downloaded = list(self.sync.download())
+
+        self.assertEqual(uploaded[:6], LzmaCodec.magic)
+        self.assertEqual(downloaded, [{'foo': 'bar'}])
+
     def test_download(self):
         self.given_download(b'{"foo":"bar"}\n{"baz":1}')
 
@@ -86,9 +154,229 @@ class AzureSyncTests(TestCase):
         self.assertIn({'foo': 'bar'}, downloaded)
         self.assertIn({'baz': 1}, downloaded)
 
+    def test_download_decodes_attachments(self):
+        self.given_download(b'{"attachments":[{"filename":"foo.txt","content":"Zm9vLnR4dA=="}]}')
+
+        downloaded = list(self.sync.download())
+
+        self.assertEqual(downloaded, [{'attachments': [{'filename': 'foo.txt', 'content': b'foo.txt'}]}])
+
     def test_download_missing_resource(self):
         self.given_download_exception()
 
         downloaded = list(self.sync.download())
 
         self.assertEqual(downloaded, [])
+
+    def test_download_resumes_from_checkpoint(self):
+        checkpoint_directory = self.given_checkpoint_directory()
+        self.given_download(b'{"foo":1}\n{"foo":2}\n{"foo":3}\n{"foo":4}')
+
+        sync = self.create_sync(checkpoint_directory)
+        downloaded = sync.download()
+        first_batch = [next(downloaded), next(downloaded)]
+        sync.checkpoint(len(first_batch))
+        next(downloaded)
+        downloaded.close()
+
+        sync = self.create_sync(checkpoint_directory)
+        resumed = list(sync.download())
+        sync.checkpoint(len(resumed))
+
+        self.assertEqual(first_batch, [{'foo': 1}, {'foo': 2}])
+        self.assertEqual(resumed, [{'foo': 3}, {'foo': 4}])
+        self.assertEqual(self.email_server_client_mock.download.call_count, 3)
+        self.assertEqual(self.azure_client.calls['get_blob_to_bytes'], 1)
+        self.assertEqual(listdir(checkpoint_directory), [])
+
+    def test_download_keeps_checkpoint_until_all_items_are_processed(self):
+        checkpoint_directory = self.given_checkpoint_directory()
+        self.given_download(b'{"foo":1}\n{"foo":2}')
+
+        sync = self.create_sync(checkpoint_directory)
+        downloaded = list(sync.download())
+        sync.checkpoint(1)
+
+        self.assertEqual(len(downloaded), 2)
+        self.assertIn('checkpoint.json', listdir(checkpoint_directory))
+
+        sync.checkpoint(1)
+
+        self.assertEqual(listdir(checkpoint_directory), [])
+
+    def test_download_missing_resource_clears_checkpoint(self):
+        checkpoint_directory = self.given_checkpoint_directory()
+        self.given_download_exception()
+
+        downloaded = list(self.create_sync(checkpoint_directory).download())
+
+        self.assertEqual(downloaded, [])
+        self.assertEqual(listdir(checkpoint_directory), [])
+
+    def test_download_resumes_interrupted_transfer(self):
+        checkpoint_directory = self.given_checkpoint_directory()
+        self.given_download(b''.join(b'{"foo":%d}\n' % i for i in range(1000)))
+        num_blocks = -(-len(self.azure_client.blobs[('folder', 'id')]) // 64)
+        self.azure_client.fail('get_blob_to_bytes', None, OSError())
+
+        sync = self.create_sync(checkpoint_directory, block_size=64)
+        with self.assertRaises(OSError):
+            list(sync.download())
+        self.azure_client.calls.clear()
+
+        sync = self.create_sync(checkpoint_directory, block_size=64)
+        resumed = list(sync.download())
+        sync.checkpoint(len(resumed))
+
+        self.assertEqual(len(resumed), 1000)
+        self.assertEqual(self.azure_client.calls['get_blob_to_bytes'],
+                         num_blocks - 1)
+        self.assertEqual(self.email_server_client_mock.download.call_count, 2)
+        self.assertEqual(listdir(checkpoint_directory), [])
+
+    def test_download_drains_all_packages(self):
+        checkpoint_directory = self.given_checkpoint_directory()
+        self.given_download(b'{"foo":1}\n{"foo":2}', 'a')
+        self.given_download(b'{"foo":3}', 'b')
+        self.given_download(b'{"foo":4}\n{"foo":5}', 'c')
+
+        sync = self.create_sync(checkpoint_directory)
+        downloaded = list(sync.download())
+        sync.checkpoint(len(downloaded))
+
+        self.assertEqual(downloaded, [{'foo': i} for i in range(1, 6)])
+        self.assertEqual(self.email_server_client_mock.download.call_count, 4)
+        self.assertEqual(listdir(checkpoint_directory), [])
+
+    def test_download_acknowledges_each_package(self):
+        checkpoint_directory = self.given_checkpoint_directory()
+        self.given_download(b'{"foo":1}\n{"foo":2}', 'a')
+        self.given_download(b'{"foo":3}\n{"foo":4}', 'b')
+
+        sync = self.create_sync(checkpoint_directory)
+        downloaded = sync.download()
+        first_batch = [next(downloaded) for _ in range(3)]
+        sync.checkpoint(len(first_batch))
+        downloaded.close()
+
+        sync = self.create_sync(checkpoint_directory)
+        resumed = list(sync.download())
+        sync.checkpoint(len(resumed))
+
+        self.assertEqual(first_batch, [{'foo': 1}, {'foo': 2}, {'foo': 3}])
+        self.assertEqual(resumed, [{'foo': 4}])
+        self.assertEqual(self.azure_client.calls['get_blob_to_bytes'], 2)
+        self.assertEqual(listdir(checkpoint_directory), [])
+
+    def test_download_close_does_not_wait_for_prefetch(self):
+        checkpoint_directory = self.given_checkpoint_directory()
+        self.given_download(b'{"foo":0}', 'a')
+        self.given_download(b''.join(b'{"foo":%d}\n' % i for i in range(1000)),
+                            'b')
+        num_blocks = -(-len(self.azure_client.blobs[('folder', 'b')]) // 64)
+        fetching, release, fetched = Event(), Event(), Event()
+        get_blob_to_bytes = self.azure_client.get_blob_to_bytes
+
+        def slow_get_blob_to_bytes(container, blob_name, **kwargs):
+            if blob_name == 'b':
+                fetching.set()
+                release.wait(5)
+            return get_blob_to_bytes(container, blob_name, **kwargs)
+
+        self.azure_client.get_blob_to_bytes = slow_get_blob_to_bytes
+        sync = self.create_sync(checkpoint_directory, block_size=64)
+        fetch_package = sync._fetch_package
+
+        def fetch_package_and_notify(package, stopped):
+            try:
+                return fetch_package(package, stopped)
+            finally:
+                if package['resource_id'] == 'b':
+                    fetched.set()
+
+        sync._fetch_package = fetch_package_and_notify
+        downloaded = sync.download()
+        first = next(downloaded)
+        sync.checkpoint(1)
+        self.assertTrue(fetching.wait(5))
+
+        started = monotonic()
+        downloaded.close()
+        elapsed = monotonic() - started
+        release.set()
+        self.assertTrue(fetched.wait(5))
+        self.azure_client.calls.clear()
+
+        sync = self.create_sync(checkpoint_directory, block_size=64)
+        resumed = list(sync.download())
+        sync.checkpoint(len(resumed))
+
+        self.assertEqual(first, {'foo': 0})
+        self.assertLess(elapsed, 1)
+        self.assertEqual(len(resumed), 1000)
+        self.assertEqual(self.azure_client.calls['get_blob_to_bytes'],
+                         num_blocks - 1)
+        self.assertEqual(listdir(checkpoint_directory), [])
+
+    def test_download_skips_missing_packages(self):
+        self.given_download_exception()
+        self.given_download(b'{"foo":1}', 'b')
+
+        downloaded = list(self.sync.download())
+
+        self.assertEqual(downloaded, [{'foo': 1}])
+
+    def test_download_stops_at_max_packages(self):
+        self.given_download(b'{"foo":1}', 'a')
+        self.given_download(b'{"foo":2}', 'b')
+
+        downloaded = list(self.create_sync(max_packages=1).download())
+
+        self.assertEqual(downloaded, [{'foo': 1}])
+        self.assertEqual(self.server_packages, [('b', 'folder')])
+
+    def test_download_stops_when_server_repeats_package(self):
+        self.given_download(b'{"foo":1}')
+        self.server_packages.extend([('id', 'folder')] * 3)
+
+        downloaded = list(self.sync.download())
+
+        self.assertEqual(downloaded, [{'foo': 1}])
+
+    def test_download_resumes_legacy_checkpoint(self):
+        checkpoint_directory = self.given_checkpoint_directory()
+        with open(join(checkpoint_directory, 'checkpoint.json'), 'w') as fobj:
+            dump({'resource_id': 'id', 'container': 'folder',
+                  'offset': 1}, fobj)
+        with open(join(checkpoint_directory, 'package.gz'), 'wb') as fobj:
+            with self.sync._open(fobj, 'wb') as package:
+                package.write(b'{"foo":1}\n{"foo":2}')
+
+        sync = self.create_sync(checkpoint_directory)
+        resumed = list(sync.download())
+        sync.checkpoint(len(resumed))
+
+        self.assertEqual(resumed, [{'foo': 2}])
+        self.assertEqual(self.azure_client.calls['get_blob_to_bytes'], 0)
+        self.assertEqual(listdir(checkpoint_directory), [])
+
+    def test_upload_resumes_interrupted_package(self):
+        checkpoint_directory = self.given_checkpoint_directory()
+        items = [{'_uid': str(i), 'subject': 'x' * 20} for i in range(3)]
+        acknowledged = []
+        self.email_server_client_mock.upload.side_effect = [IOError(), None,
+                                                            None]
+
+        sync = self.create_sync(checkpoint_directory, max_package_bytes=100)
+        with self.assertRaises(IOError):
+            sync.upload(items, on_uploaded=acknowledged.append)
+        self.azure_client.calls.clear()
+
+        sync = self.create_sync(checkpoint_directory, max_package_bytes=100)
+        uploaded = sync.upload(items, on_uploaded=acknowledged.append)
+
+        self.assertEqual(uploaded, ['0', '1', '2'])
+        self.assertEqual(acknowledged, [['0', '1'], ['2']])
+        self.assertEqual(self.azure_client.calls['put_block'], 1)
+        self.assertEqual(self.email_server_client_mock.upload.call_count, 3)
+        self.assertEqual(listdir(checkpoint_directory), [])
@@ -0,0 +1,63 @@
+from collections import Counter
+from collections import defaultdict
+
+from azure.common import AzureHttpError
+from azure.common import AzureMissingResourceHttpError
+from azure.storage.blob.models import Blob
+from azure.storage.blob.models import BlobProperties
+
+
+class FakeBlobService(object):
+    def __init__(self):
+        self.blobs = {}
+        self.blocks = defaultdict(dict)
+        self.calls = Counter()
+        self._failures = defaultdict(list)
+
+    def fail(self, method: str, *outcomes: Exception):
+        self._failures[method].extend(outcomes)
+
+    def _call(self, method: str):
+        self.calls[method] += 1
+        if self._failures[method]:
+            error = self._failures[method].pop(0)
+            if error is not None:
+                raise error
+
+    # noinspection PyUnusedLocal
+    def put_block(self, container, blob_name, block, block_id,
+                  validate_content=False, **kwargs):
+        self._call('put_block')
+        self.blocks[(container, blob_name)][block_id] = bytes(block)
+
+    # noinspection PyUnusedLocal
+    def put_block_list(self, container, blob_name, block_list, **kwargs):
+        self._call('put_block_list')
+        staged = self.blocks[(container, blob_name)]
+        try:
+            content = b''.join(staged[block.id] for block in block_list)
+        except KeyError:
+            raise AzureHttpError('invalid block list', 400)
+        self.blobs[(container, blob_name)] = content
+
+    # noinspection PyUnusedLocal
+    def get_blob_properties(self, container, blob_name, **kwargs):
+        self._call('get_blob_properties')
+        content = self._get(container, blob_name)
+        props = BlobProperties()
+        props.content_length = len(content)
+        return Blob(blob_name, props=props)
+
+    # noinspection PyUnusedLocal
+    def get_blob_to_bytes(self, container, blob_name, start_range=None,
+                          end_range=None, **kwargs):
+        self._call('get_blob_to_bytes')
+        content = self._get(container, blob_name)
+        content = content[start_range:end_range + 1]
+        return Blob(blob_name, content=content, props=BlobProperties())
+
+    def _get(self, container, blob_name) -> bytes:
+        try:
+            return self.blobs[(container, blob_name)]
+        except KeyError:
+            raise AzureMissingResourceHttpError('blob not found', 404)
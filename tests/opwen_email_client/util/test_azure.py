@@ -0,0 +1,198 @@
+from io import BytesIO
+from unittest import TestCase
+
+from azure.common import AzureException
+from azure.common import AzureHttpError
+from azure.common import AzureMissingResourceHttpError
+
+from opwen_email_client.util.azure import BlockTransfer
+from opwen_email_client.util.azure import TransferStopped
+from tests.opwen_email_client.util.fake_blob import FakeBlobService
+
+
+class BlockTransferTests(TestCase):
+    payload = b'0123456789abcdefghij'
+
+    def setUp(self):
+        self.client = FakeBlobService()
+        self.waits = []
+        self.transferred = []
+        self.blocks = []
+        self.transfer = self.create_transfer()
+
+    def create_transfer(self, retries: int=5) -> BlockTransfer:
+        return BlockTransfer(self.client, block_size=8, retries=retries,
+                             on_transfer=self.transferred.append,
+                             wait=self.waits.append)
+
+    def on_block(self, blocks):
+        self.blocks = list(blocks)
+
+    def given_blob(self, content: bytes=payload):
+        self.client.blobs[('container', 'blob')] = content
+
+    def given_interrupted_upload(self):
+        self.client.fail('put_block', None, OSError())
+
+        with self.assertRaises(OSError):
+            self.create_transfer(retries=0).upload(
+                'container', 'blob', BytesIO(self.payload),
+                on_block=self.on_block)
+
+        self.client.calls.clear()
+
+    def given_interrupted_download(self) -> BytesIO:
+        stream = BytesIO()
+        self.given_blob()
+        self.client.fail('get_blob_to_bytes', None, OSError())
+
+        with self.assertRaises(OSError):
+            self.create_transfer(retries=0).download(
+                'container', 'blob', stream, on_block=self.on_block)
+
+        self.client.calls.clear()
+        return stream
+
+    def assertBlobIs(self, expected: bytes):
+        self.assertEqual(self.client.blobs[('container', 'blob')], expected)
+
+    def test_upload_puts_blocks_and_commits_block_list(self):
+        self.transfer.upload('container', 'blob', BytesIO(self.payload),
+                             on_block=self.on_block)
+
+        self.assertBlobIs(self.payload)
+        self.assertEqual(self.client.calls['put_block'], 3)
+        self.assertEqual(self.client.calls['put_block_list'], 1)
+        self.assertEqual(self.transferred, [8, 8, 4])
+        self.assertEqual(len(self.blocks), 3)
+
+    def test_upload_resumes_after_last_good_block(self):
+        self.given_interrupted_upload()
+
+        self.transfer.upload('container', 'blob', BytesIO(self.payload),
+                             blocks=self.blocks)
+
+        self.assertBlobIs(self.payload)
+        self.assertEqual(self.client.calls['put_block'], 2)
+
+    def test_upload_reuploads_blocks_whose_checksum_changed(self):
+        self.given_interrupted_upload()
+
+        changed = b'X' + self.payload[1:]
+        self.transfer.upload('container', 'blob', BytesIO(changed),
+                             blocks=self.blocks)
+
+        self.assertBlobIs(changed)
+        self.assertEqual(self.client.calls['put_block'], 3)
+
+    def test_upload_restarts_when_resumed_blocks_expired(self):
+        self.given_interrupted_upload()
+        self.client.blocks.clear()
+
+        self.transfer.upload('container', 'blob', BytesIO(self.payload),
+                             blocks=self.blocks)
+
+        self.assertBlobIs(self.payload)
+        self.assertEqual(self.client.calls['put_block_list'], 2)
+        self.assertEqual(self.client.calls['put_block'], 5)
+
+    def test_upload_retries_transient_errors(self):
+        self.client.fail('put_block', OSError(), AzureHttpError('busy', 503))
+
+        self.transfer.upload('container', 'blob', BytesIO(self.payload))
+
+        self.assertBlobIs(self.payload)
+        self.assertEqual(self.waits, [1.0, 2.0])
+
+    def test_upload_does_not_retry_client_errors(self):
+        self.client.fail('put_block', AzureHttpError('forbidden', 403))
+
+        with self.assertRaises(AzureHttpError):
+            self.transfer.upload('container', 'blob', BytesIO(self.payload))
+
+        self.assertEqual(self.waits, [])
+
+    def test_download_fetches_ranges(self):
+        self.given_blob()
+        stream = BytesIO()
+
+        self.transfer.download('container', 'blob', stream,
+                               on_block=self.on_block)
+
+        self.assertEqual(stream.getvalue(), self.payload)
+        self.assertEqual(self.client.calls['get_blob_to_bytes'], 3)
+        self.assertEqual(self.transferred, [8, 8, 4])
+        self.assertEqual(len(self.blocks), 3)
+
+    def test_download_resumes_after_last_good_block(self):
+        stream = self.given_interrupted_download()
+
+        self.transfer.download('container', 'blob', stream,
+                               blocks=self.blocks)
+
+        self.assertEqual(stream.getvalue(), self.payload)
+        self.assertEqual(self.client.calls['get_blob_to_bytes'], 2)
+
+    def test_download_refetches_corrupted_blocks(self):
+        stream = self.given_interrupted_download()
+        stream.seek(0)
+        stream.write(b'X')
+
+        self.transfer.download('container', 'blob', stream,
+                               blocks=self.blocks)
+
+        self.assertEqual(stream.getvalue(), self.payload)
+        self.assertEqual(self.client.calls['get_blob_to_bytes'], 3)
+
+    def test_download_of_complete_stream_is_noop(self):
+        self.given_blob()
+        stream = BytesIO()
+        self.transfer.download('container', 'blob', stream,
+                               on_block=self.on_block)
+        self.client.calls.clear()
+
+        self.transfer.download('container', 'blob', stream,
+                               blocks=self.blocks)
+
+        self.assertEqual(stream.getvalue(), self.payload)
+        self.assertEqual(self.client.calls['get_blob_to_bytes'], 0)
+
+    def test_download_rejects_short_reads(self):
+        self.given_blob()
+        get_blob_to_bytes = self.client.get_blob_to_bytes
+
+        # noinspection PyUnusedLocal
+        def short_read(container, blob_name, start_range, end_range,
+                       **kwargs):
+            return get_blob_to_bytes(container, blob_name, start_range,
+                                     start_range + 2)
+
+        self.client.get_blob_to_bytes = short_read
+
+        with self.assertRaises(AzureException):
+            self.create_transfer(retries=0).download(
+                'container', 'blob', BytesIO())
+
+    def test_download_missing_blob(self):
+        with self.assertRaises(AzureMissingResourceHttpError):
+            self.transfer.download('container', 'blob', BytesIO())
+
+        self.assertEqual(self.waits, [])
+
+    def test_download_stops_between_blocks(self):
+        self.given_blob()
+        stream = BytesIO()
+
+        with self.assertRaises(TransferStopped):
+            self.transfer.download('container', 'blob', stream,
+                                   on_block=self.on_block,
+                                   stopped=lambda: bool(self.blocks))
+
+        self.assertEqual(stream.getvalue(), self.payload[:8])
+        self.assertEqual(self.client.calls['get_blob_to_bytes'], 1)
+
+        self.transfer.download('container', 'blob', stream,
+                               blocks=self.blocks)
+
+        self.assertEqual(stream.getvalue(), self.payload)
+        self.assertEqual(self.client.calls['get_blob_to_bytes'], 3)
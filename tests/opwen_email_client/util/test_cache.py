@@ -0,0 +1,45 @@
+from unittest import TestCase
+
+from opwen_email_client.util.cache import LruCache
+
+
+class LruCacheTests(TestCase):
+    def setUp(self):
+        self.now = 0
+        self.cache = LruCache(maxsize=2, ttl=10, clock=lambda: self.now)
+
+    def test_get_returns_stored_value(self):
+        self.cache.set('foo', 1)
+
+        self.assertEqual(self.cache.get('foo'), 1)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_get_misses_unknown_key(self):
+        self.assertIs(self.cache.get('foo'), LruCache.missing)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_entries_expire(self):
+        self.cache.set('foo', 1)
+        self.now = 10
+
+        self.assertIs(self.cache.get('foo'), LruCache.missing)
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.set('foo', 1)
+        self.cache.set('bar', 2)
+        self.cache.get('foo')
+        self.cache.set('baz', 3)
+
+        self.assertEqual(self.cache.get('foo'), 1)
+        self.assertIs(self.cache.get('bar'), LruCache.missing)
+        self.assertEqual(self.cache.get('baz'), 3)
+
+    def test_invalidate_removes_tagged_entries(self):
+        self.cache.set('foo', 1, tags=['a'])
+        self.cache.set('bar', 2, tags=['b'])
+
+        self.cache.invalidate(['a'])
+
+        self.assertIs(self.cache.get('foo'), LruCache.missing)
+        self.assertEqual(self.cache.get('bar'), 2)
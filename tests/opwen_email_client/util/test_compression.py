@@ -0,0 +1,71 @@
+from abc import ABCMeta
+from abc import abstractmethod
+from io import BytesIO
+from unittest import TestCase
+
+from opwen_email_client.util.compression import Bz2Codec
+from opwen_email_client.util.compression import Codec
+from opwen_email_client.util.compression import GzipCodec
+from opwen_email_client.util.compression import LzmaCodec
+from opwen_email_client.util.compression import detect_codec
+from opwen_email_client.util.compression import measure
+
+
+class Base(object):
+    class CodecTests(TestCase, metaclass=ABCMeta):
+        payload = b'{"subject":"hello"}\n' * 100
+
+        @abstractmethod
+        def create_codec(self) -> Codec:
+            raise NotImplementedError
+
+        def setUp(self):
+            self.codec = self.create_codec()
+
+        def given_compressed(self) -> BytesIO:
+            buffer = BytesIO()
+            with self.codec.open(buffer, 'wb') as fobj:
+                fobj.write(self.payload)
+            buffer.seek(0)
+            return buffer
+
+        def test_roundtrip(self):
+            buffer = self.given_compressed()
+
+            with self.codec.open(buffer) as fobj:
+                self.assertEqual(fobj.read(), self.payload)
+
+        def test_detect_codec(self):
+            buffer = self.given_compressed()
+
+            codec = detect_codec(buffer, [GzipCodec(), Bz2Codec(), LzmaCodec()])
+
+            self.assertEqual(codec.name, self.codec.name)
+            self.assertEqual(buffer.tell(), 0)
+
+        def test_measure(self):
+            result = measure(self.codec, self.payload)
+
+            self.assertGreater(result['ratio'], 1)
+            self.assertLess(result['size'], len(self.payload))
+
+
+class GzipCodecTests(Base.CodecTests):
+    def create_codec(self):
+        return GzipCodec(level=1)
+
+
+class Bz2CodecTests(Base.CodecTests):
+    def create_codec(self):
+        return Bz2Codec()
+
+
+class LzmaCodecTests(Base.CodecTests):
+    def create_codec(self):
+        return LzmaCodec()
+
+
+class DetectCodecTests(TestCase):
+    def test_rejects_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            detect_codec(BytesIO(b'{"foo":1}'), [GzipCodec(), Bz2Codec()])
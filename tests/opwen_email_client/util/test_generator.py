@@ -1,9 +1,82 @@
+from threading import Event
+from threading import current_thread
 from unittest import TestCase
 
+from opwen_email_client.util.generator import chunks
 from opwen_email_client.util.generator import length
+from opwen_email_client.util.generator import prefetch
 
 
 class LengthTests(TestCase):
     def test_length(self):
         self.assertEqual(10, length(range(10)))
         self.assertEqual(4, length('abcd'))
+
+
+class ChunksTests(TestCase):
+    def test_chunks(self):
+        self.assertEqual([[0, 1], [2, 3], [4]], list(chunks(range(5), 2)))
+        self.assertEqual([], list(chunks([], 2)))
+
+
+class PrefetchTests(TestCase):
+    def test_prefetch(self):
+        self.assertEqual(list(range(10)), list(prefetch(range(10), 2)))
+        self.assertEqual([], list(prefetch([], 2)))
+
+    def test_prefetch_runs_producer_in_background(self):
+        threads = []
+
+        def produce():
+            for i in range(3):
+                threads.append(current_thread())
+                yield i
+
+        list(prefetch(produce(), 2))
+
+        self.assertNotIn(current_thread(), threads)
+
+    def test_prefetch_is_bounded(self):
+        produced = []
+        blocked = Event()
+
+        def produce():
+            for i in range(10):
+                produced.append(i)
+                if len(produced) == 3:
+                    blocked.set()
+                yield i
+
+        prefetched = prefetch(produce(), 2)
+        self.assertEqual(next(prefetched), 0)
+        blocked.wait(5)
+        prefetched.close()
+
+        self.assertLessEqual(len(produced), 5)
+
+    def test_prefetch_raises_producer_errors(self):
+        def produce():
+            yield 1
+            raise ValueError('injected error')
+
+        prefetched = prefetch(produce(), 2)
+
+        self.assertEqual(next(prefetched), 1)
+        with self.assertRaises(ValueError):
+            next(prefetched)
+
+    def test_prefetch_closes_source_when_consumer_stops(self):
+        closed = Event()
+
+        def produce():
+            try:
+                while True:
+                    yield 1
+            finally:
+                closed.set()
+
+        prefetched = prefetch(produce(), 2)
+        next(prefetched)
+        prefetched.close()
+
+        self.assertTrue(closed.is_set())
@@ -1,8 +1,12 @@
 from os import environ
+from os.path import join
+from tempfile import TemporaryDirectory
 from typing import Iterable
 from unittest import TestCase
 
+from opwen_email_client.util.os import file_lock
 from opwen_email_client.util.os import getenv
+from opwen_email_client.util.os import replace_file
 from opwen_email_client.util.os import subdirectories
 
 
@@ -11,6 +15,36 @@ class SubdirectoriesTests(TestCase):
         self.assertEqual(len(list(subdirectories('/does-not-exist'))), 0)
 
 
+class FileLockTests(TestCase):
+    def test_lock_is_exclusive_until_released(self):
+        with TemporaryDirectory() as root:
+            path = join(root, 'locks', 'lock')
+
+            with file_lock(path) as first:
+                with file_lock(path) as second:
+                    pass
+            with file_lock(path) as third:
+                pass
+
+        self.assertTrue(first)
+        self.assertFalse(second)
+        self.assertTrue(third)
+
+
+class ReplaceFileTests(TestCase):
+    def test_creates_and_replaces_file(self):
+        with TemporaryDirectory() as root:
+            path = join(root, 'state', 'file')
+
+            replace_file(path, b'first')
+            replace_file(path, b'second')
+
+            with open(path, 'rb') as fobj:
+                content = fobj.read()
+
+        self.assertEqual(content, b'second')
+
+
 class GetenvTests(TestCase):
     def setUp(self):
         self.envs = set()
@@ -1,6 +1,8 @@
 from unittest import TestCase
 
 from opwen_email_client.util.pagination import Pagination
+from opwen_email_client.util.pagination import decode_cursor
+from opwen_email_client.util.pagination import encode_cursor
 
 
 class PaginationTests(TestCase):
@@ -31,3 +33,35 @@ class PaginationTests(TestCase):
     def test_iter_last(self):
         pagination = Pagination([1, 2, 3], page=2, page_size=2)
         self.assertEqual(list(pagination), [3])
+
+    def test_iter_sliced(self):
+        pagination = Pagination([3], page=2, page_size=2, sliced=True)
+        self.assertEqual(list(pagination), [3])
+        self.assertTrue(pagination.has_prevpage)
+        self.assertFalse(pagination.has_nextpage)
+
+    def test_cursors(self):
+        pagination = Pagination([3, 4], page=2, page_size=2, sliced=True,
+                                prev_cursor='prev', next_cursor='next')
+        self.assertEqual(pagination.prev_cursor, 'prev')
+        self.assertEqual(pagination.next_cursor, 'next')
+
+    def test_cursors_hidden_without_adjacent_page(self):
+        pagination = Pagination([1], page=1, page_size=2, sliced=True,
+                                prev_cursor='prev', next_cursor='next')
+        self.assertIsNone(pagination.prev_cursor)
+        self.assertIsNone(pagination.next_cursor)
+
+
+class CursorTests(TestCase):
+    def test_cursor_roundtrip(self):
+        cursor = encode_cursor('after', '2017-01-01 10:00', 123)
+        self.assertEqual(decode_cursor(cursor), ['after', '2017-01-01 10:00', 123])
+
+    def test_decode_missing_cursor(self):
+        self.assertIsNone(decode_cursor(None))
+        self.assertIsNone(decode_cursor(''))
+
+    def test_decode_invalid_cursor(self):
+        self.assertIsNone(decode_cursor('not a cursor'))
+        self.assertIsNone(decode_cursor(encode_cursor()[:-1] + '!'))
@@ -0,0 +1,76 @@
+from unittest import TestCase
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from opwen_email_client.util.sqlalchemy import QueryProfiler
+from opwen_email_client.util.sqlalchemy import session
+
+
+class QueryProfilerTests(TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+
+    def test_records_statements_between_start_and_stop(self):
+        profiler = QueryProfiler(enabled=True, slowest=2)
+        profiler.attach(self.engine)
+
+        profiler.start()
+        for _ in range(3):
+            self.engine.execute('SELECT 1')
+        profile = profiler.stop()
+
+        self.assertEqual(profile['count'], 3)
+        self.assertGreaterEqual(profile['seconds'], 0)
+        self.assertEqual(len(profile['slowest']), 2)
+        self.assertEqual(profile['slowest'][0]['statement'], 'SELECT 1')
+
+    def test_ignores_statements_outside_of_profile(self):
+        profiler = QueryProfiler(enabled=True)
+        profiler.attach(self.engine)
+
+        self.engine.execute('SELECT 1')
+
+        self.assertIsNone(profiler.stop())
+
+    def test_failed_statements_do_not_leak_start_times(self):
+        profiler = QueryProfiler(enabled=True)
+        profiler.attach(self.engine)
+
+        profiler.start()
+        with self.engine.connect() as connection:
+            for _ in range(3):
+                with self.assertRaises(OperationalError):
+                    connection.execute('SELECT * FROM unknown')
+            connection.execute('SELECT 1')
+
+            self.assertEqual(profiler._started(connection), {})
+        profile = profiler.stop()
+
+        self.assertEqual(profile['count'], 1)
+        self.assertEqual(profile['slowest'][0]['statement'], 'SELECT 1')
+
+    def test_does_not_record_when_disabled(self):
+        profiler = QueryProfiler(enabled=False)
+        profiler.attach(self.engine)
+
+        profiler.start()
+        self.engine.execute('SELECT 1')
+        profile = profiler.stop()
+
+        self.assertEqual(profile['count'], 0)
+
+
+class SessionTests(TestCase):
+    def setUp(self):
+        self.session_maker = sessionmaker(bind=create_engine('sqlite://'))
+
+    def test_write_errors_are_raised(self):
+        with self.assertRaises(OperationalError):
+            with session(self.session_maker, commit=True) as db:
+                db.execute('SELECT * FROM unknown')
+
+    def test_read_errors_are_ignored(self):
+        with session(self.session_maker) as db:
+            db.execute('SELECT * FROM unknown')
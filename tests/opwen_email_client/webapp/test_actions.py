@@ -0,0 +1,130 @@
+from tempfile import TemporaryDirectory
+from threading import Event
+from unittest import TestCase
+from unittest.mock import Mock
+
+from opwen_email_client.domain.email.lesson import FileSystemLessonStore
+from opwen_email_client.webapp.actions import SyncEmails
+from opwen_email_client.webapp.worker import SyncStatus
+from tests.opwen_email_client.domain.email.test_lesson import \
+    given_encrypted_lesson
+
+
+class SyncEmailsTests(TestCase):
+    def setUp(self):
+        self.email_store_mock = Mock()
+        self.email_sync_mock = Mock()
+        self.lesson_store_mock = Mock()
+        self.status = SyncStatus()
+
+        self.email_store_mock.create.side_effect = len
+        self.lesson_store_mock.extract_all.side_effect = iter
+
+    def create_action(self, pipeline_depth: int) -> SyncEmails:
+        return SyncEmails(
+            email_store=self.email_store_mock,
+            email_sync=self.email_sync_mock,
+            lesson_store=self.lesson_store_mock,
+            batch_size=2,
+            status=self.status,
+            pipeline_depth=pipeline_depth)
+
+    def given_download(self, emails):
+        self.email_sync_mock.download.side_effect = lambda: iter(emails)
+
+    def assertIngested(self, emails):
+        created = [email
+                   for call in self.email_store_mock.create.call_args_list
+                   for email in call[0][0]]
+        checkpointed = [call[0][0] for call
+                        in self.email_sync_mock.checkpoint.call_args_list]
+
+        self.assertEqual(created, emails)
+        self.assertEqual(checkpointed, [2, 2, 1])
+        self.assertEqual(self.status.as_dict()['emails_downloaded'],
+                         len(emails))
+        self.assertGreater(self.status.as_dict()['emails_per_second'], 0)
+
+    def test_sync(self):
+        emails = [{'_uid': str(i)} for i in range(5)]
+        self.given_download(emails)
+
+        self.create_action(pipeline_depth=0)()
+
+        self.assertIngested(emails)
+        self.assertTrue(self.email_sync_mock.upload.called)
+
+    def test_pipelined_sync(self):
+        emails = [{'_uid': str(i)} for i in range(5)]
+        self.given_download(emails)
+
+        self.create_action(pipeline_depth=2)()
+
+        self.assertIngested(emails)
+        self.assertTrue(self.email_sync_mock.upload.called)
+
+    def test_pipelined_sync_overlaps_upload_and_download(self):
+        downloading = Event()
+
+        def upload(items, on_uploaded):
+            self.assertTrue(downloading.wait(5))
+            on_uploaded(['1'])
+
+        def download():
+            downloading.set()
+            yield {'_uid': '2'}
+
+        self.email_sync_mock.upload.side_effect = upload
+        self.email_sync_mock.download.side_effect = download
+
+        self.create_action(pipeline_depth=2)()
+
+        self.email_store_mock.mark_sent.assert_called_once_with(['1'])
+        self.assertEqual(self.status.as_dict()['emails_uploaded'], 1)
+
+    def test_pipelined_sync_raises_upload_errors(self):
+        self.given_download([])
+        self.email_sync_mock.upload.side_effect = IOError('injected error')
+
+        with self.assertRaises(IOError):
+            self.create_action(pipeline_depth=2)()
+
+    def test_pipelined_sync_reports_both_errors(self):
+        self.email_sync_mock.upload.side_effect = IOError('upload')
+        self.email_sync_mock.download.side_effect = ValueError('download')
+
+        with self.assertRaises(ValueError) as error:
+            self.create_action(pipeline_depth=2)()
+
+        self.assertIsInstance(error.exception.__cause__, IOError)
+
+    def test_failed_batches_are_not_checkpointed(self):
+        self.given_download([{'_uid': str(i)} for i in range(5)])
+        self.email_store_mock.create.side_effect = [2, IOError('locked')]
+
+        with self.assertRaises(IOError):
+            self.create_action(pipeline_depth=0)()
+
+        self.email_sync_mock.checkpoint.assert_called_once_with(2)
+        self.assertEqual(self.status.as_dict()['emails_downloaded'], 2)
+
+    def test_bad_lessons_do_not_stop_the_sync(self):
+        emails = [
+            {'_uid': '1', 'attachments': [
+                {'filename': 'foo.lesson', 'content': given_encrypted_lesson()},
+                {'filename': None, 'content': b'foo'}]},
+            {'_uid': '2', 'attachments': [
+                {'filename': 'bar.lesson', 'content': b'not a zip file'}]},
+            {'_uid': '3'},
+        ]
+        self.given_download(emails)
+
+        with TemporaryDirectory() as root:
+            self.lesson_store_mock = FileSystemLessonStore(root)
+            with self.assertLogs('opwen_email_client.domain.email.lesson'):
+                self.create_action(pipeline_depth=0)()
+
+        self.assertEqual(self.status.as_dict()['emails_downloaded'], 3)
+        self.assertEqual(
+            [call[0][0] for call
+             in self.email_sync_mock.checkpoint.call_args_list], [2, 1])
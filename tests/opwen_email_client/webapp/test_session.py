@@ -0,0 +1,35 @@
+from unittest.mock import MagicMock
+
+from opwen_email_client.webapp.session import AttachmentsStore
+from tests.opwen_email_client.webapp.base import Base
+
+
+class AttachmentsStoreTests(Base.AppTests):
+    def setUp(self):
+        self.email_store = MagicMock()
+        self.email_store.attachment.return_value = {
+            'filename': 'foo.txt', 'hash': 'abc', 'size': 3,
+            'sent_at': '2017-01-01 10:00'}
+        self.attachments_store = AttachmentsStore(self.email_store)
+
+    def test_lookup_resolves_signed_handle(self):
+        emails = [{'_uid': 'email-1',
+                   'attachments': [{'filename': 'foo.txt', 'hash': 'abc'}]}]
+
+        with self.app.test_request_context():
+            self.attachments_store.store(emails)
+            attachment = self.attachments_store.lookup(
+                'foo@bar.com', emails[0]['attachments'][0]['id'])
+
+        self.email_store.attachment.assert_called_once_with(
+            'foo@bar.com', 'email-1', 'abc')
+        self.assertEqual(attachment.name, 'foo.txt')
+        self.assertEqual(attachment.size, 3)
+
+    def test_lookup_rejects_tampered_handle(self):
+        with self.app.test_request_context():
+            attachment = self.attachments_store.lookup('foo@bar.com',
+                                                       'email-1.abc')
+
+        self.assertIsNone(attachment)
+        self.assertFalse(self.email_store.attachment.called)
@@ -1,3 +1,9 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from opwen_email_client.webapp import app
+from opwen_email_client.webapp.session import AttachmentsStore
 from tests.opwen_email_client.webapp.base import Base
 
 
@@ -5,3 +11,104 @@ class ViewTests(Base.AppTests):
     def test_app_starts(self):
         response = self.client.get('/')
         self.assertTrue(response)
+
+
+class DownloadAttachmentTests(TestCase):
+    content = b'0123456789'
+
+    def setUp(self):
+        self.email_store = MagicMock()
+        self.email_store.attachment.return_value = {
+            'filename': 'foo.txt', 'hash': 'abc', 'size': len(self.content),
+            'sent_at': '2017-01-01 10:00'}
+        self.email_store.attachment_content.side_effect = self.read
+
+        patches = [
+            patch.object(app.ioc, 'attachments_session',
+                         AttachmentsStore(self.email_store)),
+            patch.object(app.login_manager, '_login_disabled', True),
+            patch('opwen_email_client.webapp.views.current_user',
+                  MagicMock(email='foo@bar.com')),
+            patch.dict(app.config, {'SECRET_KEY': 'NoSecret'}),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.client = app.test_client()
+
+        emails = [{'_uid': 'email-1', 'attachments': [{'hash': 'abc'}]}]
+        with app.test_request_context():
+            app.ioc.attachments_session.store(emails)
+        self.url = '/attachment/{}'.format(emails[0]['attachments'][0]['id'])
+
+    def read(self, attachment_hash, start, stop):
+        yield self.content[start:stop]
+
+    def test_full_download(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, self.content)
+        self.assertEqual(response.headers['ETag'], '"abc"')
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+        self.email_store.attachment.assert_called_once_with(
+            'foo@bar.com', 'email-1', 'abc')
+
+    def test_range(self):
+        response = self.client.get(self.url, headers={'Range': 'bytes=2-5'})
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, b'2345')
+        self.assertEqual(response.headers['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(response.headers['Content-Length'], '4')
+
+    def test_open_ended_range(self):
+        response = self.client.get(self.url, headers={'Range': 'bytes=3-'})
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, b'3456789')
+        self.assertEqual(response.headers['Content-Range'], 'bytes 3-9/10')
+
+    def test_suffix_range(self):
+        response = self.client.get(self.url, headers={'Range': 'bytes=-4'})
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, b'6789')
+        self.assertEqual(response.headers['Content-Range'], 'bytes 6-9/10')
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url,
+                                   headers={'Range': 'bytes=100-200'})
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response.headers['Content-Range'], 'bytes */10')
+        self.assertFalse(self.email_store.attachment_content.called)
+
+    def test_stale_if_range_returns_full_content(self):
+        response = self.client.get(self.url, headers={'Range': 'bytes=2-5',
+                                                      'If-Range': '"old"'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, self.content)
+
+    def test_matching_if_range_returns_partial_content(self):
+        response = self.client.get(self.url, headers={'Range': 'bytes=2-5',
+                                                      'If-Range': '"abc"'})
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, b'2345')
+
+    def test_matching_etag_is_not_modified(self):
+        response = self.client.get(self.url,
+                                   headers={'If-None-Match': '"abc"'})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertFalse(self.email_store.attachment_content.called)
+
+    def test_unknown_attachment(self):
+        response = self.client.get('/attachment/tampered')
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(self.email_store.attachment_content.called)
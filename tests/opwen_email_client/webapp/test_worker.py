@@ -0,0 +1,119 @@
+from os.path import join
+from tempfile import TemporaryDirectory
+from threading import Event
+from threading import Thread
+from unittest import TestCase
+
+from opwen_email_client.util.os import file_lock
+from opwen_email_client.webapp.worker import SyncStatus
+from opwen_email_client.webapp.worker import SyncWorker
+
+
+class SyncWorkerTests(TestCase):
+    def setUp(self):
+        self.status = SyncStatus()
+
+    def test_run_once(self):
+        def sync():
+            self.status.update(phase=SyncStatus.downloading)
+            self.status.increment('emails_downloaded', 3)
+
+        SyncWorker(sync, self.status).run_once()
+
+        status = self.status.as_dict()
+        self.assertEqual(status['phase'], SyncStatus.idle)
+        self.assertEqual(status['emails_downloaded'], 3)
+        self.assertIsNotNone(status['finished_at'])
+        self.assertIsNone(status['last_error'])
+
+    def test_run_once_records_error(self):
+        def sync():
+            raise ValueError('injected error')
+
+        SyncWorker(sync, self.status).run_once()
+
+        status = self.status.as_dict()
+        self.assertEqual(status['phase'], SyncStatus.idle)
+        self.assertEqual(status['last_error'], 'ValueError: injected error')
+
+    def test_run_once_skips_when_another_process_is_syncing(self):
+        synced = []
+
+        def sync():
+            synced.append(True)
+
+        with TemporaryDirectory() as root:
+            lock_path = join(root, 'sync', 'sync.lock')
+            worker = SyncWorker(sync, self.status, lock_path=lock_path)
+
+            with file_lock(lock_path):
+                worker.run_once()
+            worker.run_once()
+
+        self.assertEqual(synced, [True])
+
+    def test_queued_sync_waits_for_another_process(self):
+        synced = []
+
+        def sync():
+            synced.append(True)
+
+        with TemporaryDirectory() as root:
+            lock_path = join(root, 'sync', 'sync.lock')
+            worker = SyncWorker(sync, self.status, lock_path=lock_path,
+                                poll_seconds=0.01)
+            self.status.update(queued=True)
+
+            with file_lock(lock_path):
+                thread = Thread(target=worker.run_once)
+                thread.start()
+                thread.join(0.1)
+                self.assertEqual(synced, [])
+            thread.join(5)
+
+        self.assertEqual(synced, [True])
+        self.assertFalse(self.status.as_dict()['queued'])
+
+    def test_enqueue_runs_in_background(self):
+        started, release, finished = Event(), Event(), Event()
+
+        def sync():
+            started.set()
+            release.wait(5)
+            finished.set()
+
+        worker = SyncWorker(sync, self.status)
+
+        self.assertTrue(worker.enqueue())
+        self.assertTrue(started.wait(5))
+        self.assertTrue(worker.enqueue())
+        self.assertFalse(worker.enqueue())
+        self.assertTrue(self.status.as_dict()['queued'])
+
+        release.set()
+        self.assertTrue(finished.wait(5))
+
+
+class SyncStatusTests(TestCase):
+    def test_status_is_shared_through_file(self):
+        with TemporaryDirectory() as root:
+            path = join(root, 'sync', 'sync.status.json')
+            status, other_status = SyncStatus(path), SyncStatus(path)
+
+            status.update(phase=SyncStatus.downloading, queued=True)
+            other_status.increment('emails_downloaded', 3)
+            other_status.add_bytes(10)
+
+            self.assertEqual(SyncStatus(path).as_dict(), status.as_dict())
+            self.assertEqual(status.as_dict()['phase'],
+                             SyncStatus.downloading)
+            self.assertTrue(status.as_dict()['queued'])
+            self.assertEqual(status.as_dict()['emails_downloaded'], 3)
+            self.assertEqual(status.as_dict()['bytes_transferred'], 10)
+
+    def test_missing_file_reports_idle(self):
+        with TemporaryDirectory() as root:
+            status = SyncStatus(join(root, 'sync.status.json'))
+
+            self.assertEqual(status.as_dict()['phase'], SyncStatus.idle)
+            self.assertFalse(status.as_dict()['queued'])